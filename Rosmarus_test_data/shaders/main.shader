@@ -8,16 +8,28 @@ shaders:
         layout (location = 2) in vec2 in_UV;
         layout (location = 3) in vec4 in_Color;
 
+        #ifdef INSTANCED
+        layout (location = 4) in mat4 in_InstanceModel;
+        #define ModelMatrix in_InstanceModel
+        #else
         uniform mat4 ModelMatrix;
-        uniform mat4 ViewMatrix;
-        uniform mat4 ProjectionMatrix;
+        #endif
+
+        layout (std140) uniform Camera
+        {
+            mat4 ViewMatrix;
+            mat4 ProjectionMatrix;
+        };
+
+        // set for textures stored top row first, like those loaded from images
+        uniform bool FlipV;
 
         out vec2 TexCoords;
 
         void main()
         {
             gl_Position = ProjectionMatrix * ViewMatrix * ModelMatrix * vec4(in_Pos, 1.0);
-            TexCoords = in_UV;
+            TexCoords = FlipV ? vec2(in_UV.x, 1.0 - in_UV.y) : in_UV;
         }
     fragment: |
         #version 330 core
@@ -32,3 +44,6 @@ shaders:
         {
             out_FragColor = texture(MainTex, TexCoords);
         }
+variants:
+    instanced:
+        INSTANCED: 1
@@ -0,0 +1,70 @@
+"""Run the benchmark suite.
+
+Usage:
+    python -m benchmarks [-k PATTERN] [--json OUT] [--baseline BASELINE]
+"""
+import argparse
+import json
+import sys
+
+from . import harness
+from . import bench_cpu, bench_gl  # noqa: F401, registers the benchmarks
+
+DEFAULT_DATA_PATH = "Rosmarus_test_data"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("-k",
+                        dest="patterns",
+                        action="append",
+                        help="only run benchmarks matching this glob or group")
+    parser.add_argument("--json", help="write results to this JSON file")
+    parser.add_argument("--baseline",
+                        help="compare results against this JSON file")
+    parser.add_argument("--save-baseline",
+                        help="write results to this file as a new baseline")
+    parser.add_argument("--threshold",
+                        type=float,
+                        default=harness.DEFAULT_THRESHOLD,
+                        help="fractional slowdown counted as a regression")
+    parser.add_argument("--repeats", type=int, default=harness.DEFAULT_REPEATS)
+    parser.add_argument("--min-time",
+                        type=float,
+                        default=harness.DEFAULT_MIN_TIME,
+                        help="minimum seconds per repeat")
+    parser.add_argument("--data-path", default=DEFAULT_DATA_PATH)
+    parser.add_argument("--list", action="store_true")
+    args = parser.parse_args()
+
+    benchmarks = harness.get_benchmarks(args.patterns)
+    if args.list:
+        for bench in benchmarks:
+            print(f"{bench.group:<4} {bench.name}")
+        return 0
+
+    results = harness.run(benchmarks,
+                          args.data_path,
+                          repeats=args.repeats,
+                          min_time=args.min_time)
+    output = harness.to_json(results)
+
+    for out_path in (args.json, args.save_baseline):
+        if out_path:
+            with open(out_path, "w") as out_file:
+                json.dump(output, out_file, indent=2)
+
+    baseline = {"results": {}}
+    if args.baseline:
+        with open(args.baseline, "r") as baseline_file:
+            baseline = json.load(baseline_file)
+    regressions = harness.compare(output, baseline, args.threshold)
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
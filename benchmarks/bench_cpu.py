@@ -0,0 +1,154 @@
+"""CPU-bound microbenchmarks.
+
+Some of these need a GL context to construct their objects (a SpriteBatch
+owns a Mesh, for example), but only CPU-side work is timed: nothing here
+flushes to the GPU.
+"""
+from os import path
+import tempfile
+
+import glm
+
+from .harness import benchmark
+
+SPRITE_COUNTS = [100, 1000, 10000]
+TILEMAP_SIZES = [16, 64]
+IMAGE_SIZES = [256, 1024, 4096]
+
+
+@benchmark("transform.matrix")
+def bench_transform_matrix(env):
+    from rosmarus.math.transform import Transform
+
+    transform = Transform()
+    position = glm.vec3(1, 2, 3)
+    orientation = glm.quat(glm.vec3(0.1, 0.2, 0.3))
+
+    def run():
+        transform.set_position(position)
+        transform.set_orientation(orientation)
+        transform.matrix()
+
+    return run
+
+
+@benchmark("transform2d.matrix")
+def bench_transform2d_matrix(env):
+    from rosmarus.math.transform import Transform2D
+
+    transform = Transform2D()
+    position = glm.vec2(1, 2)
+
+    def run():
+        transform.set_position(position)
+        transform.set_orientation(0.5)
+        transform.matrix()
+
+    return run
+
+
+@benchmark("yaml.load")
+def bench_load_yaml(env):
+    from rosmarus.io.yaml_handler import load_yaml
+
+    file_path = path.join(env.data_path, "logging_config.yml")
+    return lambda: load_yaml(file_path)
+
+
+@benchmark("texture.decode")
+def bench_texture_decode(env):
+    from rosmarus.io.texture_handler import decode_texture
+
+    file_path = path.join(env.data_path, "textures", "pokemon.png")
+    return lambda: decode_texture(file_path)
+
+
+@benchmark("texture.decode_size", params=IMAGE_SIZES)
+def bench_texture_decode_size(env, size):
+    from PIL import Image
+    from rosmarus.io.texture_handler import decode_texture
+
+    # noise doesn't compress well, so this is close to a worst case for
+    # inflating the PNG
+    temp_dir = env.stack.enter_context(tempfile.TemporaryDirectory())
+    file_path = path.join(temp_dir, f"noise_{size}.png")
+    Image.effect_noise((size, size), 64).convert("RGBA").save(file_path)
+    return lambda: decode_texture(file_path)
+
+
+@benchmark("spritebatch.draw", params=SPRITE_COUNTS, needs_context=True)
+def bench_spritebatch_draw(env, sprite_count):
+    from rosmarus.graphics.camera import Camera
+    from rosmarus.graphics.texture import Texture2D
+    from rosmarus.render.spritebatch import SpriteBatch
+
+    texture = Texture2D(64, 64, mipmap=False)
+    batch = SpriteBatch(Camera(glm.ortho(0, 640, 0, 480, 0.01, 100)),
+                        size=sprite_count)
+
+    def run():
+        for i in range(sprite_count):
+            batch.draw(texture, x_pos=i % 640, y_pos=i % 480, width=16,
+                       height=16)
+        # throw away what we generated instead of flushing it
+        batch.vertices_drawn = 0
+        batch.indices_drawn = 0
+
+    return run
+
+
+@benchmark("tilemap.draw", params=TILEMAP_SIZES, needs_context=True)
+def bench_tilemap_draw(env, size):
+    from rosmarus.graphics.camera import Camera
+    from rosmarus.graphics.texture import Texture2D
+    from rosmarus.render.spritebatch import SpriteBatch
+    from rosmarus.render.spritesheet import SpriteSheet
+    from rosmarus.render.tiles import TileMap, Tile
+
+    sheet = SpriteSheet(Texture2D(256, 256, mipmap=False), 16, 16)
+    tilemap = TileMap(sheet, size, size, size, size)
+    tilemap.fill(Tile(7))
+    camera = Camera(glm.ortho(0, 640, 0, 480, 0.01, 100))
+    camera.transform.set_position(glm.vec3(0, (size - 1) * 16, 1))
+    batch = SpriteBatch(camera, size=size * size)
+
+    def run():
+        tilemap.draw(batch)
+        batch.vertices_drawn = 0
+        batch.indices_drawn = 0
+
+    return run
+
+
+@benchmark("audio.stream_decode")
+def bench_audio_stream_decode(env):
+    import ctypes as ct
+    from pyogg import VorbisFileStream, vorbis
+    from rosmarus.audio import DEFAULT_STREAM_BUFFER_SIZE, _OV_HOLE
+
+    # decode one AudioStream block at a time straight into a preallocated
+    # buffer, like AudioStream does, but without handing it to OpenAL
+    stream = VorbisFileStream(
+        path.join(env.data_path, "audio", "pulsar-lullaby-loop.ogg"))
+    frame_size = 2 * stream.channels
+    block_size = DEFAULT_STREAM_BUFFER_SIZE * stream.channels // frame_size \
+        * frame_size
+    pcm = (ct.c_char * block_size)()
+    pcm_address = ct.addressof(pcm)
+
+    def run():
+        written = 0
+        while written < block_size:
+            new_bytes = vorbis.ov_read(
+                ct.byref(stream.vf),
+                ct.cast(pcm_address + written, ct.c_char_p),
+                block_size - written, 0, 2, 1, stream.bitstream_pointer)
+            if new_bytes == 0:
+                vorbis.ov_pcm_seek_lap(stream.vf, 0)
+                break
+            if new_bytes < 0 and new_bytes != _OV_HOLE:
+                raise RuntimeError(f"Error {new_bytes} decoding")
+            if new_bytes > 0:
+                written += new_bytes
+
+    return run
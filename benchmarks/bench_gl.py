@@ -0,0 +1,79 @@
+"""End-to-end frame benchmarks, run in a headless GL context."""
+import glm
+from OpenGL import GL
+
+from .harness import benchmark, GL as GL_GROUP
+
+SPRITE_COUNTS = [100, 1000, 10000]
+
+TARGET_WIDTH = 320
+TARGET_HEIGHT = 240
+
+
+@benchmark("frame.sprites",
+           group=GL_GROUP,
+           params=SPRITE_COUNTS,
+           needs_context=True)
+def bench_frame_sprites(env, sprite_count):
+    from rosmarus.graphics.camera import Camera
+    from rosmarus.graphics.texture import Texture2D
+    from rosmarus.graphics.upscale_surface import UpscaleSurface
+    from rosmarus.graphics.viewport import ConstantViewport
+    from rosmarus.render.spritebatch import SpriteBatch
+
+    viewport = ConstantViewport(env.window, TARGET_WIDTH, TARGET_HEIGHT)
+    surface = UpscaleSurface(TARGET_WIDTH, TARGET_HEIGHT, viewport)
+    camera = Camera(glm.ortho(0, TARGET_WIDTH, 0, TARGET_HEIGHT, 0.01, 100))
+    camera.transform.translate(glm.vec3(0, 0, 1))
+    batch = SpriteBatch(camera)
+    texture = Texture2D(16, 16, mipmap=False)
+
+    def render():
+        surface.begin()
+        batch.begin()
+        for i in range(sprite_count):
+            batch.draw(texture,
+                       x_pos=i % TARGET_WIDTH,
+                       y_pos=(i // TARGET_WIDTH) % TARGET_HEIGHT)
+        batch.end()
+        surface.end()
+        surface.render()
+
+    env.app.set_render_callback(render)
+
+    def run():
+        env.app.run_frames(env.window, 1)
+        # make sure we time the GPU work too, not just its submission
+        GL.glFinish()
+
+    return run
+
+
+@benchmark("shader.create",
+           group=GL_GROUP,
+           params=["compile", "binary"],
+           needs_context=True)
+def bench_shader_create(env, mode):
+    import tempfile
+
+    from rosmarus.graphics import shader
+    from rosmarus.render import spritebatch
+
+    # tag the source so it never shares a program with a live SpriteBatch
+    sources = {
+        "vertex": spritebatch._SB_VERTEX_SHADER + f"// {mode}\n",
+        "fragment": spritebatch._SB_FRAGMENT_SHADER
+    }
+    cache_dir = None
+    if mode == "binary":
+        cache_dir = env.stack.enter_context(tempfile.TemporaryDirectory())
+    shader.enable_binary_cache(cache_dir)
+    # the cache is global, so don't leave it pointing at a deleted directory
+    env.stack.callback(shader.enable_binary_cache, None)
+
+    def run():
+        # the last reference is dropped each time, so every iteration
+        # creates the program again, either compiling or from the cache
+        shader.Shader("bench", sources).cleanup()
+
+    return run
@@ -0,0 +1,256 @@
+from __future__ import annotations
+from contextlib import contextmanager, ExitStack
+from dataclasses import dataclass, field, replace
+import fnmatch
+import platform
+import statistics
+import sys
+import time
+import traceback
+from typing import Callable, ContextManager, List, Mapping, Sequence
+
+CPU = "cpu"
+GL = "gl"
+
+DEFAULT_REPEATS = 5
+DEFAULT_MIN_TIME = 0.05
+DEFAULT_THRESHOLD = 0.1
+
+
+@dataclass
+class Benchmark:
+    name: str
+    group: str
+    setup: Callable
+    param: object = None
+    needs_context: bool = False
+
+
+@dataclass
+class BenchEnv:
+    """Handed to every benchmark setup function.
+
+    app and window are only set for benchmarks that need a GL context.
+    Anything entered into or registered with stack (temporary directories,
+    global settings to restore) is torn down once the benchmark finishes.
+    """
+    data_path: str
+    app: object = None
+    window: object = None
+    stack: ExitStack = None
+
+
+@dataclass
+class Result:
+    name: str
+    group: str
+    iterations: int = 0
+    times: List[float] = field(default_factory=list)
+    error: str = None
+
+    def summary(self) -> Mapping[str, object]:
+        if self.error is not None:
+            return {"group": self.group, "error": self.error}
+        return {
+            "group": self.group,
+            "iterations": self.iterations,
+            "repeats": len(self.times),
+            "min": min(self.times),
+            "median": statistics.median(self.times),
+            "mean": statistics.mean(self.times),
+            "stdev":
+            statistics.stdev(self.times) if len(self.times) > 1 else 0
+        }
+
+
+_benchmarks: List[Benchmark] = []
+
+
+def benchmark(name: str,
+              group: str = CPU,
+              params: Sequence = None,
+              needs_context: bool = False) -> Callable:
+    """Register a benchmark.
+
+    The decorated function is a setup function, it's called once with a
+    BenchEnv (and a parameter, if params is given) and must return a
+    zero-argument callable. Only that callable is timed.
+
+    Args:
+        name (str): The name of the benchmark, params are appended to it.
+        group (str): The group of the benchmark, 'cpu' or 'gl'.
+        params (Sequence): If given, the benchmark is registered once per
+            param.
+        needs_context (bool): Whether the benchmark needs a GL/AL context.
+    """
+    def decorator(setup: Callable) -> Callable:
+        if params is None:
+            _register(Benchmark(name, group, setup, None, needs_context))
+        else:
+            for param in params:
+                _register(
+                    Benchmark(f"{name}[{param}]", group, setup, param,
+                              needs_context))
+        return setup
+
+    return decorator
+
+
+def get_benchmarks(patterns: Sequence[str] = None) -> List[Benchmark]:
+    if not patterns:
+        return list(_benchmarks)
+    return [
+        bench for bench in _benchmarks if any(
+            fnmatch.fnmatch(bench.name, pattern) or bench.group == pattern
+            for pattern in patterns)
+    ]
+
+
+def run(benchmarks: Sequence[Benchmark],
+        data_path: str,
+        repeats: int = DEFAULT_REPEATS,
+        min_time: float = DEFAULT_MIN_TIME) -> List[Result]:
+    results = []
+    cpu_only = [bench for bench in benchmarks if not bench.needs_context]
+    with_context = [bench for bench in benchmarks if bench.needs_context]
+
+    env = BenchEnv(data_path)
+    for bench in cpu_only:
+        results.append(_run_one(bench, env, repeats, min_time))
+
+    if with_context:
+        try:
+            with _headless_env(data_path) as env:
+                for bench in with_context:
+                    results.append(_run_one(bench, env, repeats, min_time))
+        except Exception as err:
+            # the context couldn't be created, record why for every
+            # benchmark that needed it rather than bailing out entirely
+            done = {result.name for result in results}
+            for bench in with_context:
+                if bench.name not in done:
+                    results.append(
+                        Result(bench.name,
+                               bench.group,
+                               error=f"no context: {err}"))
+
+    return results
+
+
+def to_json(results: Sequence[Result]) -> Mapping[str, object]:
+    return {
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "processor": platform.processor()
+        },
+        "created": time.time(),
+        "results": {result.name: result.summary()
+                    for result in results}
+    }
+
+
+def compare(current: Mapping[str, object],
+            baseline: Mapping[str, object],
+            threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """Print a comparison of two benchmark runs and return regressions.
+
+    Args:
+        current (Mapping): The JSON output of the current run.
+        baseline (Mapping): The JSON output of the baseline run.
+        threshold (float): How much slower (as a fraction) the median can get
+            before it is counted as a regression.
+    """
+    regressions = []
+    print(f"{'benchmark':<48} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if "error" in result:
+            print(f"{name:<48} {'':>12} {'error':>12}")
+            continue
+        if base is None or "error" in base:
+            print(f"{name:<48} {'-':>12} {_fmt(result['median']):>12}")
+            continue
+
+        ratio = result["median"] / base["median"]
+        change = (ratio - 1) * 100
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = " REGRESSION"
+        print(f"{name:<48} {_fmt(base['median']):>12} "
+              f"{_fmt(result['median']):>12} {change:>+8.1f}%{flag}")
+    return regressions
+
+
+def _register(bench: Benchmark) -> None:
+    if any(existing.name == bench.name for existing in _benchmarks):
+        raise ValueError(f"Benchmark '{bench.name}' already exists!")
+    _benchmarks.append(bench)
+
+
+def _run_one(bench: Benchmark, env: BenchEnv, repeats: int,
+             min_time: float) -> Result:
+    result = Result(bench.name, bench.group)
+    try:
+        with ExitStack() as stack:
+            bench_env = replace(env, stack=stack)
+            if bench.param is None:
+                func = bench.setup(bench_env)
+            else:
+                func = bench.setup(bench_env, bench.param)
+
+            # warm up, and find how many iterations fill min_time
+            iterations = 1
+            while True:
+                elapsed = _time(func, iterations)
+                if elapsed >= min_time or iterations >= 1 << 20:
+                    break
+                iterations *= 2 if elapsed <= 0 else max(
+                    2, min(10, int(min_time / elapsed) + 1))
+
+            result.iterations = iterations
+            result.times = [
+                _time(func, iterations) / iterations for _ in range(repeats)
+            ]
+    except Exception:
+        result.error = traceback.format_exc(limit=3)
+        print(f"{bench.name} failed:\n{result.error}", file=sys.stderr)
+    return result
+
+
+def _time(func: Callable, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return time.perf_counter() - start
+
+
+@contextmanager
+def _headless_env(data_path: str) -> ContextManager[BenchEnv]:
+    from rosmarus.application import Application
+    from rosmarus.graphics.gl_context import OSMESA, EGL, NATIVE
+
+    app = Application("Rosmarus benchmarks", data_path=data_path)
+    last_err = None
+    # prefer a real driver, but fall back to software so we run on CI agents
+    for api in (NATIVE, EGL, OSMESA):
+        with ExitStack() as stack:
+            try:
+                window = stack.enter_context(
+                    app.make_window(640, 480, (3, 3),
+                                    headless=True,
+                                    context_api=api))
+            except Exception as err:
+                last_err = err
+                continue
+            yield BenchEnv(data_path, app, window)
+            return
+    raise RuntimeError(f"Unable to create headless context: {last_err}")
+
+
+def _fmt(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e3), ("us", 1e6)):
+        if seconds * scale >= 1:
+            return f"{seconds * scale:.3f}{unit}"
+    return f"{seconds * 1e9:.1f}ns"
@@ -4,12 +4,18 @@ from typing import Tuple, ContextManager, Callable
 import glfw
 
 from .graphics.window import Window
-from .graphics.gl_context import GLContext
+from .graphics.gl_context import GLContext, NATIVE
+from .graphics.framebuffer import Framebuffer
+from .graphics import gl_state
+from .graphics import camera
+from .graphics import shader
+from .graphics import readback
 from .util import make_path_safe
 from . import resources
 from . import scene
 from . import controls
 from . import audio
+from . import profiler
 
 
 class Application:
@@ -20,7 +26,9 @@ class Application:
                  on_start: Callable[..., None] = None,
                  on_exit: Callable[..., None] = None,
                  on_update: Callable[[float], None] = None,
-                 on_render: Callable[..., None] = None) -> None:
+                 on_render: Callable[..., None] = None,
+                 upload_budget: float = resources.DEFAULT_UPLOAD_BUDGET
+                 ) -> None:
         self.name = name
         if data_path is None:
             data_path = make_path_safe(f"{name}_data")
@@ -30,7 +38,9 @@ class Application:
         self.on_update = on_update
         self.on_render = on_render
         self.target_delta_time = 1.0 / update_frequency_hz
+        self.upload_budget = upload_budget
         self.elapsed_time = 0
+        self.headless = False
         self.scene_manager = scene.SceneManager()
         resources._register_data_path(data_path)
 
@@ -51,6 +61,24 @@ class Application:
         if callback is not None:
             callback(*args, **kwargs)
 
+    def _process_uploads(self) -> None:
+        with profiler.zone("process_uploads"):
+            resources.process_uploads(self.upload_budget)
+
+    def _update_audio(self) -> None:
+        with profiler.zone("audio"):
+            audio.update()
+
+    def _update(self, frame_time: float) -> None:
+        self._run_callback(self.on_update, frame_time)
+        self.elapsed_time += self.target_delta_time
+
+    def _present(self, window: Window) -> None:
+        with profiler.zone("swap_buffers"):
+            glfw.swap_buffers(window.glfw_window)
+        with profiler.zone("poll_events"):
+            glfw.poll_events()
+
     def main_loop(self, window: Window) -> None:
         glfw.set_key_callback(window.glfw_window, controls.key_callback)
         glfw.set_cursor_pos_callback(window.glfw_window,
@@ -62,29 +90,94 @@ class Application:
         current_time = glfw.get_time()
         accumulator = 0
         while not glfw.window_should_close(window.glfw_window):
+            profiler.begin_frame()
             new_time = glfw.get_time()
             frame_time = new_time - current_time
             current_time = new_time
             accumulator += frame_time
 
+            self._process_uploads()
+
             # update as fast as possible, but only render at a set delta time
-            while accumulator >= self.target_delta_time:
-                self._run_callback(self.on_update, frame_time)
-                accumulator -= self.target_delta_time
-                self.elapsed_time += self.target_delta_time
+            with profiler.zone("update"):
+                while accumulator >= self.target_delta_time:
+                    self._update(frame_time)
+                    accumulator -= self.target_delta_time
 
-            self._run_callback(self.on_render)
+            self._update_audio()
 
-            glfw.swap_buffers(window.glfw_window)
-            glfw.poll_events()
+            with profiler.zone("render"):
+                self._run_callback(self.on_render)
+
+            self._present(window)
+            readback.update()
+            profiler.end_frame()
+            gl_state.end_frame()
+
+    def run_frames(self,
+                   window: Window,
+                   frame_count: int,
+                   target: Framebuffer = None) -> None:
+        """Run a fixed number of frames with a deterministic clock.
+
+        Every frame runs exactly one update with a delta time of
+        target_delta_time, regardless of how long the frame really took.
+        Intended for headless benchmarks and tests.
+
+        Args:
+            window (Window): The window to run in.
+            frame_count (int): How many frames to run.
+            target (Framebuffer): If given, it will be bound while rendering,
+                so output can be read back without relying on the window's
+                default framebuffer.
+        """
+        for _ in range(frame_count):
+            profiler.begin_frame()
+            self._process_uploads()
+            with profiler.zone("update"):
+                self._update(self.target_delta_time)
+
+            self._update_audio()
+
+            with profiler.zone("render"):
+                if target is not None:
+                    target.bind()
+                self._run_callback(self.on_render)
+                if target is not None:
+                    target.unbind()
+
+            self._present(window)
+            readback.update()
+            profiler.end_frame()
+            gl_state.end_frame()
 
     @contextmanager
-    def make_window(self, width: int, height: int,
-                    gl_version: Tuple[int, int]) -> ContextManager[Window]:
+    def make_window(self,
+                    width: int,
+                    height: int,
+                    gl_version: Tuple[int, int],
+                    headless: bool = False,
+                    context_api: str = NATIVE) -> ContextManager[Window]:
+        """Create the window and initialize audio for the application.
+
+        Args:
+            width (int): The width of the window.
+            height (int): The height of the window.
+            gl_version (Tuple[int, int]): The OpenGL (major, minor) version.
+            headless (bool): If True the window is hidden and audio is
+                null, so OpenAL isn't needed. Combine with the 'egl' or
+                'osmesa' context API to run without a display server.
+            context_api (str): The GL context creation API to use.
+        """
         major, minor = gl_version
-        window = Window(self.name, width, height, GLContext(major, minor))
+        self.headless = headless
+        window = Window(self.name,
+                        width,
+                        height,
+                        GLContext(major, minor, context_api),
+                        visible=not headless)
         try:
-            audio.init()
+            audio.init(null=headless)
             initialized = window._initialize()
             self._run_callback(self.on_start)
             yield initialized
@@ -92,5 +185,9 @@ class Application:
             print("Finishing")
             self._run_callback(self.on_exit)
             resources.cleanup()
+            profiler.cleanup()
+            camera.cleanup()
+            shader.cleanup()
+            readback.cleanup()
             audio.cleanup()
             window._cleanup()
\ No newline at end of file
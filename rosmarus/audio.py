@@ -1,56 +1,96 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
 from array import array
+from concurrent.futures import Future, ProcessPoolExecutor
 import ctypes as ct
+from dataclasses import dataclass, replace
+from functools import partial
+import hashlib
+import mmap
+import os
+from os import path
+import queue
+import struct
 import threading
 import time
-from typing import Union
+from typing import (Callable, Dict, List, Mapping, Optional, Sequence,
+                    Tuple, Union)
 import logging
+import multiprocessing
 
-import openal.al as al
-import openal.alc as alc
+import numpy as np
 
 from pyogg import VorbisFileStream, VorbisFile, vorbis, PYOGG_STREAM_BUFFER_SIZE
 
 
+# OpenAL is only imported by init(), so that with null audio (or nothing
+# initialized at all) the module works without the OpenAL library
+al = None
+alc = None
+
+
 class _Audio:
     def __init__(self) -> None:
         self.device = None
         self.context = None
-        self.sources = []
+        # nothing is output and OpenAL isn't touched, for headless runs
+        self.null = False
+        self.voices = _VoicePool()
+        self.spatial = _Spatial()
+        self.service = _AudioService()
 
 
-_audio = _Audio()
+# seconds between the audio service thread checking on playing sources
+SERVICE_INTERVAL = 0.005
+
+# default AudioStream buffering, bytes per channel in each buffer
+DEFAULT_STREAM_BUFFER_COUNT = 4
+DEFAULT_STREAM_BUFFER_SIZE = 4 * PYOGG_STREAM_BUFFER_SIZE
+
+# ov_read's return value for a hole in the data
+_OV_HOLE = -3
+
+PCM_CACHE_EXTENSION = ".rpcm"
+_PCM_MAGIC = b"RPCM"
+_PCM_VERSION = 1
+_PCM_HASH_SIZE = 16
+# magic, version, channels, frequency, data length in bytes, source hash
+_PCM_HEADER = struct.Struct(f"<4sHHIQ{_PCM_HASH_SIZE}s")
+
+_WAV_CHUNK_HEADER = struct.Struct("<4sI")
+# format tag, channels, frequency, byte rate, block align, bits per sample
+_WAV_FMT = struct.Struct("<HHIIHH")
+_WAVE_FORMAT_PCM = 1
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# filled in once OpenAL is loaded
+_AL_FORMATS: Dict[Tuple[int, int], int] = {}
+_AL_ERR_MAP: Dict[int, str] = {}
+_ALC_ERR_MAP: Dict[int, str] = {}
+
+# how many sources audio.play() can have playing at once
+DEFAULT_VOICE_COUNT = 32
+
+# AudioEmitter defaults, in world units
+DEFAULT_REFERENCE_DISTANCE = 1.0
+DEFAULT_MAX_DISTANCE = 100.0
 
-_AL_ERR_MAP = {
-    al.AL_NO_ERROR: "AL_NO_ERROR",
-    al.AL_INVALID_NAME: "AL_INVALID_NAME",
-    al.AL_INVALID_ENUM: "AL_INVALID_ENUM",
-    al.AL_INVALID_VALUE: "AL_INVALID_VALUE",
-    al.AL_INVALID_OPERATION: "AL_INVALID_OPERATION",
-    al.AL_OUT_OF_MEMORY: "AL_OUT_OF_MEMORY"
-}
-
-_ALC_ERR_MAP = {
-    alc.ALC_NO_ERROR: "ALC_NO_ERROR",
-    alc.ALC_INVALID_DEVICE: "ALC_INVALID_DEVICE",
-    alc.ALC_INVALID_CONTEXT: "ALC_INVALID_CONTEXT",
-    alc.ALC_INVALID_ENUM: "ALC_INVALID_ENUM",
-    alc.ALC_INVALID_VALUE: "ALC_INVALID_VALUE",
-    alc.ALC_OUT_OF_MEMORY: "ALC_OUT_OF_MEMORY"
-}
 
 
 class BaseAudio(ABC):
     @abstractmethod
     def __init__(self) -> None:
         self.attached_sources = {}
+        # defaults for audio.play(), higher priority sounds can steal the
+        # voices of lower ones
+        self.priority = 0
+        self.max_instances: Optional[int] = None
 
     def register_source(self, source: AudioSource) -> None:
         self.attached_sources[source.handle.value] = source
 
     def deregister_source(self, source: AudioSource) -> None:
-        del self.attached_sources[source.handle.value]
+        self.attached_sources.pop(source.handle.value, None)
 
     @abstractmethod
     def length_seconds(self) -> float:
@@ -61,71 +101,398 @@ class BaseAudio(ABC):
         raise NotImplementedError()
 
 
+@dataclass
+class PCMData:
+    """Decoded PCM audio, ready to be given to alBufferData."""
+    channels: int
+    frequency: int
+    buffer: object
+    buffer_length: int
+    bits: int = 16
+
+
+def decode_clip(file_path: str,
+                channels: int = None,
+                frequency: int = None) -> PCMData:
+    """Fully decode an audio file. Doesn't touch OpenAL, so is thread safe.
+
+    The format is detected from the file's header. WAV and .rpcm files are
+    already PCM, so are memory-mapped rather than decoded. Files without a
+    header are taken to be raw 16-bit PCM, which needs the channels and
+    frequency given. Anything else is decoded as Ogg Vorbis.
+
+    If the PCM cache is enabled, a Vorbis clip that's been decoded before is
+    mapped straight from the cache, and one that hasn't is decoded in the
+    process pool and added to it.
+    """
+    magic = _read_magic(file_path)
+    if magic == b"RIFF":
+        return _map_wav(file_path)
+    if magic == _PCM_MAGIC:
+        pcm = _map_cached_pcm(file_path, None)
+        if pcm is None:
+            raise RuntimeError(f"Unable to load '{file_path}', bad header")
+        return pcm
+    if magic != b"OggS":
+        if channels is None or frequency is None:
+            raise RuntimeError(
+                f"Unable to load '{file_path}', unknown format. Raw PCM "
+                "needs channels and frequency")
+        return _map_raw(file_path, channels, frequency)
+
+    if _pcm_cache.directory is None:
+        return _decode_vorbis(file_path)
+
+    source_hash = _hash_file(file_path)
+    cache_path = _pcm_cache_path(source_hash)
+    pcm = _map_cached_pcm(cache_path, source_hash)
+    if pcm is not None:
+        with _pcm_cache.lock:
+            _pcm_cache.hits += 1
+        return pcm
+
+    with _pcm_cache.lock:
+        _pcm_cache.misses += 1
+    _submit_decode(file_path, cache_path, source_hash).result()
+    pcm = _map_cached_pcm(cache_path, source_hash)
+    if pcm is None:
+        # couldn't be cached, so there's nothing to map
+        pcm = _decode_vorbis(file_path)
+    return pcm
+
+
+def decode_clips(file_paths: Sequence[str]) -> List[Future]:
+    """Start decoding clips into the PCM cache across every core.
+
+    Meant to be called before bulk loading a lot of sounds, like when
+    showing a loading screen, so that loading each one only has to map it
+    from the cache. Worker processes are spawned rather than forked, so the
+    game's entry point must be guarded by if __name__ == "__main__".
+
+    Returns:
+        List[Future]: One for each clip that wasn't already cached, which
+            resolve once it has been.
+    """
+    if _pcm_cache.directory is None:
+        raise RuntimeError("The PCM cache must be enabled to decode clips")
+
+    futures = []
+    for file_path in file_paths:
+        source_hash = _hash_file(file_path)
+        cache_path = _pcm_cache_path(source_hash)
+        if path.exists(cache_path):
+            continue
+        futures.append(_submit_decode(file_path, cache_path, source_hash))
+    return futures
+
+
+def enable_pcm_cache(directory: Optional[str]) -> None:
+    """Cache decoded clips on disk to skip decoding them on later runs.
+
+    Cached clips are keyed by a hash of the source file, so changing the
+    file decodes it again.
+
+    Args:
+        directory (str): Where to store decoded clips, or None to disable.
+    """
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+    _pcm_cache.directory = directory
+
+
+def pcm_cache_stats() -> Mapping[str, int]:
+    with _pcm_cache.lock:
+        return {"hits": _pcm_cache.hits, "misses": _pcm_cache.misses}
+
+
+class _PCMCache:
+    def __init__(self) -> None:
+        self.directory = None
+        self.hits = 0
+        self.misses = 0
+        self.executor = None
+        # decodes in progress by cache path, so a clip being decoded by
+        # decode_clips() isn't decoded again when it's loaded
+        self.in_flight: Dict[str, Future] = {}
+        # clips are decoded on the resource loader threads, so this guards
+        # everything above
+        self.lock = threading.Lock()
+
+
+_pcm_cache = _PCMCache()
+
+
+def _decode_vorbis(file_path: str) -> PCMData:
+    vorbis_file = VorbisFile(file_path)
+    return PCMData(vorbis_file.channels, vorbis_file.frequency,
+                   vorbis_file.buffer, vorbis_file.buffer_length)
+
+
+def _hash_file(file_path: str) -> bytes:
+    with open(file_path, "rb") as source_file:
+        return hashlib.blake2b(source_file.read(),
+                               digest_size=_PCM_HASH_SIZE).digest()
+
+
+def _pcm_cache_path(source_hash: bytes) -> str:
+    return path.join(_pcm_cache.directory,
+                     f"{source_hash.hex()}{PCM_CACHE_EXTENSION}")
+
+
+def _submit_decode(file_path: str, cache_path: str,
+                   source_hash: bytes) -> Future:
+    with _pcm_cache.lock:
+        future = _pcm_cache.in_flight.get(cache_path)
+        if future is not None:
+            return future
+        if _pcm_cache.executor is None:
+            # forking would copy the audio service and loader threads (and
+            # this lock, held) into the workers, so start them fresh
+            _pcm_cache.executor = ProcessPoolExecutor(
+                mp_context=multiprocessing.get_context("spawn"))
+        future = _pcm_cache.executor.submit(_decode_to_cache, file_path,
+                                            cache_path, source_hash)
+        _pcm_cache.in_flight[cache_path] = future
+    future.add_done_callback(partial(_finish_decode, cache_path))
+    return future
+
+
+def _finish_decode(cache_path: str, future: Future) -> None:
+    with _pcm_cache.lock:
+        _pcm_cache.in_flight.pop(cache_path, None)
+
+
+def _decode_to_cache(file_path: str, cache_path: str,
+                     source_hash: bytes) -> None:
+    # runs in a worker process
+    pcm = _decode_vorbis(file_path)
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "wb") as cache_file:
+            cache_file.write(
+                _PCM_HEADER.pack(_PCM_MAGIC, _PCM_VERSION, pcm.channels,
+                                 pcm.frequency, pcm.buffer_length,
+                                 source_hash))
+            cache_file.write(pcm.buffer)
+        os.replace(temp_path, cache_path)
+    except OSError as err:
+        logging.warning(f"Unable to cache decoded clip: {err}")
+        if path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _map_file(file_path: str) -> Optional[mmap.mmap]:
+    try:
+        with open(file_path, "rb") as mapped_file:
+            # a private mapping is writable, which ctypes needs to point into
+            # it, but pages are only copied if something writes to them
+            return mmap.mmap(mapped_file.fileno(), 0, access=mmap.ACCESS_COPY)
+    except (OSError, ValueError):
+        return None
+
+
+def _map_pcm(mapped: mmap.mmap, offset: int, length: int, channels: int,
+             frequency: int, bits: int) -> PCMData:
+    # keeps the mapping open for as long as the buffer is referenced
+    buffer = (ct.c_char * length).from_buffer(mapped, offset)
+    return PCMData(channels, frequency, buffer, length, bits)
+
+
+def _map_cached_pcm(cache_path: str,
+                    source_hash: Optional[bytes]) -> Optional[PCMData]:
+    """Map a .rpcm file, checking it came from the given source unless the
+    hash is None."""
+    mapped = _map_file(cache_path)
+    if mapped is None:
+        return None
+
+    if len(mapped) < _PCM_HEADER.size:
+        mapped.close()
+        return None
+    magic, version, channels, frequency, length, cached_hash = \
+        _PCM_HEADER.unpack_from(mapped)
+    if magic != _PCM_MAGIC or version != _PCM_VERSION \
+            or (source_hash is not None and cached_hash != source_hash) \
+            or len(mapped) != _PCM_HEADER.size + length:
+        mapped.close()
+        return None
+
+    return _map_pcm(mapped, _PCM_HEADER.size, length, channels, frequency,
+                    16)
+
+
+def _map_wav(file_path: str) -> PCMData:
+    mapped = _map_file(file_path)
+    if mapped is None:
+        raise RuntimeError(f"Unable to load '{file_path}', not a WAV file")
+    try:
+        offset, length, channels, frequency, bits = _find_wav_data(
+            mapped, file_path)
+    except Exception:
+        mapped.close()
+        raise
+    return _map_pcm(mapped, offset, length, channels, frequency, bits)
+
+
+def _find_wav_data(mapped: mmap.mmap,
+                   file_path: str) -> Tuple[int, int, int, int, int]:
+    if len(mapped) < 12 or mapped[8:12] != b"WAVE":
+        raise RuntimeError(f"Unable to load '{file_path}', not a WAV file")
+
+    fmt = None
+    offset = 12
+    while offset + _WAV_CHUNK_HEADER.size <= len(mapped):
+        chunk_id, chunk_size = _WAV_CHUNK_HEADER.unpack_from(mapped, offset)
+        offset += _WAV_CHUNK_HEADER.size
+        if chunk_id == b"fmt ":
+            if chunk_size < _WAV_FMT.size \
+                    or offset + _WAV_FMT.size > len(mapped):
+                break
+            fmt = _WAV_FMT.unpack_from(mapped, offset)
+            fmt_offset = offset
+            fmt_size = chunk_size
+        elif chunk_id == b"data":
+            if fmt is None:
+                break
+            format_tag, channels, frequency, _, block_align, bits = fmt
+            if format_tag == _WAVE_FORMAT_EXTENSIBLE and fmt_size >= 40 \
+                    and fmt_offset + 26 <= len(mapped):
+                # the real format is the first two bytes of the sub-format
+                format_tag, = struct.unpack_from("<H", mapped, fmt_offset + 24)
+            if format_tag != _WAVE_FORMAT_PCM or bits not in (8, 16) \
+                    or channels not in (1, 2):
+                raise RuntimeError(
+                    f"Unable to load '{file_path}', only 8 or 16-bit mono or "
+                    "stereo PCM WAVs are supported")
+            if block_align != channels * bits // 8:
+                raise RuntimeError(
+                    f"Unable to load '{file_path}', bad block align "
+                    f"{block_align}")
+            # files written while recording can have a bogus data size
+            length = min(chunk_size, len(mapped) - offset)
+            length -= length % block_align
+            return offset, length, channels, frequency, bits
+        # chunks are padded to an even size
+        offset += chunk_size + (chunk_size & 1)
+
+    raise RuntimeError(
+        f"Unable to load '{file_path}', missing 'fmt ' or 'data' chunk")
+
+
+def _map_raw(file_path: str, channels: int, frequency: int) -> PCMData:
+    mapped = _map_file(file_path)
+    if mapped is None:
+        raise RuntimeError(f"Unable to load '{file_path}'")
+    length = len(mapped) - len(mapped) % (channels * 2)
+    return _map_pcm(mapped, 0, length, channels, frequency, 16)
+
+
+def _read_magic(file_path: str) -> bytes:
+    with open(file_path, "rb") as audio_file:
+        return audio_file.read(4)
+
+
 class AudioClip(BaseAudio):
-    def __init__(self, file_path: str) -> None:
+    """A sound loaded entirely into an OpenAL buffer, see decode_clip() for
+    the formats it can be loaded from.
+
+    Args:
+        file_path (str): The file to load, unless pcm is given.
+        pcm (PCMData): Already decoded audio.
+        channels (int): The channel count of a raw PCM file.
+        frequency (int): The sample rate of a raw PCM file.
+    """
+    def __init__(self,
+                 file_path: str,
+                 pcm: PCMData = None,
+                 channels: int = None,
+                 frequency: int = None) -> None:
         super().__init__()
-        self.clip = VorbisFile(file_path)
+        if pcm is None:
+            pcm = decode_clip(file_path, channels, frequency)
+        self.clip = pcm
         self.handle = ct.c_uint(0)
-        al.alGenBuffers(1, ct.byref(self.handle))
-        self.format = al.AL_FORMAT_MONO16 if self.clip.channels == 1 \
-            else al.AL_FORMAT_STEREO16
-        al.alBufferData(self.handle, self.format, self.clip.buffer,
-                        self.clip.buffer_length, self.clip.frequency)
+        self.format = None
+        if not _audio.null:
+            al.alGenBuffers(1, ct.byref(self.handle))
+            self.format = _AL_FORMATS[(self.clip.channels, self.clip.bits)]
+            al.alBufferData(self.handle, self.format, self.clip.buffer,
+                            self.clip.buffer_length, self.clip.frequency)
+        # OpenAL has its own copy now, and the buffer may be holding a
+        # cached file open
+        self.clip = replace(self.clip, buffer=None)
 
     def length_seconds(self) -> float:
         return self.clip.buffer_length / (self.clip.frequency *
-                                          self.clip.channels * 2)
+                                          self.clip.channels *
+                                          self.clip.bits // 8)
 
     def cleanup(self) -> None:
-        for source in self.attached_sources.values():
+        for source in list(self.attached_sources.values()):
             source.stop()
+        # queued after the stops, so the buffer is detached by then
+        _audio.service.submit(self._delete)
+
+    def _delete(self) -> None:
         al.alDeleteBuffers(1, ct.byref(self.handle))
 
 
 class AudioStream(BaseAudio):
-    BUFFER_COUNT = 3
+    """Music or other long audio, decoded a block at a time while it plays.
+
+    Each block is decoded straight into one preallocated buffer which is
+    then given to OpenAL, so refilling makes no intermediate copies.
 
-    def __init__(self, file_path: str) -> None:
+    Args:
+        file_path (str): The Ogg Vorbis file to stream.
+        buffer_count (int): How many buffers to keep queued.
+        buffer_size (int): Bytes of PCM per channel in each buffer.
+    """
+    def __init__(self,
+                 file_path: str,
+                 buffer_count: int = DEFAULT_STREAM_BUFFER_COUNT,
+                 buffer_size: int = DEFAULT_STREAM_BUFFER_SIZE) -> None:
         super().__init__()
         self.file_path = file_path
         self.clip = VorbisFileStream(file_path)
         self._length_seconds = vorbis.ov_time_total(self.clip.vf, -1)
-        self.buffers = (ct.c_uint * AudioStream.BUFFER_COUNT)(0, 0, 0)
-        self.format = al.AL_FORMAT_MONO16 if self.clip.channels == 1 \
-            else al.AL_FORMAT_STEREO16
-        for i in range(0, AudioStream.BUFFER_COUNT):
-            buf_handle = ct.c_uint(0)
-            al.alGenBuffers(1, ct.byref(buf_handle))
-            self.buffers[i] = buf_handle
+        self.buffer_count = buffer_count
+        # keep blocks a whole number of 16-bit sample frames
+        frame_size = 2 * self.clip.channels
+        self.block_size = buffer_size * self.clip.channels // frame_size * \
+            frame_size
+        self.underruns = 0
+        self._pcm = (ct.c_char * self.block_size)()
+        self._pcm_address = ct.addressof(self._pcm)
+        self.buffers = (ct.c_uint * buffer_count)()
+        self.format = None
+        if _audio.null:
+            return
+        self.format = _AL_FORMATS[(self.clip.channels, 16)]
+        al.alGenBuffers(buffer_count, self.buffers)
+        for i in range(0, buffer_count):
             self.fill_buffer(index=i)
 
-    def _read_vorbis_data(self):
-        # mostly lifted from https://github.com/Zuzu-Typ/PyOgg/blob/master/pyogg/__init__.py#L98
-        buf = []
+    def _read_vorbis_data(self) -> int:
+        """Decode the next block into the PCM buffer, returning how many
+        bytes were written, which is 0 at the end of the stream."""
         total_written = 0
-
-        while True:
+        while total_written < self.block_size:
             new_bytes = vorbis.ov_read(
-                ct.byref(self.clip.vf), self.clip.buffer_,
-                PYOGG_STREAM_BUFFER_SIZE * self.clip.channels - total_written,
-                0, 2, 1, self.clip.bitstream_pointer)
-            array_ = ct.cast(
-                self.clip.buffer_,
-                ct.POINTER(
-                    ct.c_char *
-                    (PYOGG_STREAM_BUFFER_SIZE * self.clip.channels))).contents
-
-            buf.append(array_.raw[:new_bytes])
-            total_written += new_bytes
-            if new_bytes == 0 or total_written >= PYOGG_STREAM_BUFFER_SIZE * self.clip.channels:
+                ct.byref(self.clip.vf),
+                ct.cast(self._pcm_address + total_written, ct.c_char_p),
+                self.block_size - total_written, 0, 2, 1,
+                self.clip.bitstream_pointer)
+            if new_bytes == 0:
                 break
-
-        out_buffer = b"".join(buf)
-
-        if total_written == 0:
-            return None
-
-        return out_buffer, total_written
+            if new_bytes == _OV_HOLE:
+                # a gap in the data, decoding carries on after it
+                continue
+            if new_bytes < 0:
+                raise RuntimeError(
+                    f"Error {new_bytes} decoding '{self.file_path}'")
+            total_written += new_bytes
+        return total_written
 
     def fill_buffer(self, index: int = None, handle: int = None) -> bool:
         buf_handle = handle
@@ -134,12 +501,15 @@ class AudioStream(BaseAudio):
         if buf_handle is None:
             raise RuntimeError(
                 "Call _fill_buffer() with either index or handle")
-        data = self._read_vorbis_data()
-        if data is None:
+        written = self._read_vorbis_data()
+        if written == 0:
             return True
-        buf, buf_len = data
-        al.alBufferData(buf_handle, self.format, buf, buf_len,
+        al.alBufferData(buf_handle, self.format, self._pcm, written,
                         self.clip.frequency)
+        return False
+
+    def buffer_size_bytes(self) -> int:
+        return self.buffer_count * self.block_size
 
     def seek_to_start(self) -> None:
         vorbis.ov_pcm_seek_lap(self.clip.vf, 0)
@@ -148,152 +518,615 @@ class AudioStream(BaseAudio):
         return self._length_seconds
 
     def cleanup(self) -> None:
-        for source in self.attached_sources.values():
+        for source in list(self.attached_sources.values()):
             source.stop()
-        al.alDeleteBuffers(AudioStream.BUFFER_COUNT, self.buffers)
+        _audio.service.submit(self._delete)
+
+    def _delete(self) -> None:
+        if not _audio.null:
+            al.alDeleteBuffers(self.buffer_count, self.buffers)
         self.clip.clean_up()
 
 
 class AudioSource:
+    """A sound playing in the world.
+
+    The methods here only queue commands, the source itself is owned by the
+    audio service thread, which plays it, keeps its stream fed and notices
+    when it finishes. on_finish is called from that thread when a sound that
+    isn't looping reaches its end, so keep it short and thread safe.
+    """
     def __init__(self) -> None:
         self.handle = ct.c_uint(0)
         self.playing = False
         self.paused = False
         self.looping = False
         self.clip = None
-        self.finish_timer = None
         self.streaming = False
-        self.stream_buffer_callback = None
-        self.stop_streaming_event = threading.Event()
-        self.time_played_for = None
-        al.alGenSources(1, ct.byref(self.handle))
+        self.on_finish: Callable[[AudioSource], None] = None
+        self.gain = 1.0
+        # used by the voice pool to decide which voice to steal, how loud
+        # the sound is once its distance from the listener is accounted for
+        self.audibility = 1.0
+        self.priority = 0
+        self.started_at = 0
+        # what the service thread is actually playing, which can lag behind
+        # the public attributes above while commands are queued
+        self._generation = 0
+        self._active_generation = 0
+        # held while the public attributes and generation change, so the
+        # service thread can't see a finish and reset them in between
+        self._state_lock = threading.Lock()
+        self._active_clip = None
+        self._active_looping = False
+        self._stream_finished = False
+        if not _audio.null:
+            al.alGenSources(1, ct.byref(self.handle))
 
     def stream(self, stream: AudioStream, loop: bool = False) -> None:
-        self.streaming = True
-        self.clip = stream
-        al.alSourceQueueBuffers(self.handle, AudioStream.BUFFER_COUNT,
-                                stream.buffers)
-        al.alSourcePlay(self.handle)
-        stream.register_source(self)
-        self.playing = True
+        self._set_playing(stream, loop, streaming=True)
+        _audio.service.submit(self._start_stream, stream, loop,
+                              self._generation)
+
+    def play(self, clip: AudioClip, loop: bool = False,
+             offset: float = 0) -> None:
+        self._set_playing(clip, loop, streaming=False)
+        _audio.service.submit(self._start_clip, clip, loop, self._generation,
+                              offset)
+
+    def resume(self) -> None:
+        if not self.paused:
+            return
         self.paused = False
-        self.looping = loop
-        self.time_played_for = time.time()
+        _audio.service.submit(self._resume_source)
 
-        self.stream_buffer_callback = threading.Thread(
-            target=self._check_for_used_buffers)
-        self.stream_buffer_callback.start()
+    def pause(self) -> None:
+        if not self.playing or self.paused:
+            return
+        self.paused = True
+        _audio.service.submit(self._pause_source)
 
-        time_to_finish = stream.length_seconds()
+    def stop(self) -> None:
+        with self._state_lock:
+            self._generation += 1
+            self._set_stopped()
+        _audio.service.submit(self._stop_source)
 
-        # start the timer to execute the callback
-        if not loop:
-            self.finish_timer = threading.Timer(time_to_finish,
-                                                self._on_finish_play)
-            self.finish_timer.start()
+    def set_gain(self, gain: float) -> None:
+        if gain == self.gain:
+            return
+        self.gain = gain
+        _audio.service.submit(self._set_source_gain, gain)
+
+    def cleanup(self) -> None:
+        self.stop()
+        _audio.service.submit(self._delete_source)
 
-    def play(self, clip: AudioClip, loop: bool = False) -> None:
-        self.clip = clip
+    def _set_playing(self, clip: BaseAudio, loop: bool,
+                     streaming: bool) -> None:
+        if self.clip is not None:
+            _audio.service.submit(self._stop_source)
+        with self._state_lock:
+            self._generation += 1
+            self.clip = clip
+            self.playing = True
+            self.paused = False
+            self.looping = loop
+            self.streaming = streaming
+
+    def _set_stopped(self) -> None:
+        self.playing = False
+        self.paused = False
+        self.looping = False
+        self.clip = None
+        self.streaming = False
+
+    # everything below runs on the audio service thread
+
+    def _start_clip(self, clip: AudioClip, loop: bool, generation: int,
+                    offset: float) -> None:
         al.alSourcei(self.handle, al.AL_BUFFER, clip.handle.value)
         al.alSourcei(self.handle, al.AL_LOOPING, 1 if loop else 0)
+        if offset > 0:
+            # seek before playing, attaching the buffer resets the offset
+            al.alSourcef(self.handle, al.AL_SEC_OFFSET, offset)
         al.alSourcePlay(self.handle)
         clip.register_source(self)
-        self.playing = True
-        self.paused = False
-        self.looping = loop
-        self.time_played_for = time.time()
+        self._activate(clip, loop, generation)
 
-        if not loop:
-            time_to_finish = clip.length_seconds()
+    def _start_stream(self, stream: AudioStream, loop: bool,
+                      generation: int) -> None:
+        # looping is done by seeking the stream, not by OpenAL
+        al.alSourcei(self.handle, al.AL_LOOPING, 0)
+        al.alSourceQueueBuffers(self.handle, stream.buffer_count,
+                                stream.buffers)
+        al.alSourcePlay(self.handle)
+        self._stream_finished = False
+        stream.register_source(self)
+        self._activate(stream, loop, generation)
 
-            # start the timer to execute the callback
-            self.finish_timer = threading.Timer(time_to_finish,
-                                                self._on_finish_play)
-            self.finish_timer.start()
+    def _activate(self, clip: BaseAudio, loop: bool, generation: int) -> None:
+        self._active_clip = clip
+        self._active_looping = loop
+        self._active_generation = generation
+        _audio.service.activate(self)
 
-    def resume(self) -> None:
-        if not self.paused:
-            return
+    def _resume_source(self) -> None:
         al.alSourcePlay(self.handle)
 
-        if self.streaming:
-            self.stream_buffer_callback = threading.Thread(
-                target=self._check_for_used_buffers)
-            self.stream_buffer_callback.start()
-
-        if not self.looping:
-            time_to_finish = self.clip.length_seconds() - self.time_played_for
+    def _pause_source(self) -> None:
+        al.alSourcePause(self.handle)
 
-            # start the timer to execute the callback
-            self.finish_timer = threading.Timer(time_to_finish,
-                                                self._on_finish_play)
-            self.finish_timer.start()
+    def _set_source_gain(self, gain: float) -> None:
+        al.alSourcef(self.handle, al.AL_GAIN, gain)
 
-    def pause(self) -> None:
-        al.alSourcePause(self.handle)
-        self.paused = True
-        self.time_played_for = time.time() - self.time_played_for
-        # our existing callback is invalid if we've paused, it won't know
-        # that we've paused -- cancel it and we'll handle it when we play
-        # again
-        if self.finish_timer:
-            self.finish_timer.cancel()
-            self.finish_timer = None
-        if self.stream_buffer_callback:
-            self.stop_streaming_event.set()
-            self.stream_buffer_callback.join()
-            self.stop_streaming_event.clear()
+    def _delete_source(self) -> None:
+        al.alDeleteSources(1, ct.byref(self.handle))
 
-    def stop(self) -> None:
+    def _stop_source(self) -> None:
         al.alSourceStop(self.handle)
         al.alSourcei(self.handle, al.AL_BUFFER, 0)
-        if self.streaming:
-            self.clip.seek_to_start()
+        _audio.service.deactivate(self)
+        clip = self._active_clip
+        if clip is not None:
+            if isinstance(clip, AudioStream):
+                clip.seek_to_start()
+            clip.deregister_source(self)
+        self._active_clip = None
+
+    def _poll(self) -> None:
+        streaming = isinstance(self._active_clip, AudioStream)
+        if streaming:
+            self._refill_stream()
+
+        state = ct.c_int(0)
+        al.alGetSourcei(self.handle, al.AL_SOURCE_STATE, ct.byref(state))
+        if state.value != al.AL_STOPPED:
+            return
+        if streaming and not self._stream_finished:
+            # the stream couldn't keep up and OpenAL ran out of buffers,
+            # there's more to play so start it again
+            self._active_clip.underruns += 1
+            logging.debug("Audio stream '%s' underran",
+                          self._active_clip.file_path)
+            al.alSourcePlay(self.handle)
+            return
+        self._on_finish_play()
+
+    def _refill_stream(self) -> None:
+        buffers_processed = ct.c_int(0)
+        al.alGetSourcei(self.handle, al.AL_BUFFERS_PROCESSED,
+                        ct.byref(buffers_processed))
+        for _ in range(buffers_processed.value):
+            buffer_handle = ct.c_uint(0)
+            al.alSourceUnqueueBuffers(self.handle, 1, ct.byref(buffer_handle))
+            if self._stream_finished:
+                continue
+            stream = self._active_clip
+            finished = stream.fill_buffer(handle=buffer_handle)
+            if finished and self._active_looping:
+                stream.seek_to_start()
+                finished = stream.fill_buffer(handle=buffer_handle)
+            if finished:
+                self._stream_finished = True
+                continue
+            al.alSourceQueueBuffers(self.handle, 1, ct.byref(buffer_handle))
+
+    def _on_finish_play(self) -> None:
+        self._stop_source()
+        with self._state_lock:
+            if self._generation != self._active_generation:
+                # it's already been told to play something else
+                return
+            self._set_stopped()
+        if self.on_finish is not None:
+            self.on_finish(self)
+
+
+class _AudioService:
+    """The thread that owns every AudioSource.
+
+    Commands are run in the order they're submitted, and between them every
+    playing source is polled once per SERVICE_INTERVAL, so there's only ever
+    one audio thread however many sounds are playing.
+    """
+    def __init__(self) -> None:
+        self.commands = queue.SimpleQueue()
+        # only touched on the service thread
+        self.active: Dict[int, AudioSource] = {}
+        self.thread = None
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self._run,
+                                       name="audio_service",
+                                       daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        if self.thread is None:
+            return
+        self.commands.put(_STOP_SERVICE)
+        self.thread.join()
+        self.thread = None
+        self.active.clear()
+
+    def submit(self, command: Callable, *args) -> None:
+        if _audio.null:
+            # there's nothing to run OpenAL commands against
+            return
+        if self.thread is None:
+            # not started, so there's nothing to race with
+            command(*args)
+            return
+        self.commands.put(partial(command, *args))
+
+    def activate(self, source: AudioSource) -> None:
+        self.active[source.handle.value] = source
+
+    def deactivate(self, source: AudioSource) -> None:
+        self.active.pop(source.handle.value, None)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                command = self.commands.get(timeout=SERVICE_INTERVAL)
+                while True:
+                    if command is _STOP_SERVICE:
+                        return
+                    self._run_safely(command)
+                    command = self.commands.get_nowait()
+            except queue.Empty:
+                pass
+
+            for source in list(self.active.values()):
+                self._run_safely(source._poll)
+
+    def _run_safely(self, command: Callable) -> None:
+        # an error in one sound shouldn't take all of the audio down with it
+        try:
+            command()
+        except Exception:
+            logging.exception("Error in audio service thread")
+
+
+_STOP_SERVICE = object()
+
+
+class _VoicePool:
+    """A fixed set of AudioSources that audio.play() hands out.
+
+    Voices are recycled when they finish. When they're all busy a voice of
+    the same or lower priority is stolen, preferring the lowest priority,
+    then the quietest, then the oldest.
+    """
+    def __init__(self) -> None:
+        self.voices: List[AudioSource] = []
+        # sounds started since the last update(), to collapse repeats
+        self.started_this_frame: Dict[int, AudioSource] = {}
+        self.play_count = 0
+        self.steals = 0
+        self.collapsed = 0
+        self.rejected = 0
+
+    def allocate(self, count: int) -> None:
+        self.voices = [AudioSource() for _ in range(count)]
+
+    def acquire(self,
+                sound: BaseAudio,
+                priority: int,
+                max_instances: Optional[int],
+                audibility: float = None) -> Optional[AudioSource]:
+        if max_instances is not None:
+            instances = [
+                voice for voice in self.voices
+                if voice.playing and voice.clip is sound
+            ]
+            if len(instances) >= max_instances:
+                # replace the oldest instance rather than stacking up more
+                self.steals += 1
+                return min(instances, key=lambda voice: voice.started_at)
+
+        for voice in self.voices:
+            if not voice.playing:
+                return voice
+
+        candidates = [
+            voice for voice in self.voices if voice.priority <= priority
+        ]
+        if audibility is not None:
+            # only steal from quieter sounds, or emitters would keep taking
+            # voices from each other
+            candidates = [
+                voice for voice in candidates if voice.priority < priority
+                or voice.audibility < audibility
+            ]
+        if not candidates:
+            # emitters that miss out are counted as virtual instead
+            if audibility is None:
+                self.rejected += 1
+            return None
+        self.steals += 1
+        return min(candidates,
+                   key=lambda voice:
+                   (voice.priority, voice.audibility, voice.started_at))
+
+    def cleanup(self) -> None:
+        for voice in self.voices:
+            voice.cleanup()
+        self.voices.clear()
+        self.started_this_frame.clear()
+
+
+class AudioEmitter:
+    """A sound at a position in the world, for 3D positional audio.
+
+    Positions and velocities live in arrays shared by every emitter, and
+    are flushed to OpenAL once a frame in audio.update(), so set them as
+    often as needed during update. An emitter only holds a voice while it's
+    within max_distance of the listener, otherwise it's virtual: it keeps
+    track of where it would be in the sound, and picks back up from there
+    when it comes back into range. OpenAL only positions mono sounds.
+
+    Args:
+        sound (AudioClip): What to play.
+        loop (bool): Whether to loop the sound.
+        gain (float): The volume to play at.
+        priority (int): Overrides the sound's priority.
+        reference_distance (float): The distance the sound is at full
+            volume within.
+        max_distance (float): The distance the sound is inaudible past.
+    """
+    def __init__(self,
+                 sound: AudioClip,
+                 loop: bool = False,
+                 gain: float = 1.0,
+                 priority: int = None,
+                 reference_distance: float = DEFAULT_REFERENCE_DISTANCE,
+                 max_distance: float = DEFAULT_MAX_DISTANCE) -> None:
+        self.sound = sound
+        self.loop = loop
+        self.gain = gain
+        self.priority = sound.priority if priority is None else priority
+        self.reference_distance = reference_distance
+        self.max_distance = max_distance
+        self.playing = False
+        self.source: Optional[AudioSource] = None
+        self.slot = _audio.spatial.allocate(self)
+        self._voice_generation = 0
+        self._started = 0.0
+
+    @property
+    def virtual(self) -> bool:
+        return self.playing and self.source is None
+
+    def get_position(self) -> np.ndarray:
+        # a copy, the shared arrays are replaced when more emitters are added
+        return _audio.spatial.positions[self.slot].copy()
+
+    def set_position(self, position: Sequence[float]) -> None:
+        _audio.spatial.positions[self.slot] = tuple(position)
+
+    def get_velocity(self) -> np.ndarray:
+        return _audio.spatial.velocities[self.slot].copy()
+
+    def set_velocity(self, velocity: Sequence[float]) -> None:
+        _audio.spatial.velocities[self.slot] = tuple(velocity)
+
+    def play(self) -> None:
+        """Start the sound, it gets a voice in the next audio.update() if
+        it's in range."""
+        self._release_voice()
+        self.playing = True
+        self._started = time.perf_counter()
+
+    def stop(self) -> None:
+        self._release_voice()
         self.playing = False
-        self.paused = False
-        self.played_at = None
-        self.looping = False
-        self.clip = None
-        self.time_played_for = 0
-        self.streaming = False
-        if self.finish_timer:
-            self.finish_timer.cancel()
-            self.finish_timer = None
-        if self.stream_buffer_callback:
-            self.stop_streaming_event.set()
-            self.stream_buffer_callback.join()
-            self.stop_streaming_event.clear()
 
     def cleanup(self) -> None:
         self.stop()
-        al.alDeleteSources(1, ct.byref(self.handle))
+        _audio.spatial.free(self)
 
-    def _on_finish_play(self) -> None:
-        self.clip.deregister_source(self)
-        self.stop()
+    def _has_voice(self) -> bool:
+        # the voice could have been stolen, or finished and been reused
+        return self.source is not None \
+            and self.source._generation == self._voice_generation
 
-    def _check_for_used_buffers(self):
-        while True:
-            if self.stop_streaming_event.is_set():
-                break
+    def _elapsed(self) -> float:
+        return time.perf_counter() - self._started
+
+    def _acquire_voice(self, audibility: float) -> bool:
+        offset = self._elapsed()
+        if self.loop:
+            offset %= self.sound.length_seconds()
+        spatial = _audio.spatial
+        source = _play_on_voice(
+            self.sound,
+            self.loop,
+            self.priority,
+            self.sound.max_instances,
+            self.gain,
+            audibility,
+            placement=(self.reference_distance, self.max_distance,
+                       spatial.positions[self.slot].tolist(),
+                       spatial.velocities[self.slot].tolist()),
+            offset=offset)
+        if source is None:
+            return False
+        self.source = source
+        self._voice_generation = source._generation
+        return True
+
+    def _release_voice(self) -> None:
+        if self._has_voice():
+            self.source.stop()
+        self.source = None
+
+
+class _Spatial:
+    """Positions and velocities of every AudioEmitter, and the listener."""
+    def __init__(self) -> None:
+        self.emitters: List[Optional[AudioEmitter]] = []
+        self.free_slots: List[int] = []
+        self.positions = np.zeros((0, 3), dtype=np.float32)
+        self.velocities = np.zeros((0, 3), dtype=np.float32)
+        self.listener_position = np.zeros(3, dtype=np.float32)
+        self.listener_velocity = np.zeros(3, dtype=np.float32)
+        # forward then up
+        self.listener_orientation = np.array([0, 0, -1, 0, 1, 0],
+                                             dtype=np.float32)
+        self.listener_changed = True
+        self.virtual_count = 0
+
+    def allocate(self, emitter: AudioEmitter) -> int:
+        if self.free_slots:
+            slot = self.free_slots.pop()
+            self.emitters[slot] = emitter
+        else:
+            slot = len(self.emitters)
+            self.emitters.append(emitter)
+            if slot >= len(self.positions):
+                # grow geometrically so adding emitters isn't quadratic
+                capacity = max(16, len(self.positions) * 2)
+                self.positions = _grow(self.positions, capacity)
+                self.velocities = _grow(self.velocities, capacity)
+        self.positions[slot] = 0
+        self.velocities[slot] = 0
+        return slot
+
+    def free(self, emitter: AudioEmitter) -> None:
+        if self.emitters[emitter.slot] is emitter:
+            self.emitters[emitter.slot] = None
+            self.free_slots.append(emitter.slot)
+
+    def update(self) -> None:
+        emitters = [
+            emitter for emitter in self.emitters
+            if emitter is not None and emitter.playing
+        ]
+
+        for emitter in emitters:
+            if emitter.source is not None and not emitter._has_voice():
+                emitter.source = None
+            if not emitter.loop and \
+                    emitter._elapsed() >= emitter.sound.length_seconds():
+                emitter.stop()
+        emitters = [emitter for emitter in emitters if emitter.playing]
+
+        to_flush = []
+        if emitters:
+            slots = np.fromiter((emitter.slot for emitter in emitters),
+                                dtype=np.intp,
+                                count=len(emitters))
+            audibility, audible = self._audibility(emitters, slots)
+
+            # loudest first, so they get voices before quieter ones
+            waiting = []
+            for i, emitter in enumerate(emitters):
+                if not audible[i]:
+                    emitter._release_voice()
+                elif emitter.source is None:
+                    waiting.append(i)
+                else:
+                    emitter.source.audibility = audibility[i]
+            waiting.sort(key=lambda i: audibility[i], reverse=True)
+            for i in waiting:
+                if not emitters[i]._acquire_voice(audibility[i]):
+                    # everything after is quieter, so won't get one either
+                    break
+
+            to_flush = [
+                i for i, emitter in enumerate(emitters)
+                if emitter._has_voice()
+            ]
+            self.virtual_count = len(emitters) - len(to_flush)
+        else:
+            self.virtual_count = 0
+
+        if not to_flush and not self.listener_changed:
+            return
+        handles = [emitters[i].source.handle.value for i in to_flush]
+        flush_slots = slots[to_flush] if to_flush else []
+        listener = None
+        if self.listener_changed:
+            listener = (self.listener_position.tolist(),
+                        self.listener_velocity.tolist(),
+                        self.listener_orientation.tolist())
+            self.listener_changed = False
+        # copied so game code can carry on writing while the service
+        # thread flushes
+        _audio.service.submit(_flush_spatial, handles,
+                              self.positions[flush_slots].tolist(),
+                              self.velocities[flush_slots].tolist(), listener)
+
+    def _audibility(self, emitters: List[AudioEmitter],
+                    slots: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        distances = np.linalg.norm(self.positions[slots] -
+                                   self.listener_position,
+                                   axis=1)
+        reference = np.fromiter((emitter.reference_distance
+                                 for emitter in emitters),
+                                dtype=np.float32,
+                                count=len(emitters))
+        maximum = np.fromiter((emitter.max_distance for emitter in emitters),
+                              dtype=np.float32,
+                              count=len(emitters))
+        gain = np.fromiter((emitter.gain for emitter in emitters),
+                           dtype=np.float32,
+                           count=len(emitters))
+        # OpenAL's default inverse distance clamped model, with a rolloff
+        # of 1
+        clamped = np.clip(distances, reference, maximum)
+        audibility = gain * reference / clamped
+        return audibility, distances < maximum
+
+    def cleanup(self) -> None:
+        self.emitters.clear()
+        self.free_slots.clear()
+        self.positions = np.zeros((0, 3), dtype=np.float32)
+        self.velocities = np.zeros((0, 3), dtype=np.float32)
+        self.listener_changed = True
+
+
+def _grow(values: np.ndarray, capacity: int) -> np.ndarray:
+    grown = np.zeros((capacity, ) + values.shape[1:], dtype=values.dtype)
+    grown[:len(values)] = values
+    return grown
+
+
+def _configure_voice(handle: int, placement: Optional[tuple]) -> None:
+    # runs on the audio service thread
+    if placement is None:
+        # not positional, so keep it with the listener
+        relative = True
+        reference_distance = DEFAULT_REFERENCE_DISTANCE
+        max_distance = DEFAULT_MAX_DISTANCE
+        position = velocity = (0, 0, 0)
+    else:
+        relative = False
+        reference_distance, max_distance, position, velocity = placement
+    al.alSourcei(handle, al.AL_SOURCE_RELATIVE,
+                 al.AL_TRUE if relative else al.AL_FALSE)
+    al.alSourcef(handle, al.AL_REFERENCE_DISTANCE, reference_distance)
+    al.alSourcef(handle, al.AL_MAX_DISTANCE, max_distance)
+    al.alSource3f(handle, al.AL_POSITION, *position)
+    al.alSource3f(handle, al.AL_VELOCITY, *velocity)
 
-            buffers_processed = ct.c_int(0)
-            al.alGetSourcei(self.handle, al.AL_BUFFERS_PROCESSED,
-                            ct.byref(buffers_processed))
-            while buffers_processed.value > 0:
-                buffer_handle = ct.c_uint(0)
-                al.alSourceUnqueueBuffers(self.handle, 1,
-                                          ct.byref(buffer_handle))
-                finished = self.clip.fill_buffer(handle=buffer_handle)
-                if finished and self.looping:
-                    self.clip.seek_to_start()
-                    self.clip.fill_buffer(handle=buffer_handle)
-                elif finished and not self.looping:
-                    return
-                al.alSourceQueueBuffers(self.handle, 1,
-                                        ct.byref(buffer_handle))
-                buffers_processed.value -= 1
-            time.sleep(0.01)
+
+def _flush_spatial(handles: List[int], positions: List[List[float]],
+                   velocities: List[List[float]], listener: tuple) -> None:
+    # runs on the audio service thread
+    if listener is not None:
+        position, velocity, orientation = listener
+        al.alListener3f(al.AL_POSITION, *position)
+        al.alListener3f(al.AL_VELOCITY, *velocity)
+        al.alListenerfv(al.AL_ORIENTATION, (ct.c_float * 6)(*orientation))
+    for handle, position, velocity in zip(handles, positions, velocities):
+        al.alSource3f(handle, al.AL_POSITION, *position)
+        al.alSource3f(handle, al.AL_VELOCITY, *velocity)
+
+
+_audio = _Audio()
 
 
 def _check_err(context: str, alc: bool = False) -> None:
@@ -303,9 +1136,29 @@ def _check_err(context: str, alc: bool = False) -> None:
         raise RuntimeError(f"openal error while {context}: {err_code}")
 
 
-def init() -> None:
-    default_device = alc.alcGetString(None, alc.ALC_DEFAULT_DEVICE_SPECIFIER)
-    _audio.device = alc.alcOpenDevice(default_device)
+def init(device_name: bytes = None,
+         voice_count: int = DEFAULT_VOICE_COUNT,
+         null: bool = False) -> None:
+    """Open an audio device and start the audio service.
+
+    Args:
+        device_name (bytes): The OpenAL device to open, or None for the
+            default.
+        voice_count (int): How many sounds audio.play() can have playing at
+            once.
+        null (bool): Don't output audio or load OpenAL at all. Sounds still
+            load, but play() gives back None, sources stay silent and never
+            finish, and emitters stay virtual.
+    """
+    _audio.null = null
+    if null:
+        return
+
+    _load_openal()
+    if device_name is None:
+        device_name = alc.alcGetString(None,
+                                       alc.ALC_DEFAULT_DEVICE_SPECIFIER)
+    _audio.device = alc.alcOpenDevice(device_name)
     if not _audio.device:
         raise RuntimeError("Unable to get audio device handle")
 
@@ -314,17 +1167,183 @@ def init() -> None:
     if not alc.alcMakeContextCurrent(_audio.context):
         _check_err("making context current", True)
 
+    _audio.service.start()
+    _audio.voices.allocate(voice_count)
+
+
+def _load_openal() -> None:
+    global al, alc
+    if al is not None:
+        return
+    import openal.al as al
+    import openal.alc as alc
+
+    _AL_FORMATS.update({
+        (1, 8): al.AL_FORMAT_MONO8,
+        (2, 8): al.AL_FORMAT_STEREO8,
+        (1, 16): al.AL_FORMAT_MONO16,
+        (2, 16): al.AL_FORMAT_STEREO16
+    })
+    _AL_ERR_MAP.update({
+        al.AL_NO_ERROR: "AL_NO_ERROR",
+        al.AL_INVALID_NAME: "AL_INVALID_NAME",
+        al.AL_INVALID_ENUM: "AL_INVALID_ENUM",
+        al.AL_INVALID_VALUE: "AL_INVALID_VALUE",
+        al.AL_INVALID_OPERATION: "AL_INVALID_OPERATION",
+        al.AL_OUT_OF_MEMORY: "AL_OUT_OF_MEMORY"
+    })
+    _ALC_ERR_MAP.update({
+        alc.ALC_NO_ERROR: "ALC_NO_ERROR",
+        alc.ALC_INVALID_DEVICE: "ALC_INVALID_DEVICE",
+        alc.ALC_INVALID_CONTEXT: "ALC_INVALID_CONTEXT",
+        alc.ALC_INVALID_ENUM: "ALC_INVALID_ENUM",
+        alc.ALC_INVALID_VALUE: "ALC_INVALID_VALUE",
+        alc.ALC_OUT_OF_MEMORY: "ALC_OUT_OF_MEMORY"
+    })
+
 
 def play(sound: Union[AudioClip, AudioStream],
-         loop: bool = False) -> AudioSource:
-    source = AudioSource()
+         loop: bool = False,
+         priority: int = None,
+         max_instances: int = None,
+         gain: float = 1.0) -> Optional[AudioSource]:
+    """Play a sound on a voice from the pool.
+
+    Playing the same sound more than once in a frame gives back the voice it
+    was already started on. The voice is only the caller's until the sound
+    finishes or the voice is stolen, after which it may be playing something
+    else.
+
+    Args:
+        sound (Union[AudioClip, AudioStream]): What to play.
+        loop (bool): Whether to loop the sound.
+        priority (int): Overrides the sound's priority.
+        max_instances (int): Overrides the sound's max_instances.
+        gain (float): The volume to play at.
+
+    Returns:
+        Optional[AudioSource]: The voice playing the sound, or None if every
+            voice is playing something of a higher priority, or audio is
+            null.
+    """
+    if _audio.null:
+        return None
+    pool = _audio.voices
+    existing = pool.started_this_frame.get(id(sound))
+    if existing is not None and existing.clip is sound:
+        pool.collapsed += 1
+        if gain > existing.gain:
+            existing.set_gain(gain)
+        return existing
+
+    if priority is None:
+        priority = sound.priority
+    if max_instances is None:
+        max_instances = sound.max_instances
+    source = _play_on_voice(sound, loop, priority, max_instances, gain)
+    if source is None:
+        return None
+
+    pool.started_this_frame[id(sound)] = source
+    return source
+
+
+def set_listener(position: Sequence[float],
+                 velocity: Sequence[float] = None,
+                 forward: Sequence[float] = None,
+                 up: Sequence[float] = None) -> None:
+    """Move the listener, it's sent to OpenAL in the next update()."""
+    spatial = _audio.spatial
+    spatial.listener_position[:] = tuple(position)
+    if velocity is not None:
+        spatial.listener_velocity[:] = tuple(velocity)
+    if forward is not None:
+        spatial.listener_orientation[:3] = tuple(forward)
+    if up is not None:
+        spatial.listener_orientation[3:] = tuple(up)
+    spatial.listener_changed = True
+
+
+def update() -> None:
+    """Called once a frame by the Application, after the game has updated.
+
+    Gives voices to emitters in range of the listener and takes them from
+    those out of range, then sends every emitter's position and velocity to
+    OpenAL in one go.
+    """
+    if _audio.null:
+        return
+    _audio.voices.started_this_frame.clear()
+    _audio.spatial.update()
+
+
+def spatial_stats() -> Mapping[str, int]:
+    spatial = _audio.spatial
+    return {
+        "emitters": len(spatial.emitters) - len(spatial.free_slots),
+        "virtual": spatial.virtual_count
+    }
+
+
+def _play_on_voice(sound: BaseAudio,
+                   loop: bool,
+                   priority: int,
+                   max_instances: Optional[int],
+                   gain: float,
+                   audibility: float = None,
+                   placement: tuple = None,
+                   offset: float = 0) -> Optional[AudioSource]:
+    # placement is (reference distance, max distance, position, velocity)
+    # for an emitter, or None for a sound that stays with the listener
+    pool = _audio.voices
+    source = pool.acquire(sound, priority, max_instances, audibility)
+    if source is None:
+        return None
+
+    pool.play_count += 1
+    source.priority = priority
+    source.started_at = pool.play_count
+    source.audibility = gain if audibility is None else audibility
+    source.on_finish = None
+    if source.playing:
+        # stolen, so silence it before changing anything
+        source.stop()
+    source.set_gain(gain)
+    # the voice may have been someone else's, so it has to be set up before
+    # it starts playing or it'd start where they left it
+    _audio.service.submit(_configure_voice, source.handle.value, placement)
     if isinstance(sound, AudioClip):
-        source.play(sound, loop)
+        source.play(sound, loop, offset)
     elif isinstance(sound, AudioStream):
         source.stream(sound, loop)
     return source
 
 
+def voice_stats() -> Mapping[str, int]:
+    pool = _audio.voices
+    return {
+        "voices": len(pool.voices),
+        "in_use": sum(1 for voice in pool.voices if voice.playing),
+        "steals": pool.steals,
+        "collapsed": pool.collapsed,
+        "rejected": pool.rejected
+    }
+
+
 def cleanup() -> None:
-    alc.alcDestroyContext(_audio.context)
-    alc.alcCloseDevice(_audio.device)
\ No newline at end of file
+    _audio.spatial.cleanup()
+    if _pcm_cache.executor is not None:
+        _pcm_cache.executor.shutdown(wait=True)
+        _pcm_cache.executor = None
+    if _audio.null:
+        _audio.null = False
+        return
+
+    # queued ahead of the service stopping, so the sources get deleted
+    _audio.voices.cleanup()
+    _audio.service.stop()
+    if _audio.device is not None:
+        alc.alcDestroyContext(_audio.context)
+        alc.alcCloseDevice(_audio.device)
+        _audio.device = None
+        _audio.context = None
\ No newline at end of file
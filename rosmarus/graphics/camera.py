@@ -1,6 +1,23 @@
 import glm
 
 from ..math.transform import Transform
+from .uniform_buffer import UniformBuffer, BLOCK_BINDINGS, CAMERA_BLOCK
+
+# std140 layout of the Camera block: mat4 ViewMatrix, mat4 ProjectionMatrix
+_MAT4_SIZE = 64
+_VIEW_OFFSET = 0
+_PROJECTION_OFFSET = _MAT4_SIZE
+_CAMERA_BLOCK_SIZE = 2 * _MAT4_SIZE
+
+
+class _CameraUniforms:
+    def __init__(self) -> None:
+        self.buffer: UniformBuffer = None
+        self.view: glm.mat4 = None
+        self.projection: glm.mat4 = None
+
+
+_uniforms = _CameraUniforms()
 
 
 class Camera:
@@ -16,3 +33,32 @@ class Camera:
 
     def get_projection(self) -> glm.mat4:
         return self.projection
+
+    def upload(self) -> None:
+        """Write this camera's matrices to the shared Camera uniform block.
+
+        The block is shared by every shader that declares it, and matrices
+        are only written when they differ from what the buffer already holds,
+        so this is cheap to call before every draw.
+        """
+        if _uniforms.buffer is None:
+            _uniforms.buffer = UniformBuffer(_CAMERA_BLOCK_SIZE,
+                                             BLOCK_BINDINGS[CAMERA_BLOCK])
+
+        view = self.view_matrix()
+        if view != _uniforms.view:
+            _uniforms.buffer.set_data(_VIEW_OFFSET, _MAT4_SIZE,
+                                      glm.value_ptr(view))
+            _uniforms.view = view
+
+        projection = self.projection
+        if projection != _uniforms.projection:
+            _uniforms.buffer.set_data(_PROJECTION_OFFSET, _MAT4_SIZE,
+                                      glm.value_ptr(projection))
+            _uniforms.projection = glm.mat4(projection)
+
+
+def cleanup() -> None:
+    if _uniforms.buffer is not None:
+        _uniforms.buffer.cleanup()
+    _uniforms.__init__()
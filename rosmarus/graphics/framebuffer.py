@@ -1,43 +1,103 @@
-from dataclasses import dataclass
-from typing import List, Tuple
+from concurrent.futures import Future
+from typing import List, Tuple, Union
 
 from OpenGL import GL
 
 from .texture import Texture2D
-from .window import Window
+from .renderbuffer import Renderbuffer
 from .viewport import Viewport
+from . import gl_state
+from . import readback
+
+DEPTH_NONE = "none"
+DEPTH_TEXTURE = "texture"
+DEPTH_RENDERBUFFER = "renderbuffer"
+
+# how much capacity grows by when a resize doesn't fit, so that dragging a
+# window edge reallocates a handful of times rather than every frame
+CAPACITY_GROWTH = 1.5
 
 
 class Framebuffer:
+    """A render target, with color attachments and an optional depth buffer.
+
+    By default attachments are always exactly the framebuffer's size, and
+    resizing reallocates them. With over_allocate they get a capacity that
+    can be larger instead: resizing within the capacity costs nothing, and
+    growing past it grows the capacity geometrically. Rendering only covers
+    the size, so when sampling an attachment scale UVs by get_uv_scale().
+
+    Args:
+        width (int): The width of the framebuffer.
+        height (int): The height of the framebuffer.
+        fb_type (GL.GLenum): The framebuffer target.
+        viewport (Viewport): The viewport to push the framebuffer's size to
+            when bound.
+        color_attachments (List[Texture2D]): Textures to render to, if not
+            given a single texture of color_format is created.
+        depth_attachment (Texture2D): A depth texture to use, implies
+            DEPTH_TEXTURE.
+        depth_mode (str): DEPTH_RENDERBUFFER (the default) for a depth and
+            stencil buffer that can't be sampled, DEPTH_TEXTURE for a
+            sampleable depth texture, or DEPTH_NONE.
+        color_format (GL.GLenum): The internal format of the color texture
+            created when no color attachments are given.
+        over_allocate (bool): Whether resizing can leave the attachments
+            larger than the framebuffer, for targets that are resized often.
+    """
     def __init__(self,
                  width: int,
                  height: int,
                  fb_type: GL.GLenum,
                  viewport: Viewport,
                  color_attachments: List[Texture2D] = None,
-                 depth_attachment: Texture2D = None) -> None:
+                 depth_attachment: Texture2D = None,
+                 depth_mode: str = DEPTH_RENDERBUFFER,
+                 color_format: GL.GLenum = GL.GL_RGBA8,
+                 over_allocate: bool = False) -> None:
         self._width = width
         self._height = height
+        self._capacity = (width, height)
         self._type = fb_type
         self._handle = GL.glGenFramebuffers(1)
         self._color_attachments = []
         self._viewport = viewport
+        self.color_format = color_format
+        self.over_allocate = over_allocate
         if color_attachments is None:
-            color_attachments = [Texture2D(width, height, mipmap=False)]
+            color_attachments = [
+                Texture2D(width,
+                          height,
+                          internal_format=color_format,
+                          mipmap=False)
+            ]
+        else:
+            self._capacity = color_attachments[0].get_size()
         for color_attachment in color_attachments:
             self.add_color_attachment(color_attachment)
+
         self._depth_attachment = None
-        if depth_attachment is None:
+        if depth_attachment is not None:
+            depth_mode = DEPTH_TEXTURE
+        elif depth_mode == DEPTH_TEXTURE:
             depth_attachment = Texture2D(
-                width,
-                height,
+                *self._capacity,
                 internal_format=GL.GL_DEPTH_COMPONENT32,
                 color_format=GL.GL_DEPTH_COMPONENT,
-                data_type=GL.GL_UNSIGNED_INT)
-        self.set_depth_attachment(depth_attachment)
+                data_type=GL.GL_UNSIGNED_INT,
+                mipmap=False)
+        elif depth_mode == DEPTH_RENDERBUFFER:
+            depth_attachment = Renderbuffer(*self._capacity)
+        elif depth_mode != DEPTH_NONE:
+            raise ValueError(f"Invalid depth mode '{depth_mode}'")
+        self.depth_mode = depth_mode
+        if depth_attachment is not None:
+            self.set_depth_attachment(depth_attachment)
+
+        self._create()
 
     def _create(self) -> None:
-        self.bind()
+        previous = self._bind_for_setup()
 
         color_attachments = (GL.GLenum * len(self._color_attachments))(*[
             GL.GL_COLOR_ATTACHMENT0 + i
@@ -46,24 +106,31 @@ class Framebuffer:
         GL.glDrawBuffers(len(self._color_attachments), color_attachments)
 
         status = GL.glCheckFramebufferStatus(self._type)
+        gl_state.bind_framebuffer(self._type, previous)
         if status != GL.GL_FRAMEBUFFER_COMPLETE:
             raise RuntimeError("Error creating framebuffer")
 
-        self.unbind()
-
     def add_color_attachment(self, attachment: Texture2D) -> None:
-        self.bind()
+        previous = self._bind_for_setup()
         GL.glFramebufferTexture2D(
             self._type, GL.GL_COLOR_ATTACHMENT0 + len(self._color_attachments),
             GL.GL_TEXTURE_2D, attachment.get_handle(), 0)
-        self.unbind()
+        gl_state.bind_framebuffer(self._type, previous)
         self._color_attachments.append(attachment)
 
-    def set_depth_attachment(self, attachment: Texture2D) -> None:
-        self.bind()
-        GL.glFramebufferTexture2D(self._type, GL.GL_DEPTH_ATTACHMENT,
-                                  GL.GL_TEXTURE_2D, attachment.get_handle(), 0)
-        self.unbind()
+    def set_depth_attachment(self, attachment: Union[Texture2D,
+                                                     Renderbuffer]) -> None:
+        previous = self._bind_for_setup()
+        if isinstance(attachment, Renderbuffer):
+            GL.glFramebufferRenderbuffer(self._type,
+                                         _depth_attachment_point(attachment),
+                                         GL.GL_RENDERBUFFER,
+                                         attachment.get_handle())
+        else:
+            GL.glFramebufferTexture2D(self._type, GL.GL_DEPTH_ATTACHMENT,
+                                      GL.GL_TEXTURE_2D,
+                                      attachment.get_handle(), 0)
+        gl_state.bind_framebuffer(self._type, previous)
         self._depth_attachment = attachment
 
     def cleanup(self) -> None:
@@ -73,11 +140,27 @@ class Framebuffer:
         if self._depth_attachment is not None:
             self._depth_attachment.cleanup()
 
+        gl_state.forget_framebuffer(self._handle)
         GL.glDeleteFramebuffers(1, self._handle)
 
     def get_size(self) -> Tuple[int, int]:
         return self._width, self._height
 
+    def get_capacity(self) -> Tuple[int, int]:
+        return self._capacity
+
+    def get_uv_scale(self) -> Tuple[float, float]:
+        """Get the fraction of the attachments that has been rendered to."""
+        return (self._width / self._capacity[0],
+                self._height / self._capacity[1])
+
+    def get_memory_size(self) -> int:
+        size = sum(attachment.get_memory_size()
+                   for attachment in self._color_attachments)
+        if self._depth_attachment is not None:
+            size += self._depth_attachment.get_memory_size()
+        return size
+
     def get_handle(self) -> GL.GLuint:
         return self._handle
 
@@ -85,23 +168,69 @@ class Framebuffer:
         return self._color_attachments[index]
 
     def get_depth_texture(self) -> Texture2D:
+        """Get the depth texture, only available with DEPTH_TEXTURE."""
+        if self.depth_mode != DEPTH_TEXTURE:
+            return None
         return self._depth_attachment
 
+    def read_pixels_async(self,
+                          attachment: int = 0,
+                          region: Tuple[int, int, int, int] = None) -> Future:
+        """Read back a color attachment without stalling, see
+        readback.read_pixels().
+
+        Returns:
+            Future: Resolves to a CapturedFrame a few frames later.
+        """
+        return readback.read_pixels(self, attachment, region)
+
     def bind(self) -> None:
         self._viewport.push_screen(0, 0, self._width, self._height)
-        GL.glBindFramebuffer(self._type, self._handle)
+        gl_state.bind_framebuffer(self._type, self._handle)
 
     def unbind(self) -> None:
         self._viewport.pop_screen()
-        GL.glBindFramebuffer(self._type, 0)
+        gl_state.bind_framebuffer(self._type, 0)
 
     def resize(self, width: int, height: int) -> None:
-        # recreate all of the color attachments with the new size
+        cap_w, cap_h = self._capacity
+        if not self.over_allocate:
+            if (width, height) != (cap_w, cap_h):
+                self._reallocate(width, height)
+        elif width > cap_w or height > cap_h:
+            if width > cap_w:
+                cap_w = max(width, int(cap_w * CAPACITY_GROWTH))
+            if height > cap_h:
+                cap_h = max(height, int(cap_h * CAPACITY_GROWTH))
+            self._reallocate(cap_w, cap_h)
+
+        self._width = width
+        self._height = height
+
+    def shrink_to_fit(self) -> None:
+        """Release any capacity beyond the framebuffer's size."""
+        if self._capacity != (self._width, self._height):
+            self._reallocate(self._width, self._height)
+
+    def _reallocate(self, cap_w: int, cap_h: int) -> None:
+        # recreate all of the attachments with the new capacity
         for color_attachment in self._color_attachments:
-            color_attachment.resize(width, height)
+            color_attachment.resize(cap_w, cap_h)
 
         if self._depth_attachment is not None:
-            self._depth_attachment.resize(width, height)
+            self._depth_attachment.resize(cap_w, cap_h)
 
-        self._width = width
-        self._height = height
\ No newline at end of file
+        self._capacity = (cap_w, cap_h)
+
+    def _bind_for_setup(self) -> int:
+        # bind without touching the viewport, returning what to rebind after
+        previous = gl_state.bound_framebuffer()
+        gl_state.bind_framebuffer(self._type, self._handle)
+        return previous
+
+
+def _depth_attachment_point(attachment: Renderbuffer) -> GL.GLenum:
+    if attachment.get_internal_format() in (GL.GL_DEPTH24_STENCIL8,
+                                            GL.GL_DEPTH32F_STENCIL8):
+        return GL.GL_DEPTH_STENCIL_ATTACHMENT
+    return GL.GL_DEPTH_ATTACHMENT
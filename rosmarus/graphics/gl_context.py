@@ -1,12 +1,32 @@
 import glfw
 
+# context creation APIs, OSMESA and EGL allow creating a context without a
+# display server, e.g. on CI agents using Mesa's llvmpipe
+NATIVE = "native"
+EGL = "egl"
+OSMESA = "osmesa"
+
+CONTEXT_API_MAP = {
+    NATIVE: glfw.NATIVE_CONTEXT_API,
+    EGL: glfw.EGL_CONTEXT_API,
+    OSMESA: glfw.OSMESA_CONTEXT_API
+}
+
 
 class GLContext:
-    def __init__(self, major_version: int, minor_version: int) -> None:
+    def __init__(self,
+                 major_version: int,
+                 minor_version: int,
+                 creation_api: str = NATIVE) -> None:
+        if creation_api not in CONTEXT_API_MAP:
+            raise ValueError(f"Invalid context creation API '{creation_api}'")
         self.major_version = major_version
         self.minor_version = minor_version
+        self.creation_api = creation_api
 
     def bind(self) -> None:
         glfw.window_hint(glfw.CONTEXT_VERSION_MAJOR, self.major_version)
         glfw.window_hint(glfw.CONTEXT_VERSION_MINOR, self.minor_version)
         glfw.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_CORE_PROFILE)
+        glfw.window_hint(glfw.CONTEXT_CREATION_API,
+                         CONTEXT_API_MAP[self.creation_api])
@@ -0,0 +1,202 @@
+from __future__ import annotations
+from typing import Dict, Mapping, Tuple
+
+from OpenGL import GL
+
+
+class _GLState:
+    def __init__(self) -> None:
+        self.program = None
+        self.active_unit = None
+        self.textures: Dict[Tuple[int, int], int] = {}
+        self.vertex_array = None
+        self.draw_framebuffer = None
+        self.read_framebuffer = None
+        self.viewport = None
+        self.capabilities: Dict[int, bool] = {}
+        self.blend_func = None
+        self.depth_mask = None
+        self.uniforms: Dict[Tuple[int, int], object] = {}
+        self.issued = 0
+        self.skipped = 0
+        self.last_frame = {"issued": 0, "skipped": 0}
+
+
+_state = _GLState()
+
+
+def reset() -> None:
+    """Forget all cached state.
+
+    Call this whenever the context changes, or after anything outside of this
+    module has touched the GL state, so that the next call of each kind is
+    always issued.
+    """
+    counters = (_state.issued, _state.skipped, _state.last_frame)
+    _state.__init__()
+    _state.issued, _state.skipped, _state.last_frame = counters
+
+
+def end_frame() -> None:
+    _state.last_frame = {"issued": _state.issued, "skipped": _state.skipped}
+    _state.issued = 0
+    _state.skipped = 0
+
+
+def frame_counters() -> Mapping[str, int]:
+    """Get how many GL state calls were issued and skipped last frame."""
+    return dict(_state.last_frame)
+
+
+def use_program(program: int) -> None:
+    if _state.program == program:
+        _state.skipped += 1
+        return
+    GL.glUseProgram(program)
+    _state.program = program
+    _state.issued += 1
+
+
+def bind_texture(texture: int,
+                 unit: int = 0,
+                 target: GL.GLenum = GL.GL_TEXTURE_2D) -> None:
+    # texture calls act on the active unit, so select it even when the
+    # texture is already bound to it
+    _active_texture(unit)
+    if _state.textures.get((unit, target)) == texture:
+        _state.skipped += 1
+        return
+    GL.glBindTexture(target, texture)
+    _state.textures[(unit, target)] = texture
+    _state.issued += 1
+
+
+def bind_vertex_array(vertex_array: int) -> None:
+    if _state.vertex_array == vertex_array:
+        _state.skipped += 1
+        return
+    GL.glBindVertexArray(vertex_array)
+    _state.vertex_array = vertex_array
+    _state.issued += 1
+
+
+def bind_framebuffer(target: GL.GLenum, framebuffer: int) -> None:
+    draw = target in (GL.GL_FRAMEBUFFER, GL.GL_DRAW_FRAMEBUFFER)
+    read = target in (GL.GL_FRAMEBUFFER, GL.GL_READ_FRAMEBUFFER)
+    if (not draw or _state.draw_framebuffer == framebuffer) and (
+            not read or _state.read_framebuffer == framebuffer):
+        _state.skipped += 1
+        return
+    GL.glBindFramebuffer(target, framebuffer)
+    if draw:
+        _state.draw_framebuffer = framebuffer
+    if read:
+        _state.read_framebuffer = framebuffer
+    _state.issued += 1
+
+
+def bound_framebuffer() -> int:
+    """Get the bound draw framebuffer, assuming the default if unknown."""
+    return _state.draw_framebuffer or 0
+
+
+def viewport(x: int, y: int, w: int, h: int) -> None:
+    rect = (x, y, w, h)
+    if _state.viewport == rect:
+        _state.skipped += 1
+        return
+    GL.glViewport(x, y, w, h)
+    _state.viewport = rect
+    _state.issued += 1
+
+
+def set_capability(capability: GL.GLenum, enabled: bool) -> None:
+    if _state.capabilities.get(capability) == enabled:
+        _state.skipped += 1
+        return
+    if enabled:
+        GL.glEnable(capability)
+    else:
+        GL.glDisable(capability)
+    _state.capabilities[capability] = enabled
+    _state.issued += 1
+
+
+def enable(capability: GL.GLenum) -> None:
+    set_capability(capability, True)
+
+
+def disable(capability: GL.GLenum) -> None:
+    set_capability(capability, False)
+
+
+def blend_func(source: GL.GLenum, destination: GL.GLenum) -> None:
+    if _state.blend_func == (source, destination):
+        _state.skipped += 1
+        return
+    GL.glBlendFunc(source, destination)
+    _state.blend_func = (source, destination)
+    _state.issued += 1
+
+
+def depth_mask(enabled: bool) -> None:
+    if _state.depth_mask == enabled:
+        _state.skipped += 1
+        return
+    GL.glDepthMask(enabled)
+    _state.depth_mask = enabled
+    _state.issued += 1
+
+
+def uniform_changed(program: int, location: int, value: object) -> bool:
+    """Check whether a uniform needs uploading, and remember the new value.
+
+    Uniform values are per-program state, so a value only needs setting again
+    when it differs from what was last uploaded to that program.
+
+    Returns:
+        bool: True if the caller should upload the value.
+    """
+    key = (program, location)
+    if key in _state.uniforms and _state.uniforms[key] == value:
+        _state.skipped += 1
+        return False
+    # copy it, as glm types are mutable and may be changed after this call
+    _state.uniforms[key] = type(value)(value)
+    _state.issued += 1
+    return True
+
+
+def forget_program(program: int) -> None:
+    # deleted names can be reused by GL, so drop anything cached against them
+    if _state.program == program:
+        _state.program = None
+    for key in [key for key in _state.uniforms if key[0] == program]:
+        del _state.uniforms[key]
+
+
+def forget_texture(texture: int) -> None:
+    for key in [
+            key for key, bound in _state.textures.items() if bound == texture
+    ]:
+        del _state.textures[key]
+
+
+def forget_vertex_array(vertex_array: int) -> None:
+    if _state.vertex_array == vertex_array:
+        _state.vertex_array = None
+
+
+def forget_framebuffer(framebuffer: int) -> None:
+    if _state.draw_framebuffer == framebuffer:
+        _state.draw_framebuffer = None
+    if _state.read_framebuffer == framebuffer:
+        _state.read_framebuffer = None
+
+
+def _active_texture(unit: int) -> None:
+    if _state.active_unit == unit:
+        return
+    GL.glActiveTexture(GL.GL_TEXTURE0 + unit)
+    _state.active_unit = unit
+    _state.issued += 1
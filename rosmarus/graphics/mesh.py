@@ -1,54 +1,108 @@
 from ctypes import *
-from typing import List, Tuple
+from typing import Sequence, Tuple, Union
 
 from OpenGL import GL
 import glm
+import numpy as np
 
-from .vertex import Vertex
+from .vertex import Vertex, VERTEX_DTYPE, VERTEX_FLOATS
+from . import gl_state
+
+# 16-bit indices can address this many vertices
+_MAX_SHORT_INDEXED_VERTICES = 1 << 16
 
 
 class Mesh:
+    """Indexed triangles in a VAO.
+
+    Vertices can be a sequence of Vertex, or any buffer-protocol object
+    (NumPy arrays, array.array, memoryview, ctypes arrays) laid out like
+    Vertex. Indices can be a sequence of ints or any buffer-protocol object
+    of unsigned integers. Buffers already in the right format are uploaded
+    without being copied, other numeric arrays like an (n, 13) float64 array
+    are converted to float32, and indices are stored as 16-bit whenever
+    there are few enough vertices.
+    """
     def __init__(self,
-                 verts: List[Vertex],
-                 indices: List[int],
+                 verts: Union[Sequence[Vertex], memoryview],
+                 indices: Union[Sequence[int], memoryview],
                  usage: GL.GLenum = GL.GL_STATIC_DRAW) -> None:
         self.has_data = False
         self.usage = usage
         self.set_data(verts, indices)
 
-    def get_data(self) -> Tuple[POINTER(Vertex), POINTER(c_uint32)]:
+    def get_data(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Get the vertex and index data, as arrays that can be edited in
+        place and sent to the GPU with reupload_data().
+
+        The vertex array has the VERTEX_DTYPE structured dtype.
+        """
         return self.vertices, self.indices
 
-    def reupload_data(self) -> None:
+    def reupload_data(self,
+                      vertex_count: int = None,
+                      index_count: int = None) -> None:
+        """Upload edited data to the GPU.
+
+        Args:
+            vertex_count (int): Only upload this many vertices from the
+                start, defaults to all of them.
+            index_count (int): Only upload this many indices from the start,
+                defaults to all of them.
+        """
+        if vertex_count is None:
+            vertex_count = len(self.vertices)
+        if index_count is None:
+            index_count = len(self.indices)
+
+        # the element buffer binding belongs to the VAO, so ours has to be
+        # bound to avoid clobbering whichever one was bound last
+        self.bind()
+        if vertex_count > 0:
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.vbo)
+            GL.glBufferSubData(GL.GL_ARRAY_BUFFER, 0,
+                               vertex_count * self.vertices.itemsize,
+                               c_void_p(self.vertices.ctypes.data))
+        if index_count > 0:
+            GL.glBufferSubData(GL.GL_ELEMENT_ARRAY_BUFFER, 0,
+                               index_count * self.indices.itemsize,
+                               c_void_p(self.indices.ctypes.data))
+
+    def reupload_vertices(self, start: int, count: int) -> None:
+        """Upload a range of edited vertices to the GPU."""
         GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.vbo)
-        GL.glBufferSubData(GL.GL_ARRAY_BUFFER, 0, sizeof(self.vertices),
-                           byref(self.vertices))
-        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
-        GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, self.ebo)
-        GL.glBufferSubData(GL.GL_ELEMENT_ARRAY_BUFFER, 0, sizeof(self.indices),
-                           byref(self.indices))
-        GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, 0)
-
-    def set_data(self, verts: List[Vertex], indices: List[int]) -> None:
+        GL.glBufferSubData(
+            GL.GL_ARRAY_BUFFER, start * self.vertices.itemsize,
+            count * self.vertices.itemsize,
+            c_void_p(self.vertices.ctypes.data +
+                     start * self.vertices.itemsize))
+
+    def set_data(self, verts: Union[Sequence[Vertex], memoryview],
+                 indices: Union[Sequence[int], memoryview]) -> None:
         if self.has_data:
             self.cleanup()
 
+        self.vertices = _as_vertex_array(verts)
+        self.indices = _as_index_array(indices, len(self.vertices))
+        self.index_type = GL.GL_UNSIGNED_SHORT \
+            if self.indices.dtype == np.uint16 else GL.GL_UNSIGNED_INT
+
         self.vao = GL.glGenVertexArrays(1)
-        GL.glBindVertexArray(self.vao)
+        # the per-instance buffer this VAO's instance attributes are set up
+        # for, if any (see RenderQueue)
+        self.instance_buffer = None
+        self.bind()
 
         self.vbo = GL.glGenBuffers(1)
         self.ebo = GL.glGenBuffers(1)
 
-        self.vertices = (Vertex * len(verts))(*verts)
-        self.indices = (c_uint32 * len(indices))(*indices)
-
         GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.vbo)
-        GL.glBufferData(GL.GL_ARRAY_BUFFER, sizeof(self.vertices),
-                        byref(self.vertices), self.usage)
+        GL.glBufferData(GL.GL_ARRAY_BUFFER, self.vertices.nbytes,
+                        c_void_p(self.vertices.ctypes.data), self.usage)
 
         GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, self.ebo)
-        GL.glBufferData(GL.GL_ELEMENT_ARRAY_BUFFER, sizeof(self.indices),
-                        byref(self.indices), self.usage)
+        GL.glBufferData(GL.GL_ELEMENT_ARRAY_BUFFER, self.indices.nbytes,
+                        c_void_p(self.indices.ctypes.data), self.usage)
 
         # position
         GL.glEnableVertexAttribArray(0)
@@ -71,29 +125,97 @@ class Mesh:
         GL.glVertexAttribPointer(3, 4, GL.GL_FLOAT, GL.GL_FALSE,
                                  sizeof(Vertex), c_void_p(Vertex.color.offset))
 
-        GL.glBindVertexArray(0)
-
         self.has_data = True
 
     def bind(self) -> None:
-        GL.glBindVertexArray(self.vao)
+        gl_state.bind_vertex_array(self.vao)
 
     def unbind(self) -> None:
-        GL.glBindVertexArray(0)
+        gl_state.bind_vertex_array(0)
 
     def render(self, elements: int = -1) -> None:
         self.bind()
         if elements == -1:
             elements = len(self.indices)
-        GL.glDrawElements(GL.GL_TRIANGLES, elements, GL.GL_UNSIGNED_INT, None)
-        self.unbind()
+        GL.glDrawElements(GL.GL_TRIANGLES, elements, self.index_type, None)
 
     def cleanup(self) -> None:
+        gl_state.forget_vertex_array(self.vao)
         GL.glDeleteBuffers(1, self.vbo)
         GL.glDeleteBuffers(1, self.ebo)
         GL.glDeleteVertexArrays(1, self.vao)
 
 
+def _as_vertex_array(
+        verts: Union[Sequence[Vertex], memoryview]) -> np.ndarray:
+    if isinstance(verts, np.ndarray):
+        data = verts
+    else:
+        try:
+            view = memoryview(verts)
+        except TypeError:
+            # not a buffer, so it should be a sequence of Vertex
+            return np.frombuffer((Vertex * len(verts))(*verts),
+                                 dtype=VERTEX_DTYPE)
+        if len(view.format.lstrip("@=<>!")) == 1:
+            # a plain buffer of numbers, like array.array
+            data = np.asarray(view)
+        else:
+            # a buffer of structs, like a ctypes array, so use the bytes
+            data = np.frombuffer(view, dtype=np.uint8)
+
+    if data.dtype == VERTEX_DTYPE:
+        return np.ascontiguousarray(data).reshape(-1)
+
+    if data.dtype.names is not None:
+        # another structured dtype, which has to be laid out like Vertex
+        if data.dtype.itemsize != VERTEX_DTYPE.itemsize:
+            raise ValueError(
+                f"Vertex dtype of {data.dtype.itemsize} bytes does not fit "
+                f"{VERTEX_DTYPE.itemsize} byte vertices")
+    elif data.dtype.itemsize == 1:
+        # raw bytes, which have to hold a whole number of vertices
+        if data.nbytes % VERTEX_DTYPE.itemsize != 0:
+            raise ValueError(
+                f"Vertex data of {data.nbytes} bytes is not a whole number "
+                f"of {VERTEX_DTYPE.itemsize} byte vertices")
+    else:
+        # numbers, which are converted to float32 rather than reinterpreted
+        # so that an (n, 13) float64 array still gives n vertices
+        if data.ndim > 1 and data.shape[-1] != VERTEX_FLOATS:
+            raise ValueError(
+                f"Vertex data has {data.shape[-1]} values per vertex, "
+                f"expected {VERTEX_FLOATS}")
+        if data.size % VERTEX_FLOATS != 0:
+            raise ValueError(
+                f"Vertex data of {data.size} values is not a whole number "
+                f"of {VERTEX_FLOATS} value vertices")
+        data = np.ascontiguousarray(data, dtype=np.float32)
+
+    data = np.ascontiguousarray(data)
+    return data.reshape(-1).view(VERTEX_DTYPE)
+
+
+def _as_index_array(indices: Union[Sequence[int], memoryview],
+                    vertex_count: int) -> np.ndarray:
+    index_dtype = np.uint16 if vertex_count <= _MAX_SHORT_INDEXED_VERTICES \
+        else np.uint32
+    data = np.asarray(indices)
+    if data.size > 0:
+        if data.dtype.kind not in "ui":
+            raise ValueError(
+                f"Index data must be integers, not {data.dtype}")
+        # check before narrowing, which would silently wrap bad indices
+        # into valid looking ones
+        if data.min() < 0 or data.max() >= vertex_count:
+            raise ValueError(
+                f"Indices must be between 0 and {vertex_count - 1}, got "
+                f"{data.min()} to {data.max()}")
+    if data.dtype != index_dtype:
+        data = data.astype(index_dtype)
+    return np.ascontiguousarray(data).reshape(-1)
+
+
 def make_quad(scale: int = 1) -> Mesh:
     return Mesh([
         Vertex(glm.vec4(-1 * scale, -1 * scale, -1, 1), uv=glm.vec2(0, 0)),
@@ -0,0 +1,233 @@
+from dataclasses import dataclass, field
+import re
+from typing import Dict, List, Tuple
+
+from OpenGL import GL
+import glm
+
+from .framebuffer import Framebuffer
+from .render_target_pool import RenderTargetPool
+from .shader import Shader
+from .upscale_surface import UpscaleSurface, _VERTEX_SHADER
+from .viewport import Viewport
+from . import gl_state
+from .. import profiler
+
+_APPLY_PATTERN = re.compile(r"\bapply\b")
+
+_FRAGMENT_HEADER = """#version 330 core
+
+out vec4 out_FragColor;
+
+in vec2 TexCoords;
+in vec2 ScreenCoords;
+
+uniform sampler2D FramebufferTexture;
+uniform vec2 TexelSize;
+"""
+
+
+@dataclass
+class PostProcessPass:
+    """A full-screen effect in a PostProcessChain.
+
+    The source is GLSL defining a function called 'apply', along with any
+    uniforms it needs. A per-pixel pass only looks at the pixel it's given:
+
+        vec4 apply(vec4 color, vec2 uv)
+
+    where uv goes from 0 to 1 across the screen. Passes that need to sample
+    other pixels (blurs, distortion) set per_pixel to False and instead get
+    the result of the previous pass as a texture:
+
+        vec4 apply(sampler2D image, vec2 uv)
+
+    where uv is the coordinate of the pixel in the image, and the TexelSize
+    uniform is the size of one of its texels in UV space.
+
+    Per-pixel passes get fused into the pass before them, so uniforms and
+    helper functions need names that are unique within a chain.
+    """
+    name: str
+    source: str
+    per_pixel: bool = True
+    enabled: bool = True
+    uniforms: Dict[str, object] = field(default_factory=dict)
+
+
+class PostProcessChain(UpscaleSurface):
+    """An UpscaleSurface that applies a chain of effects when rendered.
+
+    Enabled passes are grouped so that each group starts with a pass that
+    samples neighbouring pixels (or the start of the chain) followed by any
+    number of per-pixel passes, and each group is compiled into one shader.
+    Every group but the last renders into one of two ping-pong targets from
+    a RenderTargetPool, and the last renders straight to the screen, so a
+    chain of only per-pixel effects costs a single full-screen pass, no more
+    than the plain UpscaleSurface.
+
+    Args:
+        width (int): The width of the surface.
+        height (int): The height of the surface.
+        viewport (Viewport): The viewport being upscaled to.
+        passes (List[PostProcessPass]): The passes, in the order to apply
+            them.
+        pool (RenderTargetPool): Where to get ping-pong targets from, if not
+            given the chain makes its own.
+    """
+    def __init__(self,
+                 width: int,
+                 height: int,
+                 viewport: Viewport,
+                 passes: List[PostProcessPass] = None,
+                 pool: RenderTargetPool = None) -> None:
+        super().__init__(width, height, viewport)
+        self.passes: List[PostProcessPass] = list(passes or [])
+        self._owns_pool = pool is None
+        self.pool = RenderTargetPool(viewport) if pool is None else pool
+        self._shaders: Dict[Tuple[str, ...], Shader] = {}
+        self.full_screen_passes = 0
+
+    def add_pass(self, post_pass: PostProcessPass) -> PostProcessPass:
+        if self.get_pass(post_pass.name) is not None:
+            raise ValueError(
+                f"Post-process pass '{post_pass.name}' already exists")
+        self.passes.append(post_pass)
+        return post_pass
+
+    def get_pass(self, name: str) -> PostProcessPass:
+        for post_pass in self.passes:
+            if post_pass.name == name:
+                return post_pass
+        return None
+
+    def set_enabled(self, name: str, enabled: bool) -> None:
+        self.get_pass(name).enabled = enabled
+
+    def render(self) -> None:
+        groups = _group_passes(self.passes)
+        if not groups:
+            super().render()
+            self.full_screen_passes = 1
+            return
+
+        with profiler.zone("PostProcessChain.render", gpu=True):
+            gl_state.disable(GL.GL_DEPTH_TEST)
+            width, height = self.framebuffer.get_size()
+            source = self.framebuffer
+            for group in groups[:-1]:
+                target = self.pool.acquire(width, height,
+                                           self.framebuffer.color_format)
+                target.bind()
+                self._draw_group(group, source)
+                target.unbind()
+                # only ever hold two targets: the one just drawn becomes the
+                # source, and the old source goes back to be drawn into next
+                if source is not self.framebuffer:
+                    self.pool.release(source)
+                source = target
+
+            self.framebuffer._viewport.clear_viewport()
+            self._draw_group(groups[-1], source)
+            if source is not self.framebuffer:
+                self.pool.release(source)
+            gl_state.enable(GL.GL_DEPTH_TEST)
+        self.full_screen_passes = len(groups)
+
+    def cleanup(self) -> None:
+        for shader in self._shaders.values():
+            shader.cleanup()
+        self._shaders.clear()
+        if self._owns_pool:
+            self.pool.cleanup()
+        super().cleanup()
+
+    def _draw_group(self, group: List[PostProcessPass],
+                    source: Framebuffer) -> None:
+        shader = self._get_group_shader(group)
+        shader.bind()
+        shader.set_vec2("UVScale", glm.vec2(*source.get_uv_scale()))
+        capacity_w, capacity_h = source.get_capacity()
+        shader.set_vec2("TexelSize",
+                        glm.vec2(1 / capacity_w, 1 / capacity_h))
+        for post_pass in group:
+            for name, value in post_pass.uniforms.items():
+                _set_uniform(shader, name, value)
+        source.get_texture(0).bind()
+        self.quad_mesh.render()
+
+    def _get_group_shader(self, group: List[PostProcessPass]) -> Shader:
+        key = tuple(post_pass.name for post_pass in group)
+        shader = self._shaders.get(key)
+        if shader is None:
+            shader = Shader(f"_postprocess[{'+'.join(key)}]", {
+                "vertex": _VERTEX_SHADER,
+                "fragment": generate_fragment_shader(group)
+            })
+            self._shaders[key] = shader
+        return shader
+
+
+def generate_fragment_shader(group: List[PostProcessPass]) -> str:
+    """Generate the fragment shader that applies a group of passes.
+
+    Only the first pass in the group can sample the image, the rest have to
+    be per-pixel.
+    """
+    functions = []
+    body = []
+    for i, post_pass in enumerate(group):
+        function = f"pass{i}_apply"
+        functions.append(f"// {post_pass.name}\n" +
+                         _APPLY_PATTERN.sub(function, post_pass.source))
+        if post_pass.per_pixel:
+            if i == 0:
+                body.append(
+                    "    vec4 color = texture(FramebufferTexture, TexCoords);")
+            body.append(f"    color = {function}(color, ScreenCoords);")
+        elif i == 0:
+            body.append(
+                f"    vec4 color = {function}(FramebufferTexture, TexCoords);")
+        else:
+            raise ValueError(
+                f"Post-process pass '{post_pass.name}' samples the image, so "
+                "can't be fused into another pass")
+
+    return "\n".join([_FRAGMENT_HEADER] + functions +
+                     ["void main()", "{"] + body +
+                     ["    out_FragColor = color;", "}", ""])
+
+
+def _group_passes(
+        passes: List[PostProcessPass]) -> List[List[PostProcessPass]]:
+    groups = []
+    for post_pass in passes:
+        if not post_pass.enabled:
+            continue
+        if groups and post_pass.per_pixel:
+            groups[-1].append(post_pass)
+        else:
+            groups.append([post_pass])
+    return groups
+
+
+def _set_uniform(shader: Shader, name: str, value: object) -> None:
+    if isinstance(value, bool):
+        shader.set_bool(name, value)
+    elif isinstance(value, int):
+        shader.set_int(name, value)
+    elif isinstance(value, float):
+        shader.set_float(name, value)
+    elif isinstance(value, glm.vec2):
+        shader.set_vec2(name, value)
+    elif isinstance(value, glm.vec3):
+        shader.set_vec3(name, value)
+    elif isinstance(value, glm.vec4):
+        shader.set_vec4(name, value)
+    elif isinstance(value, glm.mat3):
+        shader.set_mat3(name, value)
+    elif isinstance(value, glm.mat4):
+        shader.set_mat4(name, value)
+    else:
+        raise TypeError(
+            f"Unsupported type {type(value).__name__} for uniform '{name}'")
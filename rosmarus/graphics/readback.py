@@ -0,0 +1,326 @@
+"""Reading pixels back from the GPU without stalling the pipeline.
+
+glReadPixels normally waits for everything drawn so far to finish before
+returning. Instead, read_pixels() copies into one of a ring of pixel-pack
+buffers and drops a fence after it, and update() (called every frame by the
+Application) resolves the request once the fence has signalled, usually a
+couple of frames later. Encoding what was read happens on worker threads,
+so capturing every frame doesn't cost frame time.
+"""
+from __future__ import annotations
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import ctypes
+from dataclasses import dataclass
+from typing import BinaryIO, List, Optional, Tuple, Union, TYPE_CHECKING
+
+import numpy as np
+from OpenGL import GL
+from PIL import Image
+
+from . import gl_state
+
+if TYPE_CHECKING:
+    from .framebuffer import Framebuffer
+
+# how many reads can be in flight at once, if another is requested the oldest
+# is waited on, which only happens when reading faster than the GPU can go
+RING_SIZE = 4
+
+MAX_ENCODE_WORKERS = 2
+
+
+@dataclass
+class CapturedFrame:
+    """Pixels read back from a framebuffer, as tightly packed RGBA8 rows
+    from the bottom of the image up."""
+    width: int
+    height: int
+    data: bytes
+
+    def to_image(self) -> Image.Image:
+        image = Image.frombytes("RGBA", (self.width, self.height), self.data)
+        return image.transpose(Image.FLIP_TOP_BOTTOM)
+
+
+class _PixelPackBuffer:
+    def __init__(self) -> None:
+        self.handle = GL.glGenBuffers(1)
+        self.capacity = 0
+        self.fence = None
+        # whether the commands before the fence have been flushed to the
+        # GPU, otherwise without a swap the fence might never signal
+        self.flushed = False
+        self.size = None
+        self.future: Optional[Future] = None
+
+    def reserve(self, byte_size: int) -> None:
+        if byte_size <= self.capacity:
+            return
+        GL.glBufferData(GL.GL_PIXEL_PACK_BUFFER, byte_size, None,
+                        GL.GL_STREAM_READ)
+        self.capacity = byte_size
+
+
+class _Readback:
+    def __init__(self) -> None:
+        self.ring: List[_PixelPackBuffer] = []
+        # indices into the ring of in flight reads, oldest first
+        self.in_flight: List[int] = []
+        self.next_buffer = 0
+        self.executor = None
+        self.stalls = 0
+
+
+_readback = _Readback()
+
+
+def read_pixels(framebuffer: Framebuffer = None,
+                attachment: int = 0,
+                region: Tuple[int, int, int, int] = None) -> Future:
+    """Start reading pixels back from a framebuffer.
+
+    Args:
+        framebuffer (Framebuffer): What to read from, or None for the
+            window's back buffer, which must then be read before swapping.
+        attachment (int): The color attachment to read.
+        region (Tuple[int, int, int, int]): The (x, y, w, h) to read, which
+            defaults to the whole framebuffer and is required for the back
+            buffer.
+
+    Returns:
+        Future: Resolves to a CapturedFrame on the main thread, in update().
+    """
+    if region is None:
+        if framebuffer is None:
+            raise ValueError("A region is needed to read the back buffer")
+        region = (0, 0, *framebuffer.get_size())
+    x, y, width, height = region
+
+    if len(_readback.in_flight) == len(_readback.ring):
+        if len(_readback.ring) < RING_SIZE:
+            _readback.ring.append(_PixelPackBuffer())
+        else:
+            # every buffer is busy, so there's nothing for it but to wait
+            _readback.stalls += 1
+            _complete(_readback.in_flight[0], wait=True)
+
+    index = _next_free_buffer()
+    pbo = _readback.ring[index]
+
+    if framebuffer is None:
+        gl_state.bind_framebuffer(GL.GL_READ_FRAMEBUFFER, 0)
+        GL.glReadBuffer(GL.GL_BACK)
+    else:
+        gl_state.bind_framebuffer(GL.GL_READ_FRAMEBUFFER,
+                                  framebuffer.get_handle())
+        GL.glReadBuffer(GL.GL_COLOR_ATTACHMENT0 + attachment)
+
+    GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, pbo.handle)
+    pbo.reserve(width * height * 4)
+    GL.glPixelStorei(GL.GL_PACK_ALIGNMENT, 1)
+    # with a pack buffer bound the pointer is an offset into it, and the
+    # call returns without waiting for the pixels
+    GL.glReadPixels(x, y, width, height, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE,
+                    ctypes.c_void_p(0))
+    GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+
+    pbo.fence = GL.glFenceSync(GL.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+    pbo.flushed = False
+    pbo.size = (width, height)
+    pbo.future = Future()
+    _readback.in_flight.append(index)
+    return pbo.future
+
+
+def update() -> int:
+    """Resolve any reads that the GPU has finished.
+
+    Returns:
+        int: How many reads were resolved.
+    """
+    completed = 0
+    while _readback.in_flight:
+        if not _complete(_readback.in_flight[0], wait=False):
+            break
+        completed += 1
+    return completed
+
+
+def finish() -> None:
+    """Wait for every in flight read and resolve them, for when results are
+    needed right away, like in tests."""
+    while _readback.in_flight:
+        _complete(_readback.in_flight[0], wait=True)
+
+
+def pending_count() -> int:
+    return len(_readback.in_flight)
+
+
+def stall_count() -> int:
+    """How many times a read had to wait because the ring was full."""
+    return _readback.stalls
+
+
+def save_png(frame: Union[CapturedFrame, Future], path: str) -> Future:
+    """Encode a captured frame to a PNG on a worker thread.
+
+    Args:
+        frame (Union[CapturedFrame, Future]): The frame, or the future from
+            read_pixels() that will resolve to it.
+        path (str): Where to save the PNG.
+
+    Returns:
+        Future: Resolves to the path once the file is written.
+    """
+    return _then_encode(frame, _encode_png, path)
+
+
+class RawVideoSink:
+    """Writes captured frames to a stream as raw RGBA8, top row first.
+
+    Frames are written in the order they're given, on a thread of their own,
+    so the stream can be a file or a pipe into an encoder, for example:
+
+        ffmpeg -f rawvideo -pix_fmt rgba -s 1280x720 -r 60 -i - out.mp4
+
+    Args:
+        stream (BinaryIO): Where to write the frames.
+    """
+    def __init__(self, stream: BinaryIO) -> None:
+        self.stream = stream
+        self.frames_written = 0
+        # a single worker keeps the frames in order
+        self._executor = ThreadPoolExecutor(max_workers=1,
+                                            thread_name_prefix="video_sink")
+        self._pending = set()
+
+    def write(self, frame: Union[CapturedFrame, Future]) -> Future:
+        """Queue a frame, or a future from read_pixels(), to be written."""
+        written = _then_encode(frame, self._write_frame,
+                               executor=self._executor)
+        self._pending.add(written)
+        written.add_done_callback(self._pending.discard)
+        return written
+
+    def close(self) -> None:
+        """Wait for every queued frame to be written, including frames
+        still being read back. Must be called on the main thread."""
+        # frames still being read only get handed over in update(), so
+        # resolve them here or they'd be submitted after the shutdown
+        finish()
+        wait(list(self._pending))
+        self._executor.shutdown(wait=True)
+        self.stream.flush()
+
+    def _write_frame(self, frame: CapturedFrame) -> int:
+        self.stream.write(_flip_rows(frame))
+        self.frames_written += 1
+        return self.frames_written
+
+
+def cleanup() -> None:
+    for pbo in _readback.ring:
+        if pbo.fence is not None:
+            GL.glDeleteSync(pbo.fence)
+        if pbo.future is not None:
+            pbo.future.cancel()
+        GL.glDeleteBuffers(1, [pbo.handle])
+    _readback.ring.clear()
+    _readback.in_flight.clear()
+    _readback.next_buffer = 0
+    if _readback.executor is not None:
+        _readback.executor.shutdown(wait=True)
+        _readback.executor = None
+
+
+def _next_free_buffer() -> int:
+    ring_size = len(_readback.ring)
+    for offset in range(ring_size):
+        index = (_readback.next_buffer + offset) % ring_size
+        if index not in _readback.in_flight:
+            _readback.next_buffer = (index + 1) % ring_size
+            return index
+    raise RuntimeError("No free pixel pack buffer")
+
+
+def _complete(index: int, wait: bool) -> bool:
+    pbo = _readback.ring[index]
+    timeout = GL.GL_TIMEOUT_IGNORED if wait else 0
+    flags = GL.GL_SYNC_FLUSH_COMMANDS_BIT \
+        if wait or not pbo.flushed else 0
+    pbo.flushed = True
+    result = GL.glClientWaitSync(pbo.fence, flags, timeout)
+    if result not in (GL.GL_ALREADY_SIGNALED, GL.GL_CONDITION_SATISFIED):
+        return False
+
+    width, height = pbo.size
+    byte_size = width * height * 4
+    GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, pbo.handle)
+    pointer = GL.glMapBufferRange(GL.GL_PIXEL_PACK_BUFFER, 0, byte_size,
+                                  GL.GL_MAP_READ_BIT)
+    data = ctypes.string_at(pointer, byte_size)
+    GL.glUnmapBuffer(GL.GL_PIXEL_PACK_BUFFER)
+    GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+
+    GL.glDeleteSync(pbo.fence)
+    future = pbo.future
+    pbo.fence = None
+    pbo.future = None
+    _readback.in_flight.remove(index)
+    future.set_result(CapturedFrame(width, height, data))
+    return True
+
+
+def _then_encode(frame: Union[CapturedFrame, Future],
+                 encoder,
+                 *args,
+                 executor: ThreadPoolExecutor = None) -> Future:
+    if executor is None:
+        executor = _get_executor()
+    result = Future()
+
+    def submit(frame: CapturedFrame) -> None:
+        encoded = executor.submit(encoder, frame, *args)
+        encoded.add_done_callback(lambda done: _copy_result(done, result))
+
+    def on_read(done: Future) -> None:
+        if done.cancelled():
+            result.cancel()
+        else:
+            submit(done.result())
+
+    if isinstance(frame, CapturedFrame):
+        submit(frame)
+    else:
+        frame.add_done_callback(on_read)
+    return result
+
+
+def _copy_result(source: Future, target: Future) -> None:
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+def _encode_png(frame: CapturedFrame, path: str) -> str:
+    # runs on a worker thread
+    frame.to_image().save(path, "PNG")
+    return path
+
+
+def _flip_rows(frame: CapturedFrame) -> bytes:
+    rows = np.frombuffer(frame.data, dtype=np.uint8).reshape(
+        frame.height, frame.width * 4)
+    return rows[::-1].tobytes()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    if _readback.executor is None:
+        _readback.executor = ThreadPoolExecutor(
+            max_workers=MAX_ENCODE_WORKERS,
+            thread_name_prefix="readback_encode")
+    return _readback.executor
@@ -0,0 +1,120 @@
+from typing import Dict, List, Tuple
+
+from OpenGL import GL
+
+from .framebuffer import Framebuffer, DEPTH_NONE
+from .viewport import Viewport
+
+
+class RenderTargetPool:
+    """Hands out Framebuffers for temporary rendering, reusing released ones.
+
+    Framebuffers are matched by color format and depth mode, and any free one
+    with enough capacity is reused and resized to fit. They're allocated with
+    over_allocate, so sample them with their get_uv_scale(). Intermediate
+    targets (post-processing, off-screen passes) can be acquired and released
+    every frame without allocating any video memory once warmed up.
+
+    Args:
+        viewport (Viewport): The viewport framebuffers push to when bound.
+    """
+    def __init__(self, viewport: Viewport) -> None:
+        self._viewport = viewport
+        self._free: Dict[Tuple[GL.GLenum, str], List[Framebuffer]] = {}
+        self._in_use: Dict[int, Tuple[GL.GLenum, str]] = {}
+        self._in_use_targets: List[Framebuffer] = []
+        self.allocations = 0
+
+    def acquire(self,
+                width: int,
+                height: int,
+                color_format: GL.GLenum = GL.GL_RGBA8,
+                depth_mode: str = DEPTH_NONE) -> Framebuffer:
+        """Get a framebuffer of the given size and format.
+
+        It must be given back with release() once it's no longer needed.
+        """
+        key = (color_format, depth_mode)
+        free = self._free.setdefault(key, [])
+
+        framebuffer = _take_best_fit(free, width, height)
+        if framebuffer is None and free:
+            # nothing big enough, so grow the largest one rather than making
+            # another that would sit around too small later
+            framebuffer = max(free, key=_capacity_area)
+            free.remove(framebuffer)
+        if framebuffer is None:
+            framebuffer = Framebuffer(width,
+                                      height,
+                                      GL.GL_FRAMEBUFFER,
+                                      self._viewport,
+                                      depth_mode=depth_mode,
+                                      color_format=color_format,
+                                      over_allocate=True)
+            self.allocations += 1
+        else:
+            framebuffer.resize(width, height)
+
+        self._in_use[id(framebuffer)] = key
+        self._in_use_targets.append(framebuffer)
+        return framebuffer
+
+    def release(self, framebuffer: Framebuffer) -> None:
+        key = self._in_use.pop(id(framebuffer), None)
+        if key is None:
+            raise ValueError("Framebuffer was not acquired from this pool")
+        self._in_use_targets.remove(framebuffer)
+        self._free[key].append(framebuffer)
+
+    def get_memory_size(self) -> int:
+        """Get the video memory held by every framebuffer in the pool, in
+        bytes, whether in use or free."""
+        return sum(framebuffer.get_memory_size()
+                   for framebuffer in self._all_targets())
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "in_use": len(self._in_use_targets),
+            "free": sum(len(free) for free in self._free.values()),
+            "allocations": self.allocations,
+            "memory": self.get_memory_size()
+        }
+
+    def trim(self) -> None:
+        """Delete every framebuffer that isn't in use."""
+        for free in self._free.values():
+            for framebuffer in free:
+                framebuffer.cleanup()
+            free.clear()
+
+    def cleanup(self) -> None:
+        for framebuffer in self._all_targets():
+            framebuffer.cleanup()
+        self._free.clear()
+        self._in_use.clear()
+        self._in_use_targets.clear()
+
+    def _all_targets(self) -> List[Framebuffer]:
+        targets = list(self._in_use_targets)
+        for free in self._free.values():
+            targets.extend(free)
+        return targets
+
+
+def _capacity_area(framebuffer: Framebuffer) -> int:
+    width, height = framebuffer.get_capacity()
+    return width * height
+
+
+def _take_best_fit(free: List[Framebuffer], width: int,
+                   height: int) -> Framebuffer:
+    best = None
+    for framebuffer in free:
+        cap_w, cap_h = framebuffer.get_capacity()
+        if cap_w < width or cap_h < height:
+            continue
+        if best is None or _capacity_area(framebuffer) < _capacity_area(best):
+            best = framebuffer
+    if best is not None:
+        free.remove(best)
+    return best
@@ -0,0 +1,49 @@
+from typing import Tuple
+
+from OpenGL import GL
+
+from .texture import BYTES_PER_TEXEL
+
+
+class Renderbuffer:
+    """Storage for a framebuffer attachment that is never sampled.
+
+    Cheaper than a texture for things like depth buffers, as the driver is
+    free to store it however is fastest to render to.
+    """
+    def __init__(self,
+                 width: int,
+                 height: int,
+                 internal_format: GL.GLenum = GL.GL_DEPTH24_STENCIL8) -> None:
+        self._width = width
+        self._height = height
+        self._internal_format = internal_format
+        self._handle = GL.glGenRenderbuffers(1)
+        self._allocate()
+
+    def _allocate(self) -> None:
+        GL.glBindRenderbuffer(GL.GL_RENDERBUFFER, self._handle)
+        GL.glRenderbufferStorage(GL.GL_RENDERBUFFER, self._internal_format,
+                                 self._width, self._height)
+        GL.glBindRenderbuffer(GL.GL_RENDERBUFFER, 0)
+
+    def get_size(self) -> Tuple[int, int]:
+        return self._width, self._height
+
+    def get_internal_format(self) -> GL.GLenum:
+        return self._internal_format
+
+    def get_memory_size(self) -> int:
+        return self._width * self._height * BYTES_PER_TEXEL.get(
+            self._internal_format, 4)
+
+    def resize(self, width: int, height: int) -> None:
+        self._width = width
+        self._height = height
+        self._allocate()
+
+    def get_handle(self) -> GL.GLuint:
+        return self._handle
+
+    def cleanup(self) -> None:
+        GL.glDeleteRenderbuffers(1, [self._handle])
@@ -1,8 +1,20 @@
-from typing import Mapping
+from __future__ import annotations
+from ctypes import byref, c_ubyte
+from dataclasses import dataclass, field
+import hashlib
+import logging
+import os
+from os import path
+import re
+import struct
+from typing import Dict, Mapping, Optional, Set, Union
 
 from OpenGL import GL
 import glm
 
+from . import gl_state
+from .uniform_buffer import BLOCK_BINDINGS
+
 VERTEX = "vertex"
 FRAGMENT = "fragment"
 
@@ -11,91 +23,462 @@ SHADER_TYPE_MAP = {
     FRAGMENT: GL.GL_FRAGMENT_SHADER
 }
 
+BINARY_EXTENSION = ".rprog"
+
+_VERSION_PATTERN = re.compile(r"^\s*#\s*version\b")
+
+# magic, version, binary format
+_BINARY_HEADER = struct.Struct("<4sHI")
+_BINARY_MAGIC = b"RPRG"
+_BINARY_VERSION = 1
+
+
+@dataclass
+class _SharedProgram:
+    key: str
+    handle: int
+    refcount: int = 0
+    uniform_locations: Dict[str, int] = field(default_factory=dict)
+    uniform_blocks: Set[str] = field(default_factory=set)
+
+
+class _ProgramRegistry:
+    def __init__(self) -> None:
+        # linked programs by source hash, shared between identical shaders
+        self.programs: Dict[str, _SharedProgram] = {}
+        self.binary_cache_dir: str = None
+        self.binary_hits = 0
+        self.binary_misses = 0
+
+
+_registry = _ProgramRegistry()
+
+
+def enable_binary_cache(directory: Optional[str]) -> None:
+    """Cache linked programs on disk to skip compiling them on later runs.
+
+    Binaries are keyed by the shader source and the GL driver, and a binary
+    the driver rejects is recompiled and replaced. Needs OpenGL 4.1 or
+    ARB_get_program_binary, otherwise it does nothing.
+
+    Args:
+        directory (str): Where to store binaries, or None to disable.
+    """
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+    _registry.binary_cache_dir = directory
+
+
+def registry_stats() -> Mapping[str, int]:
+    return {
+        "programs": len(_registry.programs),
+        "shaders": sum(prog.refcount for prog in _registry.programs.values()),
+        "binary_hits": _registry.binary_hits,
+        "binary_misses": _registry.binary_misses
+    }
+
+
+def cleanup() -> None:
+    """Delete every program still alive, for when the context goes away."""
+    for program in _registry.programs.values():
+        gl_state.forget_program(program.handle)
+        GL.glDeleteProgram(program.handle)
+    _registry.programs.clear()
+
 
 class Shader:
-    def __init__(self, name: str, shaders: Mapping[str, str]) -> None:
+    """A linked shader program.
+
+    Shaders with identical sources share a single GL program, so creating the
+    same shader many times only compiles it once.
+
+    Args:
+        name (str): The name of the shader, used in errors.
+        shaders (Mapping[str, str]): The source of each stage, by type.
+        defines (Mapping[str, object]): Defines to inject after #version.
+        variants (Mapping[str, Mapping[str, object]]): Named sets of
+            defines that can be passed to variant().
+        lazy (bool): If True, compilation waits until the shader is first
+            used, or compile() is called.
+    """
+    def __init__(self,
+                 name: str,
+                 shaders: Mapping[str, str],
+                 defines: Mapping[str, object] = None,
+                 variants: Mapping[str, Mapping[str, object]] = None,
+                 lazy: bool = False) -> None:
         self.name = name
-        self._handles = {}
-        self._uniform_locations = {}
-        self._program = GL.GLuint(0)
-        self._compile_and_link(shaders)
+        self.defines = dict(defines or {})
+        self.variants = dict(variants or {})
+        self._sources = shaders
+        self._variant_shaders: Dict[tuple, Shader] = {}
+        self._shared: _SharedProgram = None
+        self._program = 0
+        self._uniform_locations: Dict[str, int] = {}
+        self._uniform_blocks: Set[str] = set()
+        if not lazy:
+            self.compile()
+
+    def compile(self) -> None:
+        """Create the program now, if it hasn't been created yet."""
+        if self._shared is not None:
+            return
+
+        shaders = self._sources
+        if self.defines:
+            shaders = {
+                shader_type: inject_defines(shader_source, self.defines)
+                for shader_type, shader_source in shaders.items()
+            }
+
+        key = _source_key(shaders)
+        shared = _registry.programs.get(key)
+        if shared is None:
+            shared = _SharedProgram(key,
+                                    _create_program(self.name, shaders, key))
+            _bind_uniform_blocks(shared)
+            _registry.programs[key] = shared
+        shared.refcount += 1
+        self._shared = shared
+        self._program = shared.handle
+        self._uniform_locations = shared.uniform_locations
+        self._uniform_blocks = shared.uniform_blocks
+
+    def is_compiled(self) -> bool:
+        return self._shared is not None
+
+    def variant(self, variant: Union[str, Mapping[str, object]]) -> Shader:
+        """Get a variant of this shader with extra defines.
+
+        Variants are created lazily, and compiled on first use. Asking for
+        the same defines again returns the same Shader.
+
+        Args:
+            variant (Union[str, Mapping[str, object]]): The name of one of
+                the shader's variants, or a mapping of defines.
+        """
+        if isinstance(variant, str):
+            if variant not in self.variants:
+                raise KeyError(
+                    f"Shader '{self.name}' has no variant '{variant}'")
+            name = f"{self.name}:{variant}"
+            variant = self.variants[variant]
+        else:
+            name = f"{self.name}:{_describe_defines(variant)}"
+
+        defines = {**self.defines, **variant}
+        key = tuple(sorted((define, str(value))
+                           for define, value in defines.items()))
+        shader = self._variant_shaders.get(key)
+        if shader is None:
+            shader = Shader(name, self._sources, defines, lazy=True)
+            self._variant_shaders[key] = shader
+        return shader
 
     def set_bool(self, name: str, value: bool) -> None:
-        GL.glUniform1i(self._get_location(name), value)
+        location = self._get_location(name)
+        if self._changed(location, value):
+            GL.glUniform1i(location, value)
 
     def set_int(self, name: str, value: int) -> None:
-        GL.glUniform1i(self._get_location(name), value)
+        location = self._get_location(name)
+        if self._changed(location, value):
+            GL.glUniform1i(location, value)
 
     def set_float(self, name: str, value: float) -> None:
-        GL.glUniform1f(self._get_location(name), value)
+        location = self._get_location(name)
+        if self._changed(location, value):
+            GL.glUniform1f(location, value)
 
     def set_mat4(self,
                  name: str,
                  value: glm.mat4,
                  transpose: bool = False) -> None:
-        GL.glUniformMatrix4fv(self._get_location(name), 1, transpose,
-                              glm.value_ptr(value))
+        location = self._get_location(name)
+        if self._changed(location, value, transpose):
+            GL.glUniformMatrix4fv(location, 1, transpose,
+                                  glm.value_ptr(value))
 
     def set_mat3(self,
                  name: str,
                  value: glm.mat3,
                  transpose: bool = False) -> None:
-        GL.glUniformMatrix3fv(self._get_location(name), 1, transpose,
-                              glm.value_ptr(value))
+        location = self._get_location(name)
+        if self._changed(location, value, transpose):
+            GL.glUniformMatrix3fv(location, 1, transpose,
+                                  glm.value_ptr(value))
 
     def set_vec2(self, name: str, value: glm.vec2) -> None:
-        GL.glUniform2fv(self._get_location(name), 1, glm.value_ptr(value))
+        location = self._get_location(name)
+        if self._changed(location, value):
+            GL.glUniform2fv(location, 1, glm.value_ptr(value))
 
     def set_vec3(self, name: str, value: glm.vec3) -> None:
-        GL.glUniform3fv(self._get_location(name), 1, glm.value_ptr(value))
+        location = self._get_location(name)
+        if self._changed(location, value):
+            GL.glUniform3fv(location, 1, glm.value_ptr(value))
 
     def set_vec4(self, name: str, value: glm.vec4) -> None:
-        GL.glUniform4fv(self._get_location(name), 1, glm.value_ptr(value))
+        location = self._get_location(name)
+        if self._changed(location, value):
+            GL.glUniform4fv(location, 1, glm.value_ptr(value))
 
-    def _compile_and_link(self, shaders: Mapping[str, str]) -> None:
-        for shader_type, shader_source in shaders.items():
-            self._compile_shader(shader_type, shader_source)
+    def get_handle(self) -> int:
+        self.compile()
+        return self._program
 
-        self._program = GL.glCreateProgram()
-        for _, handle in self._handles.items():
-            GL.glAttachShader(self._program, handle)
-        GL.glLinkProgram(self._program)
-        _check_link_err(self._program, self.name)
+    def get_attribute_location(self, name: str) -> int:
+        self.compile()
+        return GL.glGetAttribLocation(self._program, name)
 
-    def _compile_shader(self, shader_type: str, shader_source: str) -> None:
-        if shader_type not in SHADER_TYPE_MAP.keys():
-            raise ValueError(f"Invalid shader type '{shader_type}'")
+    def has_uniform_block(self, name: str) -> bool:
+        self.compile()
+        return name in self._uniform_blocks
 
-        if shader_type in self._handles:
-            raise ValueError(
-                f"Cannot compile multiple shaders of type '{shader_type}'")
-
-        handle = GL.glCreateShader(SHADER_TYPE_MAP[shader_type])
-        self._handles[shader_type] = handle
-        GL.glShaderSource(handle, shader_source)
-        GL.glCompileShader(handle)
-        _check_compile_err(handle, self.name)
+    def _changed(self,
+                 location: int,
+                 value: object,
+                 transpose: bool = False) -> bool:
+        # skip uploads to missing uniforms, and of values the program
+        # already has
+        if location == -1:
+            return False
+        if transpose:
+            value = glm.transpose(value)
+        return gl_state.uniform_changed(self._program, location, value)
 
     def _get_location(self, name: str) -> GL.GLuint:
         if name in self._uniform_locations:
             return self._uniform_locations[name]
 
+        self.compile()
+        if name in self._uniform_locations:
+            return self._uniform_locations[name]
+
+        # missing uniforms are cached too, so we don't ask GL every time
         location = GL.glGetUniformLocation(self._program, name)
-        if location == -1:
-            return -1
         self._uniform_locations[name] = location
         return location
 
     def bind(self) -> None:
-        GL.glUseProgram(self._program)
+        if self._shared is None:
+            self.compile()
+        gl_state.use_program(self._program)
 
     def unbind(self) -> None:
-        GL.glUseProgram(0)
+        gl_state.use_program(0)
 
     def cleanup(self) -> None:
-        for handle in self._handles.values():
+        for variant in self._variant_shaders.values():
+            variant.cleanup()
+        self._variant_shaders.clear()
+
+        shared = self._shared
+        if shared is None:
+            return
+        self._shared = None
+        shared.refcount -= 1
+        if shared.refcount > 0:
+            return
+        del _registry.programs[shared.key]
+        gl_state.forget_program(shared.handle)
+        GL.glDeleteProgram(shared.handle)
+
+
+def inject_defines(source: str, defines: Mapping[str, object]) -> str:
+    """Insert #define lines into GLSL source, just after its #version.
+
+    A #line directive follows them, so compile errors still report line
+    numbers from the original source. None defines a name without a value,
+    and booleans become 1 or 0.
+    """
+    lines = source.split("\n")
+    insert_at = 0
+    for i, line in enumerate(lines):
+        if _VERSION_PATTERN.match(line):
+            insert_at = i + 1
+            break
+
+    define_lines = []
+    for define, value in defines.items():
+        if value is None:
+            define_lines.append(f"#define {define}")
+        else:
+            if isinstance(value, bool):
+                value = int(value)
+            define_lines.append(f"#define {define} {value}")
+    define_lines.append(f"#line {insert_at + 1}")
+    return "\n".join(lines[:insert_at] + define_lines + lines[insert_at:])
+
+
+def _describe_defines(defines: Mapping[str, object]) -> str:
+    return ",".join(f"{define}={value}"
+                    for define, value in sorted(defines.items()))
+
+
+def _source_key(shaders: Mapping[str, str]) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for shader_type, shader_source in sorted(shaders.items()):
+        digest.update(shader_type.encode())
+        digest.update(b"\0")
+        digest.update(shader_source.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _create_program(name: str, shaders: Mapping[str, str], key: str) -> int:
+    binary_path = _binary_path(key)
+    if binary_path is not None:
+        program = _load_binary(binary_path)
+        if program is not None:
+            _registry.binary_hits += 1
+            return program
+        _registry.binary_misses += 1
+
+    program = _compile_and_link(name, shaders, binary_path is not None)
+    if binary_path is not None:
+        _save_binary(program, binary_path)
+    return program
+
+
+def _compile_and_link(name: str, shaders: Mapping[str, str],
+                      retrievable: bool) -> int:
+    handles = []
+    try:
+        for shader_type, shader_source in shaders.items():
+            handles.append(_compile_shader(name, shader_type, shader_source))
+
+        program = GL.glCreateProgram()
+        for handle in handles:
+            GL.glAttachShader(program, handle)
+        if retrievable:
+            GL.glProgramParameteri(program,
+                                   GL.GL_PROGRAM_BINARY_RETRIEVABLE_HINT,
+                                   GL.GL_TRUE)
+        GL.glLinkProgram(program)
+        try:
+            _check_link_err(program, name)
+        except RuntimeError:
+            GL.glDeleteProgram(program)
+            raise
+
+        # the program keeps what it needs, the shader objects can go
+        for handle in handles:
+            GL.glDetachShader(program, handle)
+        return program
+    finally:
+        for handle in handles:
             GL.glDeleteShader(handle)
-        GL.glDeleteProgram(self._program)
+
+
+def _compile_shader(name: str, shader_type: str, shader_source: str) -> int:
+    if shader_type not in SHADER_TYPE_MAP.keys():
+        raise ValueError(f"Invalid shader type '{shader_type}'")
+
+    handle = GL.glCreateShader(SHADER_TYPE_MAP[shader_type])
+    GL.glShaderSource(handle, shader_source)
+    GL.glCompileShader(handle)
+    try:
+        _check_compile_err(handle, name)
+    except RuntimeError:
+        GL.glDeleteShader(handle)
+        raise
+    return handle
+
+
+def _bind_uniform_blocks(shared: _SharedProgram) -> None:
+    # blocks have no binding of their own before GLSL 4.20, so point any
+    # shared blocks the program declares at their binding points here
+    for block_name, binding in BLOCK_BINDINGS.items():
+        index = GL.glGetUniformBlockIndex(shared.handle, block_name)
+        if index == GL.GL_INVALID_INDEX:
+            continue
+        GL.glUniformBlockBinding(shared.handle, index, binding)
+        shared.uniform_blocks.add(block_name)
+
+
+def _binary_supported() -> bool:
+    if not GL.glGetProgramBinary:
+        return False
+    try:
+        return GL.glGetIntegerv(GL.GL_NUM_PROGRAM_BINARY_FORMATS) > 0
+    except GL.GLError:
+        return False
+
+
+def _binary_path(key: str) -> Optional[str]:
+    if _registry.binary_cache_dir is None or not _binary_supported():
+        return None
+
+    # binaries are only valid for the driver that produced them
+    driver = b"\0".join(
+        GL.glGetString(name) or b""
+        for name in (GL.GL_VENDOR, GL.GL_RENDERER, GL.GL_VERSION))
+    driver_key = hashlib.blake2b(driver, digest_size=8).hexdigest()
+    return path.join(_registry.binary_cache_dir,
+                     f"{key}_{driver_key}{BINARY_EXTENSION}")
+
+
+def _load_binary(binary_path: str) -> Optional[int]:
+    try:
+        with open(binary_path, "rb") as binary_file:
+            data = binary_file.read()
+    except OSError:
+        return None
+
+    if len(data) <= _BINARY_HEADER.size:
+        return None
+    magic, version, binary_format = _BINARY_HEADER.unpack_from(data)
+    if magic != _BINARY_MAGIC or version != _BINARY_VERSION:
+        return None
+
+    binary = data[_BINARY_HEADER.size:]
+    program = GL.glCreateProgram()
+    try:
+        GL.glProgramBinary(program, binary_format, binary, len(binary))
+        linked = GL.glGetProgramiv(program, GL.GL_LINK_STATUS) == GL.GL_TRUE
+    except GL.GLError:
+        # an unknown format or a corrupt binary is an error, not just a
+        # failed link
+        linked = False
+    if not linked:
+        # drivers reject binaries from before an update, so throw it away
+        # and compile instead
+        GL.glDeleteProgram(program)
+        _remove_binary(binary_path)
+        return None
+    return program
+
+
+def _remove_binary(binary_path: str) -> None:
+    try:
+        os.remove(binary_path)
+    except OSError as err:
+        logging.warning(f"Unable to remove stale program binary: {err}")
+
+
+def _save_binary(program: int, binary_path: str) -> None:
+    length = GL.glGetProgramiv(program, GL.GL_PROGRAM_BINARY_LENGTH)
+    if length <= 0:
+        return
+    binary = (c_ubyte * length)()
+    written = GL.GLsizei(0)
+    binary_format = GL.GLenum(0)
+    GL.glGetProgramBinary(program, length, byref(written),
+                          byref(binary_format), binary)
+
+    temp_path = f"{binary_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "wb") as binary_file:
+            binary_file.write(
+                _BINARY_HEADER.pack(_BINARY_MAGIC, _BINARY_VERSION,
+                                    binary_format.value))
+            binary_file.write(bytes(binary)[:written.value])
+        os.replace(temp_path, binary_path)
+    except OSError as err:
+        logging.warning(f"Unable to cache program binary: {err}")
+        if path.exists(temp_path):
+            os.remove(temp_path)
 
 
 def _check_compile_err(shader: GL.GLuint, name: str) -> None:
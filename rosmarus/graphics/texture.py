@@ -1,10 +1,25 @@
 from __future__ import annotations
 from ctypes import c_void_p, byref
-from typing import Tuple
+from typing import Sequence, Tuple
 
 from OpenGL import GL
 
 from ..math.rect import Rect
+from . import gl_state
+
+# bytes per texel of common internal formats, used for memory estimates
+BYTES_PER_TEXEL = {
+    GL.GL_R8: 1,
+    GL.GL_RG8: 2,
+    GL.GL_RGB8: 3,
+    GL.GL_RGBA8: 4,
+    GL.GL_RGBA16F: 8,
+    GL.GL_RGBA32F: 16,
+    GL.GL_DEPTH_COMPONENT16: 2,
+    GL.GL_DEPTH_COMPONENT24: 4,
+    GL.GL_DEPTH_COMPONENT32: 4,
+    GL.GL_DEPTH24_STENCIL8: 4
+}
 
 
 class Texture2D:
@@ -19,9 +34,15 @@ class Texture2D:
                  mag_filter: GL.GLint = GL.GL_NEAREST,
                  s_wrap: GL.GLint = GL.GL_CLAMP_TO_EDGE,
                  t_wrap: GL.GLint = GL.GL_CLAMP_TO_EDGE,
-                 mipmap: bool = True) -> None:
+                 mipmap: bool = True,
+                 top_down: bool = False,
+                 mip_levels: Sequence[c_void_p] = None) -> None:
         self._width = width
         self._height = height
+        # if the first row of data is the top of the image, rather than GL's
+        # usual bottom, v coordinates need flipping to sample it upright.
+        # SpriteBatch does that itself, other draws set the FlipV uniform
+        self.top_down = top_down
         self._handle = GL.glGenTextures(1)
         self._internal_format = internal_format
         self._color_format = color_format
@@ -37,13 +58,31 @@ class Texture2D:
                            mag_filter)
         GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_S, s_wrap)
         GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_T, t_wrap)
-        if mipmap:
+        if mipmap and mip_levels:
+            # we've been given the mip chain already, so no need to generate
+            w, h = width, height
+            for level, level_data in enumerate(mip_levels, start=1):
+                w, h = max(1, w // 2), max(1, h // 2)
+                GL.glTexImage2D(GL.GL_TEXTURE_2D, level, internal_format, w,
+                                h, 0, color_format, data_type, level_data)
+            GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAX_LEVEL,
+                               len(mip_levels))
+        elif mipmap:
             GL.glGenerateMipmap(GL.GL_TEXTURE_2D)
         self.unbind()
 
     def get_size(self) -> Tuple[int, int]:
         return self._width, self._height
 
+    def get_memory_size(self) -> int:
+        """Estimate how many bytes of video memory the texture uses."""
+        size = self._width * self._height * BYTES_PER_TEXEL.get(
+            self._internal_format, 4)
+        if self._mipmap:
+            # a full mip chain adds a third on top of the base level
+            size = size * 4 // 3
+        return size
+
     def resize(self, width: int, height: int) -> None:
         self.bind()
         GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, self._internal_format, width,
@@ -63,6 +102,10 @@ class Texture2D:
             GL.glGenerateMipmap(GL.GL_TEXTURE_2D)
         self.unbind()
 
+    def release_data(self) -> None:
+        """Stop holding on to the data the texture was created with."""
+        self._data = None
+
     def region_to_uvs(self, region: Rect) -> Rect:
         u = region.x / self._width
         v = region.y / self._height
@@ -70,13 +113,14 @@ class Texture2D:
         v2 = region.y2 / self._height
         return Rect(u, v, u2 - u, v2 - v)
 
-    def bind(self) -> None:
-        GL.glBindTexture(GL.GL_TEXTURE_2D, self._handle)
+    def bind(self, unit: int = 0) -> None:
+        gl_state.bind_texture(self._handle, unit)
 
-    def unbind(self) -> None:
-        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+    def unbind(self, unit: int = 0) -> None:
+        gl_state.bind_texture(0, unit)
 
     def cleanup(self) -> None:
+        gl_state.forget_texture(self._handle)
         GL.glDeleteTextures(1, GL.GLuint(self._handle))
 
     def get_handle(self) -> GL.GLuint:
@@ -85,4 +129,29 @@ class Texture2D:
     def __eq__(self, other: Texture2D) -> bool:
         if isinstance(other, Texture2D):
             return self._handle == other._handle
-        return False
\ No newline at end of file
+        return False
+
+
+class TextureRegion:
+    """A rectangle of a texture, that can be drawn in place of a texture.
+
+    The region is in pixels, with y going down from the top of the image.
+    """
+    def __init__(self, texture: Texture2D, region: Rect) -> None:
+        self.texture = texture
+        self.region = region
+
+    @property
+    def top_down(self) -> bool:
+        return self.texture.top_down
+
+    def get_size(self) -> Tuple[int, int]:
+        return int(self.region.w), int(self.region.h)
+
+    def to_texture_rect(self, sub_region: Rect) -> Rect:
+        """Convert a rect within this region to a rect within the texture."""
+        return Rect(self.region.x + sub_region.x,
+                    self.region.y + sub_region.y, sub_region.w, sub_region.h)
+
+    def region_to_uvs(self, sub_region: Rect) -> Rect:
+        return self.texture.region_to_uvs(self.to_texture_rect(sub_region))
@@ -0,0 +1,33 @@
+from ctypes import c_void_p
+
+from OpenGL import GL
+
+CAMERA_BLOCK = "Camera"
+
+# the binding point of each uniform block shared between shaders, shaders
+# containing a block with one of these names are bound to it after linking
+BLOCK_BINDINGS = {CAMERA_BLOCK: 0}
+
+
+class UniformBuffer:
+    """A buffer backing a uniform block, kept bound to its binding point."""
+    def __init__(self,
+                 size: int,
+                 binding: int,
+                 usage: GL.GLenum = GL.GL_DYNAMIC_DRAW) -> None:
+        self.size = size
+        self.binding = binding
+        self._handle = GL.glGenBuffers(1)
+        GL.glBindBuffer(GL.GL_UNIFORM_BUFFER, self._handle)
+        GL.glBufferData(GL.GL_UNIFORM_BUFFER, size, None, usage)
+        GL.glBindBufferBase(GL.GL_UNIFORM_BUFFER, binding, self._handle)
+
+    def set_data(self, offset: int, size: int, data: c_void_p) -> None:
+        GL.glBindBuffer(GL.GL_UNIFORM_BUFFER, self._handle)
+        GL.glBufferSubData(GL.GL_UNIFORM_BUFFER, offset, size, data)
+
+    def get_handle(self) -> GL.GLuint:
+        return self._handle
+
+    def cleanup(self) -> None:
+        GL.glDeleteBuffers(1, [self._handle])
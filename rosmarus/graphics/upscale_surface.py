@@ -4,9 +4,11 @@ import glm
 from .framebuffer import Framebuffer
 from .shader import Shader
 from . import mesh
+from . import gl_state
 from ..graphics.camera import Camera
 from ..graphics.window import Window
 from .viewport import Viewport
+from .. import profiler
 
 _VERTEX_SHADER = """#version 330 core
 
@@ -14,11 +16,15 @@ layout (location = 0) in vec3 in_Pos;
 layout (location = 2) in vec2 in_UV;
 
 out vec2 TexCoords;
+out vec2 ScreenCoords;
+
+uniform vec2 UVScale;
 
 void main()
 {
     gl_Position = vec4(in_Pos.x, in_Pos.y, 0.0, 1.0);
-    TexCoords = in_UV;
+    TexCoords = in_UV * UVScale;
+    ScreenCoords = in_UV;
 }
 """
 
@@ -55,11 +61,18 @@ class UpscaleSurface:
         self.framebuffer.unbind()
 
     def render(self) -> None:
-        self.framebuffer._viewport.clear_viewport()
-        GL.glDisable(GL.GL_DEPTH_TEST)
-        self.shader.bind()
-        self.framebuffer.get_texture(0).bind()
-        self.quad_mesh.render()
-        self.framebuffer.get_texture(0).unbind()
-        self.shader.unbind()
-        GL.glEnable(GL.GL_DEPTH_TEST)
\ No newline at end of file
+        with profiler.zone("UpscaleSurface.render", gpu=True):
+            self.framebuffer._viewport.clear_viewport()
+            gl_state.disable(GL.GL_DEPTH_TEST)
+            self.shader.bind()
+            # the framebuffer's textures can be bigger than what was drawn
+            self.shader.set_vec2("UVScale",
+                                 glm.vec2(*self.framebuffer.get_uv_scale()))
+            self.framebuffer.get_texture(0).bind()
+            self.quad_mesh.render()
+            gl_state.enable(GL.GL_DEPTH_TEST)
+
+    def cleanup(self) -> None:
+        self.shader.cleanup()
+        self.framebuffer.cleanup()
+        self.quad_mesh.cleanup()
@@ -1,5 +1,6 @@
 from ctypes import *
 import glm
+import numpy as np
 
 from .color import Color
 
@@ -31,4 +32,11 @@ class Vertex(Structure):
         self.color = (c_float * 4).from_buffer(color.to_vec4())
 
     def set_normal(self, normal: glm.vec3) -> None:
-        self.normal = (c_float * 3).from_buffer(normal)
\ No newline at end of file
+        self.normal = (c_float * 3).from_buffer(normal)
+
+
+# the same layout as Vertex, for building vertex data with NumPy
+VERTEX_DTYPE = np.dtype([("position", np.float32, 4),
+                         ("normal", np.float32, 3), ("uv", np.float32, 2),
+                         ("color", np.float32, 4)])
+VERTEX_FLOATS = VERTEX_DTYPE.itemsize // 4
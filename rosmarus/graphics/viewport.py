@@ -2,11 +2,10 @@ from abc import ABC, abstractmethod
 from typing import Tuple
 import logging
 
-from OpenGL import GL
-
 from .window import Window
 from .camera import Camera
 from . import color
+from . import gl_state
 
 
 class Viewport:
@@ -27,11 +26,11 @@ class Viewport:
 
     def set_screen(self, x: int, y: int, w: int, h: int) -> None:
         self.screens[0] = (x, y, w, h)
-        GL.glViewport(x, y, w, h)
+        gl_state.viewport(x, y, w, h)
 
     def push_screen(self, x: int, y: int, w: int, h: int) -> None:
         screen = (x, y, w, h)
-        GL.glViewport(*screen)
+        gl_state.viewport(*screen)
         self.screens.append(screen)
 
     def pop_screen(self) -> None:
@@ -4,8 +4,9 @@ from typing import Callable
 import glfw
 from OpenGL import GL
 
-from .gl_context import GLContext
+from .gl_context import GLContext, OSMESA
 from . import color
+from . import gl_state
 from ..math.rect import Rect
 
 
@@ -15,12 +16,14 @@ class Window:
                  width: int,
                  height: int,
                  gl_context: GLContext,
-                 on_resize: Callable[..., None] = None) -> None:
+                 on_resize: Callable[..., None] = None,
+                 visible: bool = True) -> None:
         self.title = title
         self.width = width
         self.height = height
         self.gl_context = gl_context
         self.on_resize = on_resize
+        self.visible = visible
         self.initialized = False
 
     def __enter__(self) -> Window:
@@ -30,9 +33,21 @@ class Window:
         self._cleanup()
 
     def _initialize(self) -> Window:
+        if not self.visible and self.gl_context.creation_api == OSMESA:
+            # OSMesa renders entirely in software, so we don't need a display
+            # server at all. Choosing the platform needs GLFW 3.4 (pyGLFW
+            # 2.x), older versions just get a hidden window
+            if hasattr(glfw, "PLATFORM"):
+                glfw.init_hint(glfw.PLATFORM, glfw.PLATFORM_NULL)
+
         if not glfw.init():
             raise RuntimeError("Unable to initialize GLFW")
 
+        # context hints need to be set before the window is created
+        self.gl_context.bind()
+        glfw.window_hint(glfw.VISIBLE,
+                         glfw.TRUE if self.visible else glfw.FALSE)
+
         self.glfw_window = glfw.create_window(self.width, self.height,
                                               self.title, None, None)
         if not self.glfw_window:
@@ -40,17 +55,18 @@ class Window:
             raise RuntimeError("Unable to create GLFW window")
 
         glfw.make_context_current(self.glfw_window)
-        self.gl_context.bind()
 
-        # set some initial OpenGL state
-        GL.glEnable(GL.GL_CULL_FACE)
+        # set some initial OpenGL state, the context is new so anything the
+        # state tracker remembers is from a previous one
+        gl_state.reset()
+        gl_state.enable(GL.GL_CULL_FACE)
         GL.glFrontFace(GL.GL_CCW)
         GL.glCullFace(GL.GL_BACK)
-        GL.glEnable(GL.GL_BLEND)
-        GL.glBlendFunc(GL.GL_SRC_ALPHA, GL.GL_ONE_MINUS_SRC_ALPHA)
+        gl_state.enable(GL.GL_BLEND)
+        gl_state.blend_func(GL.GL_SRC_ALPHA, GL.GL_ONE_MINUS_SRC_ALPHA)
         GL.glBlendEquation(GL.GL_FUNC_ADD)
-        GL.glEnable(GL.GL_DEPTH_TEST)
-        GL.glUseProgram(0)
+        gl_state.enable(GL.GL_DEPTH_TEST)
+        gl_state.use_program(0)
 
         glfw.set_window_size_callback(self.glfw_window, self.on_resize)
 
@@ -78,4 +94,5 @@ class Window:
             self.set_clear_color(self.clear_color)
 
     def _cleanup(self) -> None:
+        gl_state.reset()
         glfw.terminate()
\ No newline at end of file
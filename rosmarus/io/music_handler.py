@@ -2,12 +2,22 @@ from .. import resources
 from .. import audio
 
 
-def load_music(path: str) -> audio.AudioStream:
-    return audio.AudioStream(path)
+def load_music(path: str,
+               buffer_count: int = audio.DEFAULT_STREAM_BUFFER_COUNT,
+               buffer_size: int = audio.DEFAULT_STREAM_BUFFER_SIZE
+               ) -> audio.AudioStream:
+    return audio.AudioStream(path, buffer_count, buffer_size)
+
+
+def music_size(audio_stream: audio.AudioStream) -> int:
+    return audio_stream.buffer_size_bytes()
 
 
 def cleanup_music(audio_stream: audio.AudioStream) -> None:
     audio_stream.cleanup()
 
 
-resources.register_type_handler("music", load_music, cleanup_music)
\ No newline at end of file
+resources.register_type_handler("music",
+                                load_music,
+                                cleanup_music,
+                                sizer=music_size)
\ No newline at end of file
@@ -1,10 +1,25 @@
+from dataclasses import dataclass, field
+from os import path
+import re
+from typing import List, Mapping
+
 import yaml
 
 from .. import resources
 from ..graphics.shader import Shader
 
+_INCLUDE_PATTERN = re.compile(r'^\s*#\s*include\s+"([^"]+)"\s*$')
 
-def load_shader(path: str) -> Shader:
+
+@dataclass
+class DecodedShader:
+    name: str
+    shaders: Mapping[str, str]
+    variants: Mapping[str, Mapping[str, object]] = field(default_factory=dict)
+    precompile: List[str] = field(default_factory=list)
+
+
+def decode_shader(path: str) -> DecodedShader:
     with open(path, "r") as shader_file:
         raw_shader = yaml.safe_load(shader_file.read())
 
@@ -16,11 +31,83 @@ def load_shader(path: str) -> Shader:
                 "Unable to load shader '{path}', missing 'name' or 'shaders' field"
             )
 
-        return Shader(name, shaders)
+        shaders = {
+            shader_type: resolve_includes(shader_source, path)
+            for shader_type, shader_source in shaders.items()
+        }
+
+        variants = raw_shader.get("variants", None) or {}
+        precompile = raw_shader.get("precompile", None) or []
+        for variant in precompile:
+            if variant not in variants:
+                raise RuntimeError(
+                    f"Unable to load shader '{path}', cannot precompile "
+                    f"unknown variant '{variant}'")
+
+        return DecodedShader(name, shaders, variants, precompile)
+
+
+def upload_shader(decoded: DecodedShader) -> Shader:
+    shader = Shader(decoded.name, decoded.shaders, variants=decoded.variants)
+    for variant in decoded.precompile:
+        shader.variant(variant).compile()
+    return shader
+
+
+def load_shader(path: str) -> Shader:
+    return upload_shader(decode_shader(path))
 
 
 def cleanup_shader(shader: Shader) -> Shader:
     shader.cleanup()
 
 
-resources.register_type_handler("shader", load_shader, cleanup_shader)
\ No newline at end of file
+def resolve_includes(source: str, source_path: str) -> str:
+    """Replace #include "file" lines with the contents of the file.
+
+    Paths are relative to the including file. Each file is only included
+    once per stage, and #line directives keep error line numbers pointing at
+    the right file: the source string number is the file's position in the
+    order of includes, with the shader itself as 0.
+    """
+    return _resolve_includes(source, source_path, 0, [])
+
+
+def _resolve_includes(source: str, source_path: str, source_number: int,
+                      included: List[str]) -> str:
+    lines = []
+    for line_number, line in enumerate(source.split("\n"), start=1):
+        match = _INCLUDE_PATTERN.match(line)
+        if match is None:
+            lines.append(line)
+            continue
+
+        include_path = path.normpath(
+            path.join(path.dirname(source_path), match.group(1)))
+        if include_path in included:
+            # already included, keep the line so the numbering still matches
+            lines.append("")
+            continue
+        included.append(include_path)
+
+        try:
+            with open(include_path, "r") as include_file:
+                include_source = include_file.read()
+        except OSError as err:
+            raise RuntimeError(
+                f"Unable to include '{match.group(1)}' in '{source_path}': "
+                f"{err}")
+
+        lines.append(f"#line 1 {len(included)}")
+        lines.append(
+            _resolve_includes(include_source, include_path, len(included),
+                              included))
+        lines.append(f"#line {line_number + 1} {source_number}")
+    return "\n".join(lines)
+
+
+resources.register_type_handler("shader",
+                                load_shader,
+                                cleanup_shader,
+                                decoder=decode_shader,
+                                uploader=upload_shader)
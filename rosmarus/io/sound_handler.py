@@ -2,12 +2,31 @@ from .. import resources
 from .. import audio
 
 
-def load_sound(path: str) -> audio.AudioClip:
-    return audio.AudioClip(path)
+def upload_sound(pcm: audio.PCMData,
+                 channels: int = None,
+                 frequency: int = None) -> audio.AudioClip:
+    return audio.AudioClip(None, pcm)
+
+
+def load_sound(path: str,
+               channels: int = None,
+               frequency: int = None) -> audio.AudioClip:
+    """Load a sound from an Ogg Vorbis, WAV or raw PCM file. Raw PCM needs
+    its channels and frequency given."""
+    return audio.AudioClip(path, channels=channels, frequency=frequency)
+
+
+def sound_size(audio_clip: audio.AudioClip) -> int:
+    return audio_clip.clip.buffer_length
 
 
 def cleanup_sound(audio_clip: audio.AudioClip) -> None:
     audio_clip.cleanup()
 
 
-resources.register_type_handler("sound", load_sound, cleanup_sound)
\ No newline at end of file
+resources.register_type_handler("sound",
+                                load_sound,
+                                cleanup_sound,
+                                decoder=audio.decode_clip,
+                                uploader=upload_sound,
+                                sizer=sound_size)
@@ -1,31 +1,284 @@
-import array
-from ctypes import c_ubyte
+from dataclasses import dataclass, field
+import hashlib
+import logging
+import mmap
+import os
 from os import path
+import struct
+import threading
+from typing import List, Mapping
 
 from PIL import Image
 
 from .. import resources
 from ..graphics.texture import Texture2D
 
+BAKE_EXTENSION = ".rtex"
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tga", ".gif", ".webp")
 
-def load_texture(file_path: str, **kwargs) -> Texture2D:
-    ext = path.splitext(file_path)[1][1:].lower()
-    if ext != "png":
-        raise RuntimeError("Only PNG files are supported")
+# magic, version, mip level count, width, height, source mtime (ns),
+# source size, source digest
+_BAKE_HEADER = struct.Struct("<4sHHIIqq16s")
+# where the source mtime is in the header, so it can be rewritten in place
+_BAKE_MTIME = struct.Struct("<q")
+_BAKE_MTIME_OFFSET = struct.calcsize("<4sHHII")
+_BAKE_MAGIC = b"RTEX"
+_BAKE_VERSION = 1
+
+
+@dataclass
+class DecodedTexture:
+    width: int
+    height: int
+    data: object
+    mip_levels: List[object] = field(default_factory=list)
+    # keeps a baked file mapped until its data has been uploaded
+    mapping: mmap.mmap = None
+
+
+class _BakeCache:
+    def __init__(self) -> None:
+        self.enabled = False
+        self.mipmaps = False
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+
+_bake_cache = _BakeCache()
+
+
+def enable_bake_cache(enabled: bool = True, mipmaps: bool = False) -> None:
+    """Cache decoded textures as raw RGBA8 files next to their sources.
+
+    Baked files are mapped straight into memory and uploaded, skipping
+    decoding entirely. They're invalidated when the source changes.
+
+    Args:
+        enabled (bool): Whether to use the cache.
+        mipmaps (bool): Whether to also bake mip levels, so they don't need
+            generating on the GPU at load time.
+    """
+    _bake_cache.enabled = enabled
+    _bake_cache.mipmaps = mipmaps
+
+
+def bake_cache_stats() -> Mapping[str, int]:
+    return {"hits": _bake_cache.hits, "misses": _bake_cache.misses}
+
+
+def bake_all(directory: str = None) -> int:
+    """Bake every image under a directory that isn't already baked.
+
+    Args:
+        directory (str): Where to look, defaults to the data path.
+
+    Returns:
+        int: How many images were baked.
+    """
+    if directory is None:
+        directory = resources._DATA_PATH
+
+    baked = 0
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            if path.splitext(filename)[1].lower() not in IMAGE_EXTENSIONS:
+                continue
+            file_path = path.join(root, filename)
+            if _bake_is_valid(file_path):
+                continue
+            decoded = _decode_image(file_path, _bake_cache.mipmaps)
+            _write_baked(file_path, decoded)
+            baked += 1
+    return baked
+
+
+def decode_texture(file_path: str, **kwargs) -> DecodedTexture:
+    """Decode any image format Pillow supports into RGBA8 pixels.
+
+    The rows are left in the image's top-to-bottom order rather than being
+    flipped for GL, textures made from them are marked as top_down instead.
+    """
+    if _bake_cache.enabled:
+        decoded = _read_baked(file_path)
+        with _bake_cache.lock:
+            if decoded is not None:
+                _bake_cache.hits += 1
+            else:
+                _bake_cache.misses += 1
+        if decoded is not None:
+            return decoded
+
+    decoded = _decode_image(file_path, _bake_cache.enabled
+                            and _bake_cache.mipmaps)
+    if _bake_cache.enabled:
+        _write_baked(file_path, decoded)
+    return decoded
+
+
+def upload_texture(decoded: DecodedTexture, **kwargs) -> Texture2D:
+    mip_levels = None
+    if decoded.mip_levels and kwargs.get("mipmap", True):
+        mip_levels = decoded.mip_levels
+    tex = Texture2D(decoded.width,
+                    decoded.height,
+                    decoded.data,
+                    top_down=True,
+                    mip_levels=mip_levels,
+                    **kwargs)
+
+    if decoded.mapping is not None:
+        # GL has its own copy now, so we can unmap the baked file
+        tex.release_data()
+        for view in [decoded.data] + decoded.mip_levels:
+            view.release()
+        decoded.mip_levels = []
+        decoded.data = None
+        decoded.mapping.close()
+    return tex
 
-    with open(file_path, "rb") as image_file:
-        img = Image.open(image_file).transpose(
-            Image.FLIP_TOP_BOTTOM).convert("RGBA")
-        w, h = img.size
-        img_data = array.array("B")
-        for v in img.getdata():
-            img_data.extend(v)
-        raw_img_data = (c_ubyte * len(img_data)).from_buffer(img_data)
-        return Texture2D(w, h, raw_img_data, **kwargs)
+
+def load_texture(file_path: str, **kwargs) -> Texture2D:
+    return upload_texture(decode_texture(file_path), **kwargs)
 
 
 def cleanup_texture(tex: Texture2D) -> None:
     tex.cleanup()
 
 
-resources.register_type_handler("texture", load_texture, cleanup_texture)
\ No newline at end of file
+def _decode_image(file_path: str, mipmaps: bool) -> DecodedTexture:
+    with Image.open(file_path) as img:
+        if img.mode != "RGBA":
+            img = img.convert("RGBA")
+        w, h = img.size
+        decoded = DecodedTexture(w, h, img.tobytes())
+
+        if mipmaps:
+            while w > 1 or h > 1:
+                w, h = max(1, w // 2), max(1, h // 2)
+                img = img.resize((w, h), Image.BOX)
+                decoded.mip_levels.append(img.tobytes())
+        return decoded
+
+
+def _bake_path(file_path: str) -> str:
+    return file_path + BAKE_EXTENSION
+
+
+def _source_digest(file_path: str) -> bytes:
+    with open(file_path, "rb") as source_file:
+        return hashlib.blake2b(source_file.read(), digest_size=16).digest()
+
+
+def _read_header(file_path: str, baked_file) -> tuple:
+    raw_header = baked_file.read(_BAKE_HEADER.size)
+    if len(raw_header) != _BAKE_HEADER.size:
+        return None
+    header = _BAKE_HEADER.unpack(raw_header)
+    magic, version, _, _, _, mtime_ns, size, digest = header
+    if magic != _BAKE_MAGIC or version != _BAKE_VERSION:
+        return None
+
+    # the mtime is a quick check, but it changes on checkout/copy so fall
+    # back to hashing the source before declaring the bake stale
+    stat = os.stat(file_path)
+    if stat.st_size != size:
+        return None
+    if stat.st_mtime_ns != mtime_ns:
+        if _source_digest(file_path) != digest:
+            return None
+        # the source didn't actually change, so remember its new mtime to
+        # skip hashing it again next time
+        _rewrite_baked_mtime(file_path, stat.st_mtime_ns)
+    return header
+
+
+def _rewrite_baked_mtime(file_path: str, mtime_ns: int) -> None:
+    try:
+        with open(_bake_path(file_path), "r+b") as baked_file:
+            baked_file.seek(_BAKE_MTIME_OFFSET)
+            baked_file.write(_BAKE_MTIME.pack(mtime_ns))
+    except OSError as err:
+        logging.warning(
+            f"Unable to update baked texture '{file_path}': {err}")
+
+
+def _bake_is_valid(file_path: str) -> bool:
+    try:
+        with open(_bake_path(file_path), "rb") as baked_file:
+            return _read_header(file_path, baked_file) is not None
+    except OSError:
+        return False
+
+
+def _read_baked(file_path: str) -> DecodedTexture:
+    try:
+        with open(_bake_path(file_path), "rb") as baked_file:
+            header = _read_header(file_path, baked_file)
+            if header is None:
+                return None
+            mapping = mmap.mmap(baked_file.fileno(),
+                                0,
+                                access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    _, _, levels, width, height, _, _, _ = header
+    if len(mapping) != _BAKE_HEADER.size + _levels_size(
+            width, height, levels):
+        # truncated or padded, so the levels can't be trusted
+        mapping.close()
+        return None
+
+    view = memoryview(mapping)
+    offset = _BAKE_HEADER.size
+    level_views = []
+    w, h = width, height
+    for level in range(levels):
+        level_size = w * h * 4
+        level_views.append(view[offset:offset + level_size])
+        offset += level_size
+        w, h = max(1, w // 2), max(1, h // 2)
+    view.release()
+
+    return DecodedTexture(width, height, level_views[0], level_views[1:],
+                          mapping)
+
+
+def _levels_size(width: int, height: int, levels: int) -> int:
+    size = 0
+    for _ in range(levels):
+        size += width * height * 4
+        width, height = max(1, width // 2), max(1, height // 2)
+    return size
+
+
+def _write_baked(file_path: str, decoded: DecodedTexture) -> None:
+    bake_path = _bake_path(file_path)
+    temp_path = f"{bake_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        stat = os.stat(file_path)
+        header = _BAKE_HEADER.pack(_BAKE_MAGIC, _BAKE_VERSION,
+                                   1 + len(decoded.mip_levels),
+                                   decoded.width, decoded.height,
+                                   stat.st_mtime_ns, stat.st_size,
+                                   _source_digest(file_path))
+        with open(temp_path, "wb") as baked_file:
+            baked_file.write(header)
+            baked_file.write(decoded.data)
+            for level in decoded.mip_levels:
+                baked_file.write(level)
+        # replace atomically so nothing ever maps a half-written file
+        os.replace(temp_path, bake_path)
+    except OSError as err:
+        logging.warning(f"Unable to bake texture '{file_path}': {err}")
+        if path.exists(temp_path):
+            os.remove(temp_path)
+
+
+resources.register_type_handler("texture",
+                                load_texture,
+                                cleanup_texture,
+                                decoder=decode_texture,
+                                uploader=upload_texture,
+                                sizer=Texture2D.get_memory_size)
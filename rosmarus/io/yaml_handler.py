@@ -36,4 +36,4 @@ def _print_validation_err(err: ValidationError, name: str) -> None:
     logging.error(" ".join(log_str))
 
 
-resources.register_type_handler("yaml", load_yaml)
\ No newline at end of file
+resources.register_type_handler("yaml", load_yaml, decoder=load_yaml)
\ No newline at end of file
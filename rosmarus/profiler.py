@@ -0,0 +1,293 @@
+from __future__ import annotations
+from collections import deque
+from ctypes import byref
+from dataclasses import dataclass, field
+import json
+import math
+import time
+from typing import ContextManager, Deque, Dict, List, Mapping
+
+from OpenGL import GL
+
+DEFAULT_FRAME_HISTORY = 240
+
+# how many frames old a GPU query must be before we attempt to read it back,
+# reading any sooner risks stalling the pipeline waiting on the result
+GPU_READBACK_LATENCY = 3
+
+
+@dataclass
+class ZoneRecord:
+    name: str
+    start: float
+    duration: float
+    depth: int
+    gpu_duration: float = None
+
+
+@dataclass
+class FrameRecord:
+    index: int
+    start: float
+    duration: float = 0
+    zones: List[ZoneRecord] = field(default_factory=list)
+
+
+class _Zone:
+    __slots__ = ("name", "gpu", "record", "query")
+
+    def __init__(self, name: str, gpu: bool) -> None:
+        self.name = name
+        self.gpu = gpu
+        self.record = None
+        self.query = None
+
+    def __enter__(self) -> _Zone:
+        frame = _profiler.current_frame
+        self.record = ZoneRecord(self.name, time.perf_counter(), 0,
+                                 len(_profiler.zone_stack))
+        _profiler.zone_stack.append(self)
+        if frame is not None:
+            frame.zones.append(self.record)
+
+        # GL_TIME_ELAPSED queries can't be nested, so only the outermost
+        # GPU zone gets one
+        if self.gpu and _profiler.gpu and _profiler.active_query is None:
+            self.query = _acquire_query()
+            GL.glBeginQuery(GL.GL_TIME_ELAPSED, self.query)
+            _profiler.active_query = self.query
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.record.duration = time.perf_counter() - self.record.start
+        _profiler.zone_stack.pop()
+        if self.query is not None:
+            GL.glEndQuery(GL.GL_TIME_ELAPSED)
+            _profiler.active_query = None
+            _profiler.pending_queries.append(
+                (_profiler.frame_index, self.record, self.query))
+
+
+class _NullZone:
+    __slots__ = ()
+
+    def __enter__(self) -> _NullZone:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        pass
+
+
+_NULL_ZONE = _NullZone()
+
+
+class _Profiler:
+    def __init__(self) -> None:
+        self.enabled = False
+        self.gpu = False
+        self.frames: Deque[FrameRecord] = deque(maxlen=DEFAULT_FRAME_HISTORY)
+        self.current_frame: FrameRecord = None
+        self.frame_index = 0
+        self.zone_stack: List[_Zone] = []
+        self.free_queries: List[int] = []
+        self.pending_queries = deque()
+        self.active_query = None
+
+
+_profiler = _Profiler()
+
+
+def enable(frame_history: int = DEFAULT_FRAME_HISTORY,
+           gpu: bool = True) -> None:
+    """Start recording frames. GPU zones require a current GL context."""
+    _profiler.enabled = True
+    _profiler.gpu = gpu
+    _profiler.frames = deque(_profiler.frames, maxlen=frame_history)
+
+
+def disable() -> None:
+    _profiler.enabled = False
+    _profiler.current_frame = None
+
+
+def is_enabled() -> bool:
+    return _profiler.enabled
+
+
+def zone(name: str, gpu: bool = False) -> ContextManager:
+    """Time a named, nestable region of a frame.
+
+    When the profiler is disabled this returns a shared no-op context manager,
+    so leaving instrumentation in hot paths costs a single flag check.
+
+    Args:
+        name (str): The name of the zone, shown in stats and traces.
+        gpu (bool): Whether to also time the region on the GPU.
+    """
+    if not _profiler.enabled:
+        return _NULL_ZONE
+    return _Zone(name, gpu)
+
+
+def begin_frame() -> None:
+    if not _profiler.enabled:
+        return
+    _profiler.current_frame = FrameRecord(_profiler.frame_index,
+                                          time.perf_counter())
+
+
+def end_frame() -> None:
+    if not _profiler.enabled or _profiler.current_frame is None:
+        return
+    frame = _profiler.current_frame
+    frame.duration = time.perf_counter() - frame.start
+    _profiler.frames.append(frame)
+    _profiler.current_frame = None
+    _profiler.frame_index += 1
+    if _profiler.gpu:
+        _collect_gpu_queries()
+
+
+def get_frames() -> List[FrameRecord]:
+    return list(_profiler.frames)
+
+
+def clear() -> None:
+    _profiler.frames.clear()
+
+
+def frame_stats() -> Mapping[str, Mapping[str, float]]:
+    """Get p50/p95/p99 timings in milliseconds over the recorded frames.
+
+    Zone timings are summed per frame, so a zone entered several times in a
+    frame contributes its total. GPU timings are reported as '<name> (gpu)'.
+    """
+    samples: Dict[str, List[float]] = {"frame": []}
+    for frame in _profiler.frames:
+        samples["frame"].append(frame.duration)
+        per_frame: Dict[str, float] = {}
+        for zone_record in frame.zones:
+            per_frame[zone_record.name] = per_frame.get(
+                zone_record.name, 0) + zone_record.duration
+            if zone_record.gpu_duration is not None:
+                gpu_name = f"{zone_record.name} (gpu)"
+                per_frame[gpu_name] = per_frame.get(
+                    gpu_name, 0) + zone_record.gpu_duration
+        for name, duration in per_frame.items():
+            samples.setdefault(name, []).append(duration)
+
+    stats = {}
+    for name, durations in samples.items():
+        if not durations:
+            continue
+        durations.sort()
+        stats[name] = {
+            "p50": _percentile(durations, 50) * 1000,
+            "p95": _percentile(durations, 95) * 1000,
+            "p99": _percentile(durations, 99) * 1000,
+            "max": durations[-1] * 1000,
+            "count": len(durations)
+        }
+    return stats
+
+
+def export_chrome_trace(file_path: str) -> None:
+    """Write the recorded frames as Chrome trace-event JSON.
+
+    The output can be opened in Perfetto or chrome://tracing.
+    """
+    events = [{
+        "name": "thread_name",
+        "ph": "M",
+        "pid": 0,
+        "tid": 0,
+        "args": {
+            "name": "CPU"
+        }
+    }, {
+        "name": "thread_name",
+        "ph": "M",
+        "pid": 0,
+        "tid": 1,
+        "args": {
+            "name": "GPU"
+        }
+    }]
+    for frame in _profiler.frames:
+        events.append(
+            _trace_event(f"frame {frame.index}", "frame", frame.start,
+                         frame.duration, 0))
+        for zone_record in frame.zones:
+            events.append(
+                _trace_event(zone_record.name, "cpu", zone_record.start,
+                             zone_record.duration, 0))
+            if zone_record.gpu_duration is not None:
+                # we only know how long the GPU took, not when it started,
+                # so align it with the CPU zone that submitted the work
+                events.append(
+                    _trace_event(zone_record.name, "gpu", zone_record.start,
+                                 zone_record.gpu_duration, 1))
+
+    with open(file_path, "w") as trace_file:
+        json.dump({
+            "traceEvents": events,
+            "displayTimeUnit": "ms"
+        }, trace_file)
+
+
+def cleanup() -> None:
+    disable()
+    queries = _profiler.free_queries + [
+        query for _, _, query in _profiler.pending_queries
+    ]
+    if queries:
+        GL.glDeleteQueries(len(queries), queries)
+    _profiler.free_queries = []
+    _profiler.pending_queries.clear()
+
+
+def _trace_event(name: str, category: str, start: float, duration: float,
+                 tid: int) -> dict:
+    return {
+        "name": name,
+        "cat": category,
+        "ph": "X",
+        "ts": start * 1e6,
+        "dur": duration * 1e6,
+        "pid": 0,
+        "tid": tid
+    }
+
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    # nearest-rank percentile
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def _acquire_query() -> int:
+    if _profiler.free_queries:
+        return _profiler.free_queries.pop()
+    return GL.glGenQueries(1)
+
+
+def _collect_gpu_queries() -> None:
+    pending = _profiler.pending_queries
+    while pending:
+        frame_index, record, query = pending[0]
+        if _profiler.frame_index - frame_index < GPU_READBACK_LATENCY:
+            break
+
+        available = GL.GLint(0)
+        GL.glGetQueryObjectiv(query, GL.GL_QUERY_RESULT_AVAILABLE,
+                              byref(available))
+        if not available.value:
+            # queries complete in order, if this one isn't done then none of
+            # the later ones will be either
+            break
+
+        elapsed_ns = GL.GLuint64(0)
+        GL.glGetQueryObjectui64v(query, GL.GL_QUERY_RESULT, byref(elapsed_ns))
+        record.gpu_duration = elapsed_ns.value / 1e9
+        pending.popleft()
+        _profiler.free_queries.append(query)
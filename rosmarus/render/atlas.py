@@ -0,0 +1,324 @@
+from __future__ import annotations
+from dataclasses import dataclass
+import hashlib
+import os
+from os import path
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from PIL import Image
+import yaml
+
+from .. import resources
+from ..graphics.texture import Texture2D, TextureRegion
+from ..io import texture_handler
+from ..math.rect import Rect
+from .spritesheet import SpriteSheet
+
+_CACHE_VERSION = 1
+
+
+@dataclass
+class _AtlasSource:
+    name: str
+    path: str
+    sprite_width: int = 0
+    sprite_height: int = 0
+
+
+class _SkylinePacker:
+    """Bottom-left skyline rectangle packer."""
+    def __init__(self, width: int, height: int) -> None:
+        self.width = width
+        self.height = height
+        # segments of [x, y, width], the top edge of what's been packed
+        self.skyline = [[0, 0, width]]
+
+    def insert(self, w: int, h: int) -> Optional[Tuple[int, int]]:
+        best = None
+        for i, (x, _, _) in enumerate(self.skyline):
+            y = self._fit(i, w, h)
+            if y is None:
+                continue
+            if best is None or (y + h, x) < (best[1] + h, best[0]):
+                best = (x, y, i)
+
+        if best is None:
+            return None
+
+        x, y, index = best
+        self._add_segment(index, x, y + h, w)
+        return x, y
+
+    def _fit(self, index: int, w: int, h: int) -> Optional[int]:
+        x = self.skyline[index][0]
+        if x + w > self.width:
+            return None
+
+        y = 0
+        width_left = w
+        while width_left > 0:
+            _, seg_y, seg_w = self.skyline[index]
+            y = max(y, seg_y)
+            if y + h > self.height:
+                return None
+            width_left -= seg_w
+            index += 1
+        return y
+
+    def _add_segment(self, index: int, x: int, y: int, w: int) -> None:
+        self.skyline.insert(index, [x, y, w])
+
+        # trim the segments the new one now covers
+        i = index + 1
+        while i < len(self.skyline):
+            prev_x, _, prev_w = self.skyline[i - 1]
+            seg = self.skyline[i]
+            overlap = prev_x + prev_w - seg[0]
+            if overlap <= 0:
+                break
+            seg[0] += overlap
+            seg[2] -= overlap
+            if seg[2] > 0:
+                break
+            del self.skyline[i]
+
+        # merge neighbours at the same height
+        i = 0
+        while i < len(self.skyline) - 1:
+            if self.skyline[i][1] == self.skyline[i + 1][1]:
+                self.skyline[i][2] += self.skyline[i + 1][2]
+                del self.skyline[i + 1]
+            else:
+                i += 1
+
+
+class TextureAtlas:
+    """Packs many images into a few large textures to avoid texture switches.
+
+    Images (and whole sprite sheets) are added by name, then packed with
+    build(). Afterwards each name has a TextureRegion that SpriteBatch,
+    Sprite and SpriteSheet accept in place of a texture.
+
+    Args:
+        page_size (int): The width and height of each atlas page.
+        padding (int): The gap in pixels left around every image.
+        extrude (bool): Whether to fill the padding with each image's edge
+            pixels, which stops neighbours bleeding in when filtering.
+        texture_kwargs: Passed to each page's Texture2D.
+    """
+    def __init__(self,
+                 page_size: int = 2048,
+                 padding: int = 2,
+                 extrude: bool = True,
+                 **texture_kwargs) -> None:
+        self.page_size = page_size
+        self.padding = padding
+        self.extrude = extrude
+        self.texture_kwargs = {"mipmap": False, **texture_kwargs}
+        self.pages: List[Texture2D] = []
+        self._sources: Dict[str, _AtlasSource] = {}
+        self._regions: Dict[str, TextureRegion] = {}
+
+    def add_image(self, name: str, image_path: str) -> None:
+        self._add_source(_AtlasSource(name, image_path))
+
+    def add_sheet(self, name: str, image_path: str, sprite_width: int,
+                  sprite_height: int) -> None:
+        self._add_source(
+            _AtlasSource(name, image_path, sprite_width, sprite_height))
+
+    def build(self, cache_path: str = None) -> None:
+        """Pack everything that has been added into atlas pages.
+
+        Args:
+            cache_path (str): If given, the packed pages and layout are saved
+                here (relative to the data path), and reused on later builds
+                as long as none of the sources have changed.
+        """
+        self.cleanup()
+        signature = self._signature()
+        if cache_path is not None:
+            cache_path = path.join(resources._DATA_PATH, cache_path)
+            layout = _read_layout(cache_path, signature)
+            if layout is not None:
+                self._load_cached(cache_path, layout)
+                return
+
+        page_images, placements = self._pack()
+        self.pages = [
+            Texture2D(page_img.width,
+                      page_img.height,
+                      page_img.tobytes(),
+                      top_down=True,
+                      **self.texture_kwargs) for page_img in page_images
+        ]
+        self._set_regions(placements)
+
+        if cache_path is not None:
+            self._write_cache(cache_path, signature, page_images, placements)
+
+    def get_region(self, name: str) -> TextureRegion:
+        return self._regions[name]
+
+    def __getitem__(self, name: str) -> TextureRegion:
+        return self._regions[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._regions
+
+    def get_sprite_sheet(self, name: str) -> SpriteSheet:
+        source = self._sources[name]
+        if source.sprite_width == 0:
+            raise ValueError(f"Atlas entry '{name}' is not a sprite sheet")
+        return SpriteSheet(self._regions[name], source.sprite_width,
+                           source.sprite_height)
+
+    def cleanup(self) -> None:
+        for page in self.pages:
+            page.cleanup()
+        self.pages = []
+        self._regions = {}
+
+    def _add_source(self, source: _AtlasSource) -> None:
+        if source.name in self._sources:
+            raise ValueError(f"Atlas already contains '{source.name}'")
+        self._sources[source.name] = source
+
+    def _source_path(self, source: _AtlasSource) -> str:
+        return path.join(resources._DATA_PATH, source.path)
+
+    def _signature(self) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(
+            repr((_CACHE_VERSION, self.page_size, self.padding,
+                  self.extrude)).encode())
+        for source in sorted(self._sources.values(), key=lambda s: s.name):
+            stat = os.stat(self._source_path(source))
+            digest.update(
+                repr((source.name, source.path, source.sprite_width,
+                      source.sprite_height, stat.st_size,
+                      stat.st_mtime_ns)).encode())
+        return digest.hexdigest()
+
+    def _pack(self) -> Tuple[List[Image.Image], Mapping[str, tuple]]:
+        images = {}
+        for source in self._sources.values():
+            with Image.open(self._source_path(source)) as img:
+                images[source.name] = img.convert("RGBA")
+
+        # packing tallest first gives a much flatter skyline
+        order = sorted(images,
+                       key=lambda name:
+                       (images[name].height, images[name].width),
+                       reverse=True)
+
+        pad = self.padding
+        packers: List[_SkylinePacker] = []
+        page_images: List[Image.Image] = []
+        placements = {}
+        for name in order:
+            img = images[name]
+            padded_w, padded_h = img.width + pad * 2, img.height + pad * 2
+            if padded_w > self.page_size or padded_h > self.page_size:
+                raise ValueError(
+                    f"Image '{name}' is too big for atlas pages of size "
+                    f"{self.page_size}")
+
+            for page, packer in enumerate(packers):
+                pos = packer.insert(padded_w, padded_h)
+                if pos is not None:
+                    break
+            else:
+                packers.append(_SkylinePacker(self.page_size, self.page_size))
+                page_images.append(
+                    Image.new("RGBA", (self.page_size, self.page_size)))
+                page = len(packers) - 1
+                pos = packers[page].insert(padded_w, padded_h)
+
+            x, y = pos[0] + pad, pos[1] + pad
+            page_images[page].paste(img, (x, y))
+            if self.extrude:
+                _extrude(page_images[page], img, x, y, pad)
+            placements[name] = (page, x, y, img.width, img.height)
+
+        return page_images, placements
+
+    def _set_regions(self, placements: Mapping[str, tuple]) -> None:
+        self._regions = {
+            name: TextureRegion(self.pages[page], Rect(x, y, w, h))
+            for name, (page, x, y, w, h) in placements.items()
+        }
+
+    def _load_cached(self, cache_path: str, layout: Mapping) -> None:
+        for page_file in layout["pages"]:
+            decoded = texture_handler.decode_texture(
+                path.join(path.dirname(cache_path), page_file))
+            self.pages.append(
+                texture_handler.upload_texture(decoded,
+                                               **self.texture_kwargs))
+        self._set_regions(
+            {name: tuple(place)
+             for name, place in layout["regions"].items()})
+
+    def _write_cache(self, cache_path: str, signature: str,
+                     page_images: List[Image.Image],
+                     placements: Mapping[str, tuple]) -> None:
+        cache_dir = path.dirname(cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        page_files = []
+        for i, page_img in enumerate(page_images):
+            page_file = f"{path.basename(cache_path)}_{i}.png"
+            page_img.save(path.join(cache_dir, page_file))
+            page_files.append(page_file)
+
+        with open(f"{cache_path}.yml", "w") as layout_file:
+            yaml.safe_dump(
+                {
+                    "signature": signature,
+                    "pages": page_files,
+                    "regions":
+                    {name: list(place)
+                     for name, place in placements.items()}
+                }, layout_file)
+
+
+def _read_layout(cache_path: str, signature: str) -> Optional[Mapping]:
+    try:
+        with open(f"{cache_path}.yml", "r") as layout_file:
+            layout = yaml.safe_load(layout_file)
+    except OSError:
+        return None
+
+    if not layout or layout.get("signature") != signature:
+        return None
+    cache_dir = path.dirname(cache_path)
+    if not all(
+            path.exists(path.join(cache_dir, page))
+            for page in layout["pages"]):
+        return None
+    return layout
+
+
+def _extrude(page: Image.Image, img: Image.Image, x: int, y: int,
+             amount: int) -> None:
+    # repeat the outermost pixels of the image out into its padding
+    w, h = img.size
+    left = img.crop((0, 0, 1, h))
+    right = img.crop((w - 1, 0, w, h))
+    top = img.crop((0, 0, w, 1))
+    bottom = img.crop((0, h - 1, w, h))
+    for i in range(1, amount + 1):
+        page.paste(left, (x - i, y))
+        page.paste(right, (x + w - 1 + i, y))
+        page.paste(top, (x, y - i))
+        page.paste(bottom, (x, y + h - 1 + i))
+
+    page.paste(img.getpixel((0, 0)), (x - amount, y - amount, x, y))
+    page.paste(img.getpixel((w - 1, 0)), (x + w, y - amount, x + w + amount,
+                                          y))
+    page.paste(img.getpixel((0, h - 1)), (x - amount, y + h, x, y + h +
+                                          amount))
+    page.paste(img.getpixel((w - 1, h - 1)),
+               (x + w, y + h, x + w + amount, y + h + amount))
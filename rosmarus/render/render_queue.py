@@ -0,0 +1,296 @@
+from __future__ import annotations
+from ctypes import c_void_p
+from dataclasses import dataclass
+from typing import Dict, List
+
+import glm
+import numpy as np
+from OpenGL import GL
+
+from ..graphics.camera import Camera
+from ..graphics.mesh import Mesh
+from ..graphics.uniform_buffer import CAMERA_BLOCK
+from .renderable import Renderable, set_texture_orientation
+
+# the name of the shader variant used for instanced draws, and the
+# attribute locations it reads its per-instance data from
+INSTANCED_VARIANT = "instanced"
+INSTANCE_MODEL_LOCATION = 4  # a mat4, so locations 4-7
+INSTANCE_TINT_LOCATION = 8
+
+# per instance: a column-major mat4 model matrix, then a vec4 tint
+_INSTANCE_FLOATS = 20
+_INSTANCE_STRIDE = _INSTANCE_FLOATS * 4
+
+# bit widths of each field of the sort key, from most to least significant
+_LAYER_BITS = 8
+_TRANSPARENT_BITS = 1
+_SHADER_BITS = 10
+_TEXTURE_BITS = 14
+_MESH_BITS = 14
+_DEPTH_BITS = 16
+
+MAX_LAYER = (1 << _LAYER_BITS) - 1
+
+
+@dataclass
+class _RenderItem:
+    renderable: Renderable
+    layer: int
+    elements: int
+    depth: float = 0
+    key: int = 0
+
+
+class RenderQueue:
+    """Collects Renderables and draws them sorted to minimise state changes.
+
+    Submissions are sorted by a packed key of layer, transparency, shader,
+    texture, mesh and depth. Opaque items are drawn front-to-back to get the
+    most out of the depth test, and transparent ones back-to-front so they
+    blend correctly. When executing, the shader, camera, texture and mesh are
+    only changed when they differ from the previous item.
+
+    Consecutive items with the same shader, texture and mesh are merged into
+    a single instanced draw, if the shader has an 'instanced' variant. That
+    variant must read each instance's model matrix from a mat4 attribute at
+    location 4 and its tint from a vec4 attribute at location 8, instead of
+    the ModelMatrix and TintColor uniforms.
+
+    Args:
+        camera (Camera): The camera to draw with.
+    """
+    def __init__(self, camera: Camera) -> None:
+        self.camera = camera
+        self.draw_calls = 0
+        self.instanced_draws = 0
+        self.state_changes = 0
+        self._items: List[_RenderItem] = []
+        self._instance_buffer = None
+        self._instance_capacity = 0
+
+    def submit(self,
+               renderable: Renderable,
+               layer: int = 0,
+               elements: int = -1) -> None:
+        """Queue a renderable to be drawn when execute() is called.
+
+        Args:
+            renderable (Renderable): What to draw.
+            layer (int): Lower layers are drawn first, from 0 to MAX_LAYER.
+            elements (int): How many indices to draw, -1 draws all of them.
+        """
+        if not renderable.active:
+            return
+        if renderable.mesh is None or renderable.shader is None:
+            return
+        if not 0 <= layer <= MAX_LAYER:
+            raise ValueError(f"Layer must be between 0 and {MAX_LAYER}")
+        self._items.append(_RenderItem(renderable, layer, elements))
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    def execute(self) -> None:
+        """Draw everything submitted since the last execute, then clear."""
+        items = self._items
+        self._items = []
+        self.draw_calls = 0
+        self.instanced_draws = 0
+        self.state_changes = 0
+        if not items:
+            return
+
+        self._compute_keys(items)
+        items.sort(key=lambda item: item.key)
+
+        runs = _merge_runs(items)
+        self._upload_instances(runs)
+
+        shader = texture = mesh = None
+        camera_uploaded = False
+        instance_offset = 0
+        for run in runs:
+            first = run[0].renderable
+            instanced = _can_instance(run)
+            run_shader = first.shader
+            if instanced:
+                run_shader = first.shader.variant(INSTANCED_VARIANT)
+
+            if run_shader is not shader:
+                shader = run_shader
+                shader.bind()
+                if shader.has_uniform_block(CAMERA_BLOCK):
+                    if not camera_uploaded:
+                        self.camera.upload()
+                        camera_uploaded = True
+                else:
+                    shader.set_mat4("ViewMatrix", self.camera.view_matrix())
+                    shader.set_mat4("ProjectionMatrix",
+                                    self.camera.get_projection())
+                self.state_changes += 1
+            if first.texture is not texture:
+                texture = first.texture
+                if texture is not None:
+                    texture.bind()
+                self.state_changes += 1
+            if first.mesh is not mesh:
+                mesh = first.mesh
+                mesh.bind()
+                self.state_changes += 1
+            # the shader skips the upload when it already has this value
+            set_texture_orientation(shader, texture)
+
+            if instanced:
+                self._draw_instanced(mesh, run, instance_offset)
+                instance_offset += len(run)
+                continue
+
+            for item in run:
+                renderable = item.renderable
+                shader.set_mat4("ModelMatrix", renderable.transform.matrix())
+                shader.set_vec4("TintColor", renderable.tint.to_vec4())
+                mesh.render(item.elements)
+                self.draw_calls += 1
+
+    def cleanup(self) -> None:
+        if self._instance_buffer is not None:
+            GL.glDeleteBuffers(1, [self._instance_buffer])
+            self._instance_buffer = None
+            self._instance_capacity = 0
+
+    def _compute_keys(self, items: List[_RenderItem]) -> None:
+        view = self.camera.view_matrix()
+        for item in items:
+            # the translation column of the world matrix works for both 2D
+            # and 3D transforms, parented or not
+            position = glm.vec3(item.renderable.transform.matrix()[3])
+            # distance in front of the camera, which looks down -z
+            item.depth = -(view * glm.vec4(position, 1)).z
+
+        min_depth = min(item.depth for item in items)
+        depth_range = max(item.depth for item in items) - min_depth
+        depth_scale = ((1 << _DEPTH_BITS) - 1) / depth_range \
+            if depth_range > 0 else 0
+
+        # GL handles can be large, so give each state a small dense id for
+        # this frame. If there are more than fit in the key they alias, which
+        # only costs some extra state changes as execute() compares the
+        # actual objects
+        shader_ids: Dict[int, int] = {}
+        texture_ids: Dict[int, int] = {}
+        mesh_ids: Dict[int, int] = {}
+        for item in items:
+            renderable = item.renderable
+            transparent = 1 if renderable.transparent else 0
+            shader_id = _dense_id(shader_ids, renderable.shader.get_handle(),
+                                  _SHADER_BITS)
+            texture_id = _dense_id(
+                texture_ids, 0 if renderable.texture is None else
+                renderable.texture.get_handle(), _TEXTURE_BITS)
+            mesh_id = _dense_id(mesh_ids, renderable.mesh.vao, _MESH_BITS)
+            depth = int((item.depth - min_depth) * depth_scale)
+
+            key = (item.layer << _TRANSPARENT_BITS) | transparent
+            if transparent:
+                # back-to-front, and depth has to come before state or the
+                # blending would be wrong
+                depth = (1 << _DEPTH_BITS) - 1 - depth
+                key = (key << _DEPTH_BITS) | depth
+                key = (key << _SHADER_BITS) | shader_id
+                key = (key << _TEXTURE_BITS) | texture_id
+                key = (key << _MESH_BITS) | mesh_id
+            else:
+                key = (key << _SHADER_BITS) | shader_id
+                key = (key << _TEXTURE_BITS) | texture_id
+                key = (key << _MESH_BITS) | mesh_id
+                key = (key << _DEPTH_BITS) | depth
+            item.key = key
+
+    def _upload_instances(self, runs: List[List[_RenderItem]]) -> None:
+        instanced_runs = [run for run in runs if _can_instance(run)]
+        if not instanced_runs:
+            return
+
+        count = sum(len(run) for run in instanced_runs)
+        data = np.empty((count, _INSTANCE_FLOATS), dtype=np.float32)
+        row = 0
+        for run in instanced_runs:
+            for item in run:
+                renderable = item.renderable
+                # to_bytes keeps glm's column-major layout, which is what
+                # a mat4 attribute expects
+                data[row, :16] = np.frombuffer(
+                    renderable.transform.matrix().to_bytes(), np.float32)
+                data[row, 16:] = renderable.tint.to_tuple()
+                row += 1
+
+        if self._instance_buffer is None:
+            self._instance_buffer = GL.glGenBuffers(1)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self._instance_buffer)
+        if data.nbytes > self._instance_capacity:
+            # grow geometrically so we don't reallocate every few frames
+            self._instance_capacity = max(data.nbytes,
+                                          self._instance_capacity * 2)
+            GL.glBufferData(GL.GL_ARRAY_BUFFER, self._instance_capacity, None,
+                            GL.GL_STREAM_DRAW)
+        GL.glBufferSubData(GL.GL_ARRAY_BUFFER, 0, data.nbytes,
+                           c_void_p(data.ctypes.data))
+
+    def _draw_instanced(self, mesh: Mesh, run: List[_RenderItem],
+                        instance_offset: int) -> None:
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self._instance_buffer)
+        first_time = mesh.instance_buffer != self._instance_buffer
+        base = instance_offset * _INSTANCE_STRIDE
+        for column in range(4):
+            location = INSTANCE_MODEL_LOCATION + column
+            if first_time:
+                GL.glEnableVertexAttribArray(location)
+                GL.glVertexAttribDivisor(location, 1)
+            GL.glVertexAttribPointer(location, 4, GL.GL_FLOAT, GL.GL_FALSE,
+                                     _INSTANCE_STRIDE,
+                                     c_void_p(base + column * 16))
+        if first_time:
+            GL.glEnableVertexAttribArray(INSTANCE_TINT_LOCATION)
+            GL.glVertexAttribDivisor(INSTANCE_TINT_LOCATION, 1)
+            mesh.instance_buffer = self._instance_buffer
+        GL.glVertexAttribPointer(INSTANCE_TINT_LOCATION, 4, GL.GL_FLOAT,
+                                 GL.GL_FALSE, _INSTANCE_STRIDE,
+                                 c_void_p(base + 64))
+
+        elements = run[0].elements
+        if elements == -1:
+            elements = len(mesh.indices)
+        GL.glDrawElementsInstanced(GL.GL_TRIANGLES, elements, mesh.index_type,
+                                   None, len(run))
+        self.draw_calls += 1
+        self.instanced_draws += 1
+
+
+def _dense_id(ids: Dict[int, int], handle: int, bits: int) -> int:
+    dense = ids.get(handle)
+    if dense is None:
+        dense = ids[handle] = len(ids)
+    return dense & ((1 << bits) - 1)
+
+
+def _can_instance(run: List[_RenderItem]) -> bool:
+    return len(run) > 1 and \
+        INSTANCED_VARIANT in run[0].renderable.shader.variants
+
+
+def _merge_runs(items: List[_RenderItem]) -> List[List[_RenderItem]]:
+    # group consecutive items that could be drawn in one instanced draw,
+    # keeping the sorted order within and between groups
+    runs = []
+    for item in items:
+        if runs:
+            last = runs[-1][0]
+            if (last.renderable.mesh is item.renderable.mesh
+                    and last.renderable.shader is item.renderable.shader
+                    and last.renderable.texture is item.renderable.texture
+                    and last.elements == item.elements):
+                runs[-1].append(item)
+                continue
+        runs.append([item])
+    return runs
@@ -8,9 +8,20 @@ from ..graphics.camera import Camera
 from ..graphics.mesh import Mesh
 from ..graphics.shader import Shader
 from ..graphics.texture import Texture2D
+from ..graphics.uniform_buffer import CAMERA_BLOCK
 from ..graphics import color
 from ..math.transform import Transform
 
+# a bool uniform telling shaders to flip V, as textures loaded from images
+# are stored top row first rather than flipped for GL, see main.shader
+FLIP_V_UNIFORM = "FlipV"
+
+
+def set_texture_orientation(shader: Shader, texture: Texture2D) -> None:
+    """Tell the shader whether to flip V when sampling the texture."""
+    shader.set_bool(FLIP_V_UNIFORM, texture is not None
+                    and texture.top_down)
+
 
 class Renderable:
     def __init__(self,
@@ -44,10 +55,12 @@ class Renderable:
 
         self.shader.bind()
         self.shader.set_mat4("ModelMatrix", self.transform.matrix())
-        self.shader.set_mat4("ViewMatrix", camera.view_matrix())
-        self.shader.set_mat4("ProjectionMatrix", camera.get_projection())
+        if self.shader.has_uniform_block(CAMERA_BLOCK):
+            camera.upload()
+        else:
+            self.shader.set_mat4("ViewMatrix", camera.view_matrix())
+            self.shader.set_mat4("ProjectionMatrix", camera.get_projection())
         self.shader.set_vec4("TintColor", self.tint.to_vec4())
+        set_texture_orientation(self.shader, self.texture)
         self.texture.bind()
         self.mesh.render(elements)
-        self.texture.unbind()
-        self.shader.unbind()
@@ -1,4 +1,6 @@
-from ..graphics.texture import Texture2D
+from typing import Union
+
+from ..graphics.texture import Texture2D, TextureRegion
 from ..render.spritebatch import SpriteBatch
 from ..math.transform import Transform2D
 from ..math.rect import Rect
@@ -6,7 +8,7 @@ from ..math.rect import Rect
 
 class Sprite:
     def __init__(self,
-                 texture: Texture2D,
+                 texture: Union[Texture2D, TextureRegion],
                  transform: Transform2D = Transform2D(),
                  tex_region: Rect = None,
                  x_pos: int = 0,
@@ -1,17 +1,19 @@
-from itertools import repeat
+from typing import Union
 
 import glm
+import numpy as np
 from OpenGL import GL
 
-from ..graphics.vertex import Vertex
+from ..graphics.vertex import VERTEX_DTYPE, VERTEX_FLOATS
 from ..graphics.mesh import Mesh
 from ..graphics.shader import Shader
 from ..graphics.camera import Camera
 from .renderable import Renderable
 from ..math.transform import Transform2D
-from ..graphics.texture import Texture2D
+from ..graphics.texture import Texture2D, TextureRegion
 from ..graphics import color
 from ..math.rect import Rect
+from .. import profiler
 
 _SB_VERTEX_SHADER = """#version 330 core
 
@@ -20,8 +22,12 @@ layout (location = 2) in vec2 in_UV;
 layout (location = 3) in vec4 in_Color;
 
 uniform mat4 ModelMatrix;
-uniform mat4 ViewMatrix;
-uniform mat4 ProjectionMatrix;
+
+layout (std140) uniform Camera
+{
+    mat4 ViewMatrix;
+    mat4 ProjectionMatrix;
+};
 
 out vec2 TexCoords;
 out vec4 VertexColor;
@@ -60,8 +66,11 @@ class SpriteBatch:
         self.size = size
         self.length = size * 4  # 4 verts per size
 
-        verts = list(repeat(Vertex(glm.vec4(0, 0, 0, 0)), self.length))
-        indices = [i for i in range(0, size * 6)]  # 2 tris per sprite
+        verts = np.zeros(self.length, dtype=VERTEX_DTYPE)
+        # every sprite is a quad, so the indices never change and can be
+        # generated up front -- 2 tris per sprite: (0 2 1), (0 3 2)
+        indices = (np.arange(0, self.length, 4).reshape(-1, 1) +
+                   np.array([0, 2, 1, 0, 3, 2])).reshape(-1)
 
         self.renderable = Renderable(
             Mesh(verts, indices, usage=GL.GL_DYNAMIC_DRAW),
@@ -70,6 +79,9 @@ class SpriteBatch:
                 "fragment": _SB_FRAGMENT_SHADER
             }), transform)
         self.vertices, self.indices = self.renderable.mesh.get_data()
+        # vertices are written as flat runs of floats, which is much cheaper
+        # than going through the structured array
+        self._vertex_floats = self.vertices.view(np.float32)
 
         self.camera = camera
 
@@ -112,17 +124,18 @@ class SpriteBatch:
                 "Cannot flush SpriteBatch without setting its Camera")
 
         self.render_calls += 1
-        self.renderable.mesh.reupload_data()
+        with profiler.zone("SpriteBatch.flush", gpu=True):
+            self.renderable.mesh.reupload_data(self.vertices_drawn, 0)
 
-        sprite_count = self.vertices_drawn / 4  # 4 verts per sprite
-        self.renderable.draw(self.camera, elements=int(
-            sprite_count * 6))  # 6 indices per sprite
+            sprite_count = self.vertices_drawn / 4  # 4 verts per sprite
+            self.renderable.draw(self.camera, elements=int(
+                sprite_count * 6))  # 6 indices per sprite
 
         self.vertices_drawn = 0
         self.indices_drawn = 0
 
     def draw(self,
-             tex: Texture2D,
+             tex: Union[Texture2D, TextureRegion],
              x_pos: int = 0,
              y_pos: int = 0,
              scale_x: int = 1,
@@ -133,6 +146,14 @@ class SpriteBatch:
              tint: color.Color = color.WHITE,
              transform: Transform2D = None,
              tex_region: Rect = None) -> None:
+        if isinstance(tex, TextureRegion):
+            # draw the region like a texture of its own, tex_region is then
+            # relative to it
+            if tex_region is None:
+                tex_region = Rect(0, 0, *tex.get_size())
+            tex_region = tex.to_texture_rect(tex_region)
+            tex = tex.texture
+
         if tex != self.renderable.texture:
             self._switch_texture(tex)
 
@@ -149,10 +170,14 @@ class SpriteBatch:
             height = t_height
 
         if tex_region is not None:
+            # regions are in image space, with y going down from the top
             u, v2, u2, v = tex.region_to_uvs(tex_region).get_extent_tuple()
-            v = 1 - v
-            v2 = 1 - v2
+            if not tex.top_down:
+                v = 1 - v
+                v2 = 1 - v2
             width, height = tex_region.get_size()
+        elif tex.top_down:
+            v, v2 = v2, v
 
         x, y = -(width / 2), -(height / 2)
         x2, y2 = x + width, y + height
@@ -165,35 +190,20 @@ class SpriteBatch:
             if scale_x != 1 or scale_y != 1:
                 transform.set_scale((scale_x, scale_y))
 
-        tint_col = tint.to_vec4()
-
-        # create the vertices
-        v0 = Vertex(transform.matrix() * glm.vec4(x, y, -1, 1),
-                    uv=glm.vec2(u, v),
-                    color=tint_col)
-        v1 = Vertex(transform.matrix() * glm.vec4(x, y2, -1, 1),
-                    uv=glm.vec2(u, v2),
-                    color=tint_col)
-        v2 = Vertex(transform.matrix() * glm.vec4(x2, y2, -1, 1),
-                    uv=glm.vec2(u2, v2),
-                    color=tint_col)
-        v3 = Vertex(transform.matrix() * glm.vec4(x2, y, -1, 1),
-                    uv=glm.vec2(u2, v),
-                    color=tint_col)
-
-        # add the vertices to the mesh data
-        self.vertices[self.vertices_drawn] = v0
-        self.vertices[self.vertices_drawn + 1] = v1
-        self.vertices[self.vertices_drawn + 2] = v2
-        self.vertices[self.vertices_drawn + 3] = v3
-
-        # add the indices to the mesh data -- 2 tris, indices: (0 2 1), (0 3 2)
-        self.indices[self.indices_drawn] = self.vertices_drawn
-        self.indices[self.indices_drawn + 1] = self.vertices_drawn + 2
-        self.indices[self.indices_drawn + 2] = self.vertices_drawn + 1
-        self.indices[self.indices_drawn + 3] = self.vertices_drawn
-        self.indices[self.indices_drawn + 4] = self.vertices_drawn + 3
-        self.indices[self.indices_drawn + 5] = self.vertices_drawn + 2
+        r, g, b, a = tint.to_vec4()
+        matrix = transform.matrix()
+        p0 = matrix * glm.vec4(x, y, -1, 1)
+        p1 = matrix * glm.vec4(x, y2, -1, 1)
+        p2 = matrix * glm.vec4(x2, y2, -1, 1)
+        p3 = matrix * glm.vec4(x2, y, -1, 1)
+
+        # add the vertices to the mesh data: position, normal, uv, color
+        start = self.vertices_drawn * VERTEX_FLOATS
+        self._vertex_floats[start:start + 4 * VERTEX_FLOATS] = (
+            p0.x, p0.y, p0.z, p0.w, 0, 0, 0, u, v, r, g, b, a,
+            p1.x, p1.y, p1.z, p1.w, 0, 0, 0, u, v2, r, g, b, a,
+            p2.x, p2.y, p2.z, p2.w, 0, 0, 0, u2, v2, r, g, b, a,
+            p3.x, p3.y, p3.z, p3.w, 0, 0, 0, u2, v, r, g, b, a)
 
         # update counts
         self.vertices_drawn += 4
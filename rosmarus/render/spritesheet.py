@@ -1,13 +1,13 @@
-from typing import Tuple
+from typing import Tuple, Union
 
-from ..graphics.texture import Texture2D
+from ..graphics.texture import Texture2D, TextureRegion
 from .sprite import Sprite
 from ..math.rect import Rect
 
 
 class SpriteSheet:
-    def __init__(self, texture: Texture2D, sprite_width: int,
-                 sprite_height: int) -> None:
+    def __init__(self, texture: Union[Texture2D, TextureRegion],
+                 sprite_width: int, sprite_height: int) -> None:
         self.texture = texture
         self.sprite_width = sprite_width
         self.sprite_height = sprite_height
@@ -0,0 +1,205 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import List, Tuple
+
+import glm
+import numpy as np
+
+from ..graphics.camera import Camera
+from ..graphics.mesh import Mesh
+from ..graphics.shader import Shader
+from ..graphics.texture import Texture2D
+from ..graphics.vertex import VERTEX_DTYPE
+from ..math.transform import Transform
+from .renderable import Renderable
+
+
+@dataclass
+class _Member:
+    renderable: Renderable
+    vertex_start: int = 0
+    vertex_count: int = 0
+    index_start: int = 0
+    index_count: int = 0
+    matrix: glm.mat4 = None
+    tint: tuple = None
+    active: bool = True
+
+
+class StaticBatch:
+    """Merges Renderables sharing a shader and texture into a single Mesh.
+
+    Each member's vertices are transformed by its Transform and tinted by its
+    tint when merged, so the whole batch draws in one call. Members can still
+    be hidden with Renderable.set_active, and moved or re-tinted: update()
+    (called by draw()) finds what changed and only re-merges those members.
+
+    The merged geometry is also available as a Renderable, so the batch can
+    be submitted to a RenderQueue:
+
+        queue.submit(batch.renderable, elements=batch.element_count)
+
+    Args:
+        shader (Shader): The shader every member uses.
+        texture (Texture2D): The texture every member uses.
+    """
+    def __init__(self, shader: Shader, texture: Texture2D) -> None:
+        self.shader = shader
+        self.texture = texture
+        self.renderable: Renderable = None
+        self.element_count = 0
+        self._members: List[_Member] = []
+        self._all_indices: np.ndarray = None
+        self._needs_build = False
+
+    def add(self, renderable: Renderable) -> int:
+        """Add a renderable to the batch, returning its member index.
+
+        The renderable's mesh must still have its data, as it's copied when
+        the batch is next built.
+        """
+        if renderable.shader is not self.shader \
+                or renderable.texture is not self.texture:
+            raise ValueError(
+                "StaticBatch members must use the batch's shader and texture")
+        self._members.append(_Member(renderable))
+        self._needs_build = True
+        return len(self._members) - 1
+
+    def get_renderable(self, member: int) -> Renderable:
+        return self._members[member].renderable
+
+    def get_draw_range(self, member: int) -> Tuple[int, int]:
+        """Get the (first index, index count) of a member in the merged
+        mesh, with every member visible."""
+        member = self._members[member]
+        return member.index_start, member.index_count
+
+    def build(self) -> None:
+        """Merge every member into a new Mesh."""
+        vertex_total = 0
+        index_total = 0
+        for member in self._members:
+            vertices, indices = member.renderable.mesh.get_data()
+            member.vertex_start = vertex_total
+            member.vertex_count = len(vertices)
+            member.index_start = index_total
+            member.index_count = len(indices)
+            vertex_total += len(vertices)
+            index_total += len(indices)
+
+        merged_vertices = np.empty(vertex_total, dtype=VERTEX_DTYPE)
+        all_indices = np.empty(index_total, dtype=np.uint32)
+        for member in self._members:
+            vertices, indices = member.renderable.mesh.get_data()
+            self._bake_member(member, _vertex_range(merged_vertices, member),
+                              vertices)
+            index_end = member.index_start + member.index_count
+            all_indices[member.index_start:index_end] = \
+                indices + member.vertex_start
+            member.active = member.renderable.active
+
+        if self.renderable is not None:
+            self.renderable.mesh.cleanup()
+        mesh = Mesh(merged_vertices, all_indices)
+        self.renderable = Renderable(mesh, self.shader, self.texture,
+                                     Transform())
+        # the mesh may have narrowed them, and needs its own copy anyway as
+        # hidden members get compacted out of it
+        self._all_indices = mesh.indices.copy()
+        self._compact_indices()
+        self._needs_build = False
+
+    def update(self) -> int:
+        """Re-merge members that have moved, been re-tinted or toggled.
+
+        Returns:
+            int: How many members had to be re-merged.
+        """
+        if self._needs_build:
+            self.build()
+            return len(self._members)
+        if self.renderable is None:
+            # nothing has been added yet
+            return 0
+
+        merged_vertices, _ = self.renderable.mesh.get_data()
+        updated = 0
+        toggled = False
+        for member in self._members:
+            renderable = member.renderable
+            if renderable.active != member.active:
+                member.active = renderable.active
+                toggled = True
+            if renderable.transform.matrix() == member.matrix \
+                    and renderable.tint.to_tuple() == member.tint:
+                continue
+
+            vertices, _ = renderable.mesh.get_data()
+            self._bake_member(member, _vertex_range(merged_vertices, member),
+                              vertices)
+            self.renderable.mesh.reupload_vertices(member.vertex_start,
+                                                   member.vertex_count)
+            updated += 1
+
+        if toggled:
+            self._compact_indices()
+        return updated
+
+    def draw(self, camera: Camera) -> None:
+        self.update()
+        if self.renderable is not None and self.element_count > 0:
+            self.renderable.draw(camera, self.element_count)
+
+    def cleanup(self) -> None:
+        if self.renderable is not None:
+            self.renderable.mesh.cleanup()
+            self.renderable = None
+
+    def _bake_member(self, member: _Member, target: np.ndarray,
+                     source: np.ndarray) -> None:
+        renderable = member.renderable
+        matrix = renderable.transform.matrix()
+        tint = renderable.tint.to_tuple()
+
+        # np.asarray gives glm matrices in row-major order, so these are the
+        # usual maths matrices and transform row vectors by their transpose
+        model = np.asarray(matrix, dtype=np.float32)
+        try:
+            normal_matrix = np.linalg.inv(model[:3, :3]).T
+        except np.linalg.LinAlgError:
+            # a zero scale flattens the member, which has no inverse, but the
+            # pseudo-inverse still gives sensible normals for the axes left
+            normal_matrix = np.linalg.pinv(model[:3, :3]).T
+
+        target[:] = source
+        target["position"] = source["position"] @ model.T
+        normals = source["normal"] @ normal_matrix.T
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        np.divide(normals, lengths, out=normals, where=lengths > 0)
+        target["normal"] = normals
+        target["color"] = source["color"] * np.asarray(tint,
+                                                       dtype=np.float32)
+
+        member.matrix = glm.mat4(matrix)
+        member.tint = tint
+
+    def _compact_indices(self) -> None:
+        # hidden members are dropped from the index buffer, so what's left
+        # still draws with a single call
+        mesh = self.renderable.mesh
+        count = 0
+        for member in self._members:
+            if not member.active:
+                continue
+            index_end = member.index_start + member.index_count
+            mesh.indices[count:count + member.index_count] = \
+                self._all_indices[member.index_start:index_end]
+            count += member.index_count
+        self.element_count = count
+        mesh.reupload_data(0, count)
+
+
+def _vertex_range(vertices: np.ndarray, member: _Member) -> np.ndarray:
+    return vertices[member.vertex_start:member.vertex_start +
+                    member.vertex_count]
@@ -1,36 +1,150 @@
 from __future__ import annotations
-from collections import namedtuple
-from typing import Callable
+from collections import deque, OrderedDict
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from functools import partial
+import logging
+import time
+from typing import (Callable, ContextManager, Dict, Hashable, List, Mapping,
+                    Sequence, Set, Tuple)
 from os import path as os_path
 
+import yaml
+
 _resource_handlers = {}
 _resource_cleaner_uppers = {}
-_resource_cache = {}
+_resource_decoders = {}
+_resource_uploaders = {}
+_resource_sizers = {}
+
+# cache entries are kept in least to most recently used order
+_resource_cache: OrderedDict[Tuple, _CacheEntry] = OrderedDict()
+_lifespans: Dict[str, Set[Tuple]] = {}
+_resource_keys: Dict[int, Tuple] = {}
+_memory_budget = None
+_cache_size = 0
+
+# async loading state, futures are only ever resolved on the main thread
+_pending_loads: Dict[Tuple, _PendingLoad] = {}
+_upload_queue = deque()
+_executor = None
 
-resource = namedtuple("resource", ["loaded", "lifespan", "type"])
+# stack of lists that loads are being recorded into
+_recordings = []
+# the exact types yaml.safe_dump can write, subclasses like GL enums can't be
+_YAML_SCALARS = (type(None), bool, int, float, str)
 
 _DATA_PATH = ""
 
+MAX_DECODE_WORKERS = 4
+
+# seconds per frame spent finishing async loads on the main thread
+DEFAULT_UPLOAD_BUDGET = 0.002
+
+
+@dataclass
+class _CacheEntry:
+    key: Tuple
+    loaded: object
+    lifespan: str
+    type: str
+    size: int = 0
+    refcount: int = 0
+
+
+@dataclass
+class _PendingLoad:
+    future: Future
+    lifespan: str
+    requests: int = 1
+
+
+@dataclass
+class ManifestEntry:
+    """A resource to be loaded, with the arguments to load it with."""
+    type: str
+    path: str
+    lifespan: str = ""
+    args: list = field(default_factory=list)
+    kwargs: dict = field(default_factory=dict)
+
+
+class Preload:
+    """Tracks the progress of a set of async loads."""
+    def __init__(self, futures: Sequence[Future]) -> None:
+        self.futures = list(futures)
+
+    def progress(self) -> float:
+        if not self.futures:
+            return 1.0
+        return sum(future.done() for future in self.futures) / len(
+            self.futures)
+
+    def ready(self) -> bool:
+        return all(future.done() for future in self.futures)
+
+    def errors(self) -> List[BaseException]:
+        return [
+            future.exception() for future in self.futures
+            if future.done() and future.exception() is not None
+        ]
+
+    def release(self) -> None:
+        """Release the references the preload holds on what it loaded."""
+        for future in self.futures:
+            if future.done() and future.exception() is None:
+                release(future.result())
+        self.futures = []
+
 
 def register_type_handler(resource_type: str,
                           loader: Callable[[str], object],
-                          cleaner_upper: Callable = None) -> None:
+                          cleaner_upper: Callable = None,
+                          decoder: Callable[[str], object] = None,
+                          uploader: Callable[[object], object] = None,
+                          sizer: Callable[[object], int] = None) -> None:
+    """Register functions for loading and cleaning up a type of resource.
+
+    Loading can optionally be split in two for load_async(). The decoder
+    does the CPU-side work (reading and parsing files) and is run on a
+    worker thread, so it must not touch GL. The uploader turns the decoded
+    data into the resource (e.g. creating GL objects) and is run on the main
+    thread. If there's no uploader the decoded data is the resource. If
+    there's no decoder the loader is run on the main thread instead.
+
+    Args:
+        resource_type (str): The name of the resource type.
+        loader (Callable): Loads a resource synchronously from a path.
+        cleaner_upper (Callable): Frees a loaded resource.
+        decoder (Callable): Called with the path and load args.
+        uploader (Callable): Called with the decoded data and load args.
+        sizer (Callable): Estimates how many bytes a loaded resource uses,
+            for the memory budget.
+    """
     if resource_type in _resource_handlers:
         raise ValueError(
             f"Resource type handler '{resource_type}' already exists!")
 
+    if uploader is not None and decoder is None:
+        raise ValueError(
+            f"Resource type handler '{resource_type}' has an uploader but "
+            "no decoder")
+
     _resource_handlers[resource_type] = loader
     _resource_cleaner_uppers[resource_type] = cleaner_upper
+    _resource_decoders[resource_type] = decoder
+    _resource_uploaders[resource_type] = uploader
+    _resource_sizers[resource_type] = sizer
 
 
 def clear_lifespan(lifespan: str) -> None:
+    """Free every resource with the given lifespan, referenced or not."""
     if lifespan == "":
         raise ValueError("Unable to delete default resource lifespan")
 
-    for k, r in _resource_cache.items():
-        if r.lifespan == lifespan:
-            _cleanup_resource(_resource_cache[k])
-            del _resource_cache[k]
+    for key in _lifespans.pop(lifespan, set()):
+        _remove_entry(_resource_cache[key])
 
 
 def load(resource_type: str,
@@ -38,38 +152,357 @@ def load(resource_type: str,
          lifespan: str = "",
          *args,
          **kwargs) -> object:
+    """Load a resource, or get it from the cache if it's already loaded.
+
+    Resources are cached by type, path and load arguments. Every call
+    acquires a reference to the resource which can be given back with
+    release().
+    """
     if resource_type not in _resource_handlers:
         raise ValueError(
             f"No resource handler found for type '{resource_type}'")
 
+    _record(resource_type, path, lifespan, args, kwargs)
     path = os_path.join(_DATA_PATH, path)
+    key = _make_key(resource_type, path, args, kwargs)
 
-    cached_resource = _check_cache(path)
-    if cached_resource is not None:
-        return cached_resource.value
+    entry = _acquire(key)
+    if entry is not None:
+        return entry.loaded
 
     loaded_resource = _resource_handlers[resource_type](path, *args, **kwargs)
-    _resource_cache[path] = resource(loaded=loaded_resource,
-                                     lifespan=lifespan,
-                                     type=resource_type)
+    _add_entry(key, loaded_resource, lifespan, resource_type, refcount=1)
     return loaded_resource
 
 
+def load_async(resource_type: str,
+               path: str,
+               lifespan: str = "",
+               *args,
+               **kwargs) -> Future:
+    """Load a resource in the background.
+
+    Decoding happens on a worker thread, then the rest of the load is queued
+    to run on the main thread in process_uploads(). Loading something that's
+    already being loaded returns the same future. Like load(), every call
+    acquires a reference.
+
+    Returns:
+        Future: Resolves to the loaded resource, on the main thread.
+    """
+    if resource_type not in _resource_handlers:
+        raise ValueError(
+            f"No resource handler found for type '{resource_type}'")
+
+    _record(resource_type, path, lifespan, args, kwargs)
+    path = os_path.join(_DATA_PATH, path)
+    key = _make_key(resource_type, path, args, kwargs)
+
+    entry = _acquire(key)
+    if entry is not None:
+        future = Future()
+        future.set_result(entry.loaded)
+        return future
+
+    if key in _pending_loads:
+        pending = _pending_loads[key]
+        pending.requests += 1
+        return pending.future
+
+    future = Future()
+    future.set_running_or_notify_cancel()
+    _pending_loads[key] = _PendingLoad(future, lifespan)
+
+    decoder = _resource_decoders[resource_type]
+    if decoder is None:
+        # nothing can be done off the main thread, so do it all there
+        _upload_queue.append(
+            partial(_finish_load, key,
+                    partial(_resource_handlers[resource_type], path, *args,
+                            **kwargs)))
+    else:
+        _get_executor().submit(_decode, key, path, args, kwargs)
+    return future
+
+
+def release(loaded_resource: object) -> None:
+    """Give back a reference acquired with load() or load_async().
+
+    Resources with no references left stay cached, but can be evicted if
+    the cache is over its memory budget.
+    """
+    key = _resource_keys.get(id(loaded_resource))
+    if key is None:
+        raise ValueError(f"Resource {loaded_resource} is not cached")
+
+    entry = _resource_cache[key]
+    if entry.refcount == 0:
+        raise ValueError(f"Resource {loaded_resource} has no references")
+    entry.refcount -= 1
+    if entry.refcount == 0:
+        _evict()
+
+
+def set_memory_budget(budget: int) -> None:
+    """Set how many bytes the cache can hold before evicting resources.
+
+    Only resources without any references are evicted, least recently used
+    first. None means there's no limit.
+    """
+    global _memory_budget
+    _memory_budget = budget
+    _evict()
+
+
+def cache_stats() -> Mapping[str, object]:
+    return {
+        "entries": len(_resource_cache),
+        "referenced": sum(entry.refcount > 0
+                          for entry in _resource_cache.values()),
+        "bytes": _cache_size,
+        "budget": _memory_budget,
+        "pending": len(_pending_loads)
+    }
+
+
+def preload(manifest: Sequence[ManifestEntry]) -> Preload:
+    """Start loading everything in a manifest in the background."""
+    return Preload(
+        load_async(entry.type, entry.path, entry.lifespan, *entry.args,
+                   **entry.kwargs) for entry in manifest)
+
+
+@contextmanager
+def record() -> ContextManager[List[ManifestEntry]]:
+    """Record every resource loaded within the block into a manifest."""
+    recorded = []
+    _recordings.append(recorded)
+    try:
+        yield recorded
+    finally:
+        _recordings.remove(recorded)
+
+
+def write_manifest(file_path: str, manifest: Sequence[ManifestEntry]) -> None:
+    with open(file_path, "w") as manifest_file:
+        yaml.safe_dump([asdict(entry) for entry in manifest], manifest_file)
+
+
+def read_manifest(file_path: str) -> List[ManifestEntry]:
+    with open(file_path, "r") as manifest_file:
+        return [
+            ManifestEntry(**entry)
+            for entry in yaml.safe_load(manifest_file) or []
+        ]
+
+
+def process_uploads(budget: float = DEFAULT_UPLOAD_BUDGET) -> int:
+    """Finish queued async loads on the main thread.
+
+    At least one queued load is always finished, so loading makes progress
+    even if a single upload is more expensive than the budget.
+
+    Args:
+        budget (float): Roughly how long to spend, in seconds.
+
+    Returns:
+        int: How many loads were finished.
+    """
+    processed = 0
+    deadline = time.perf_counter() + budget
+    while _upload_queue:
+        _upload_queue.popleft()()
+        processed += 1
+        if time.perf_counter() >= deadline:
+            break
+    return processed
+
+
+def pending_count() -> int:
+    return len(_pending_loads)
+
+
 def cleanup() -> None:
-    for res in _resource_cache.values():
-        _cleanup_resource(res)
+    global _executor, _cache_size
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    _upload_queue.clear()
+    # anything still waiting on a load would otherwise wait forever
+    for pending in _pending_loads.values():
+        pending.future.set_exception(
+            CancelledError("Resources were cleaned up before it loaded"))
+    _pending_loads.clear()
 
+    for entry in _resource_cache.values():
+        _cleanup_resource(entry)
+    _resource_cache.clear()
+    _lifespans.clear()
+    _resource_keys.clear()
+    _cache_size = 0
+
+
+def _make_key(resource_type: str, path: str, args: tuple,
+              kwargs: dict) -> Tuple:
+    return (resource_type, os_path.normpath(path), _freeze(args),
+            _freeze(kwargs))
+
+
+def _freeze(value: object) -> Hashable:
+    # turn load arguments into something hashable, where the order of
+    # kwargs doesn't matter
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, set):
+        return frozenset(_freeze(v) for v in value)
+    try:
+        hash(value)
+    except TypeError:
+        return (type(value).__name__, id(value))
+    return value
+
+
+def _acquire(key: Tuple) -> _CacheEntry:
+    entry = _resource_cache.get(key, None)
+    if entry is not None:
+        entry.refcount += 1
+        _resource_cache.move_to_end(key)
+    return entry
+
+
+def _add_entry(key: Tuple, loaded_resource: object, lifespan: str,
+               resource_type: str, refcount: int) -> None:
+    global _cache_size
+    sizer = _resource_sizers[resource_type]
+    size = sizer(loaded_resource) if sizer is not None else 0
+    _resource_cache[key] = _CacheEntry(key, loaded_resource, lifespan,
+                                       resource_type, size, refcount)
+    _lifespans.setdefault(lifespan, set()).add(key)
+    _resource_keys[id(loaded_resource)] = key
+    _cache_size += size
+    _evict()
 
-def _cleanup_resource(resource: resource) -> None:
-    cleaner_upper = _resource_cleaner_uppers[resource.type]
-    if cleaner_upper is not None:
-        cleaner_upper(resource.loaded)
 
+def _remove_entry(entry: _CacheEntry) -> None:
+    global _cache_size
+    del _resource_cache[entry.key]
+    if _resource_keys.get(id(entry.loaded)) == entry.key:
+        del _resource_keys[id(entry.loaded)]
+    lifespan_keys = _lifespans.get(entry.lifespan)
+    if lifespan_keys is not None:
+        lifespan_keys.discard(entry.key)
+    _cache_size -= entry.size
+    _cleanup_resource(entry)
 
-def _check_cache(path: str) -> resource:
-    return _resource_cache.get(path, None)
+
+def _evict() -> None:
+    if _memory_budget is None or _cache_size <= _memory_budget:
+        return
+
+    for entry in list(_resource_cache.values()):
+        if _cache_size <= _memory_budget:
+            break
+        if entry.refcount == 0:
+            _remove_entry(entry)
+
+
+def _record(resource_type: str, path: str, lifespan: str, args: tuple,
+            kwargs: dict) -> None:
+    if not _recordings:
+        return
+    if not _is_yaml_safe(list(args)) or not _is_yaml_safe(dict(kwargs)):
+        logging.warning(
+            f"Not recording {resource_type} '{path}' in the manifest, its "
+            f"load arguments can't be written to YAML")
+        return
+    entry = ManifestEntry(resource_type, path, lifespan, list(args),
+                          dict(kwargs))
+    for recorded in _recordings:
+        if entry not in recorded:
+            recorded.append(entry)
+
+
+def _is_yaml_safe(value: object) -> bool:
+    if type(value) in _YAML_SCALARS:
+        return True
+    if type(value) is list:
+        return all(_is_yaml_safe(item) for item in value)
+    if type(value) is dict:
+        return all(
+            type(key) is str and _is_yaml_safe(item)
+            for key, item in value.items())
+    return False
+
+
+def _decode(key: Tuple, path: str, args: tuple, kwargs: dict) -> None:
+    # runs on a worker thread
+    resource_type = key[0]
+    try:
+        decoded = _resource_decoders[resource_type](path, *args, **kwargs)
+    except Exception as err:
+        _upload_queue.append(partial(_fail_load, key, err))
+        return
+
+    uploader = _resource_uploaders[resource_type]
+    if uploader is None:
+        make = partial(_passthrough, decoded)
+    else:
+        make = partial(uploader, decoded, *args, **kwargs)
+    _upload_queue.append(partial(_finish_load, key, make))
+
+
+def _finish_load(key: Tuple, make: Callable[[], object]) -> None:
+    try:
+        loaded_resource = make()
+    except Exception as err:
+        _fail_load(key, err)
+        return
+
+    pending = _pending_loads.pop(key)
+    resource_type = key[0]
+    entry = _resource_cache.get(key, None)
+    if entry is not None:
+        # it was loaded synchronously while we were decoding, keep that one
+        _cleanup_resource(
+            _CacheEntry(key, loaded_resource, pending.lifespan,
+                        resource_type))
+        entry.refcount += pending.requests
+        loaded_resource = entry.loaded
+    else:
+        _add_entry(key,
+                   loaded_resource,
+                   pending.lifespan,
+                   resource_type,
+                   refcount=pending.requests)
+
+    pending.future.set_result(loaded_resource)
+
+
+def _passthrough(decoded: object) -> object:
+    return decoded
+
+
+def _fail_load(key: Tuple, err: Exception) -> None:
+    pending = _pending_loads.pop(key)
+    pending.future.set_exception(err)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_DECODE_WORKERS,
+                                       thread_name_prefix="resource_decode")
+    return _executor
+
+
+def _cleanup_resource(entry: _CacheEntry) -> None:
+    cleaner_upper = _resource_cleaner_uppers[entry.type]
+    if cleaner_upper is not None:
+        cleaner_upper(entry.loaded)
 
 
 def _register_data_path(data_path: str) -> None:
     global _DATA_PATH
-    _DATA_PATH = data_path
\ No newline at end of file
+    _DATA_PATH = data_path
@@ -1,12 +1,16 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
-from typing import List
+import logging
+from typing import List, Sequence
 
 from methodtools import lru_cache
 import glm
 
 from .graphics.camera import Camera
 from .graphics.window import Window
+from . import profiler
+from . import resources
+from .resources import ManifestEntry
 
 
 class Scene(ABC):
@@ -14,11 +18,18 @@ class Scene(ABC):
                  window: Window,
                  name: str,
                  order: int = 0,
-                 active: bool = False) -> None:
+                 active: bool = False,
+                 manifest: Sequence[ManifestEntry] = None) -> None:
         self.name = name
         self.active = active
         self.order = order
         self.window = window
+        self.manifest = list(manifest) if manifest is not None else []
+        # what the scene loaded during init(), use it to generate a manifest
+        self.recorded_manifest: List[ManifestEntry] = []
+        # profiler zone names, built once rather than every frame
+        self._update_zone = f"{name}.update"
+        self._render_zone = f"{name}.render"
 
     def _set_active(self, state: bool) -> None:
         self.active = state
@@ -41,21 +52,52 @@ class Scene(ABC):
 class SceneManager:
     def __init__(self) -> None:
         self.scenes = {}
-
-    def add_scene(self, scene: Scene) -> Scene:
+        self._preloads = {}
+        self._activate_when_ready = {}
+
+    def add_scene(self, scene: Scene, preload: bool = False) -> Scene:
+        """Start managing a scene.
+
+        Args:
+            scene (Scene): The scene to add.
+            preload (bool): If True, the resources in the scene's manifest
+                are loaded in the background, and init() is called once
+                they're all loaded. Until then the scene can't be activated,
+                activating it will be deferred until it's ready.
+        """
         if scene.name in self.scenes:
             raise ValueError(
                 f"Scene with name '{scene.name}' already managed!")
         self.scenes[scene.name] = scene
-        scene.init()
+        if preload:
+            self._preloads[scene.name] = resources.preload(scene.manifest)
+            self._activate_when_ready[scene.name] = scene.active
+            scene.active = False
+        else:
+            self._init_scene(scene)
         self._active_scenes.cache_clear()
+        return scene
+
+    def is_ready(self, name: str) -> bool:
+        return name not in self._preloads
+
+    def loading_progress(self, name: str) -> float:
+        """Get how much of a scene's manifest has loaded, from 0 to 1."""
+        if name not in self._preloads:
+            return 1.0
+        return self._preloads[name].progress()
 
     def deactivate_all(self) -> None:
         self._active_scenes.cache_clear()
+        for name in self._activate_when_ready:
+            self._activate_when_ready[name] = False
         for scene in self.scenes.values():
             scene._set_active(False)
 
     def set_scene_active(self, name: str, state: bool) -> None:
+        if name in self._preloads:
+            self._activate_when_ready[name] = state
+            return
         self._active_scenes.cache_clear()
         self.scenes[name]._set_active(state)
 
@@ -64,12 +106,36 @@ class SceneManager:
             scene.init(*args, **kwargs)
 
     def update(self, delta_time: float, *args, **kwargs) -> None:
+        if self._preloads:
+            self._check_preloads()
         for scene in self._active_scenes():
-            scene.update(delta_time, *args, **kwargs)
+            with profiler.zone(scene._update_zone):
+                scene.update(delta_time, *args, **kwargs)
 
     def render(self, *args, **kwargs) -> None:
         for scene in self._active_scenes():
-            scene.render(*args, **kwargs)
+            with profiler.zone(scene._render_zone):
+                scene.render(*args, **kwargs)
+
+    def _init_scene(self, scene: Scene) -> None:
+        with resources.record() as recorded:
+            scene.init()
+        scene.recorded_manifest = recorded
+
+    def _check_preloads(self) -> None:
+        for name, preload in list(self._preloads.items()):
+            if not preload.ready():
+                continue
+
+            for err in preload.errors():
+                logging.error(f"Error preloading scene '{name}': {err}")
+
+            del self._preloads[name]
+            self._init_scene(self.scenes[name])
+            # the scene has acquired what it needs now during init
+            preload.release()
+            if self._activate_when_ready.pop(name):
+                self.set_scene_active(name, True)
 
     @lru_cache(maxsize=1)
     def _active_scenes(self) -> List[Scene]:
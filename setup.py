@@ -25,7 +25,7 @@ setup(
     long_description_content_type="text/markdown",
     url="https://github.com/Figglewatts/rosmarus",
     author="Figglewatts",
-    packages=find_packages(exclude=["tests"]),
+    packages=find_packages(exclude=["tests", "benchmarks"]),
     python_requires=">=3.7",
     install_requires=[],  # TODO
 )
\ No newline at end of file
@@ -0,0 +1,37 @@
+import struct
+
+from rosmarus import audio
+
+
+def _write_wav(file_path, samples=100):
+    data = b"\0\0" * samples
+    fmt = struct.pack("<HHIIHH", 1, 1, 22050, 44100, 2, 16)
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt + \
+        b"data" + struct.pack("<I", len(data)) + data
+    with open(file_path, "wb") as wav_file:
+        wav_file.write(b"RIFF" + struct.pack("<I", len(body)) + body)
+
+
+def test_null_audio_runs_without_openal(tmp_path):
+    file_path = str(tmp_path / "clip.wav")
+    _write_wav(file_path)
+
+    audio.init(null=True)
+    try:
+        assert audio.al is None
+        clip = audio.AudioClip(file_path)
+        assert clip.length_seconds() == 100 / 22050
+        assert audio.play(clip) is None
+
+        source = audio.AudioSource()
+        source.play(clip)
+        source.stop()
+
+        emitter = audio.AudioEmitter(clip)
+        emitter.play()
+        audio.update()
+        assert emitter.virtual
+        emitter.cleanup()
+        clip.cleanup()
+    finally:
+        audio.cleanup()
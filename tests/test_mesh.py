@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from rosmarus.graphics.mesh import _as_index_array, _as_vertex_array
+from rosmarus.graphics.vertex import VERTEX_DTYPE
+
+
+def test_float64_vertices_are_converted():
+    data = np.arange(26, dtype=np.float64).reshape(2, 13)
+    vertices = _as_vertex_array(data)
+    assert vertices.dtype == VERTEX_DTYPE
+    assert len(vertices) == 2
+    assert list(vertices[1]["position"]) == [13, 14, 15, 16]
+
+
+def test_float32_vertices_are_not_copied():
+    data = np.zeros((3, 13), dtype=np.float32)
+    assert np.shares_memory(_as_vertex_array(data), data)
+
+
+@pytest.mark.parametrize("data", [
+    np.zeros((4, 12)),
+    np.zeros(14, dtype=np.float32),
+    bytes(10),
+    np.zeros(2, dtype=[("position", np.float32)]),
+])
+def test_mismatched_vertices_raise(data):
+    with pytest.raises(ValueError):
+        _as_vertex_array(data)
+
+
+def test_indices_are_narrowed():
+    indices = _as_index_array([0, 1, 2, 2, 3, 0], 4)
+    assert indices.dtype == np.uint16
+    assert list(indices) == [0, 1, 2, 2, 3, 0]
+
+
+@pytest.mark.parametrize("indices", [
+    [0, 1, 4],
+    [0, -1, 2],
+    np.array([0, 65536, 1], dtype=np.uint32),
+])
+def test_out_of_range_indices_raise(indices):
+    with pytest.raises(ValueError):
+        _as_index_array(indices, 4)
@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+import glm
+
+from rosmarus.graphics.camera import Camera
+from rosmarus.math.transform import Transform, Transform2D
+from rosmarus.render.render_queue import RenderQueue
+from rosmarus.render.renderable import Renderable
+
+# sorting only looks at the handles, so no GL objects are needed
+_SHADER = SimpleNamespace(get_handle=lambda: 1)
+_MESH = SimpleNamespace(vao=1)
+
+
+def _renderable(transform) -> Renderable:
+    return Renderable(_MESH, _SHADER, None, transform)
+
+
+def _camera() -> Camera:
+    camera = Camera(glm.ortho(0, 640, 0, 480, 0.01, 100))
+    camera.transform.set_position(glm.vec3(0, 0, 10))
+    return camera
+
+
+def test_transform2d_renderable_is_sorted():
+    near = Transform()
+    near.set_position(glm.vec3(0, 0, 5))
+    sprite = Transform2D()
+    sprite.set_position(glm.vec2(32, 32))
+
+    queue = RenderQueue(_camera())
+    queue.submit(_renderable(sprite))
+    queue.submit(_renderable(near))
+    items = list(queue._items)
+    queue._compute_keys(items)
+
+    assert [item.depth for item in items] == [10, 5]
+    # opaque items are drawn front-to-back
+    items.sort(key=lambda item: item.key)
+    assert items[0].renderable.transform is near
+
+
+def test_parented_transform2d_renderable_is_sorted():
+    parent = Transform2D()
+    parent.set_position(glm.vec2(100, 0))
+    child = Transform2D()
+    child.set_parent(parent)
+    child.set_position(glm.vec2(0, 50))
+
+    queue = RenderQueue(_camera())
+    queue.submit(_renderable(child))
+    items = list(queue._items)
+    queue._compute_keys(items)
+
+    assert items[0].depth == 10
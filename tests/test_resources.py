@@ -0,0 +1,25 @@
+from types import SimpleNamespace
+
+from rosmarus import resources
+
+
+def _load(path: str, **kwargs) -> object:
+    return SimpleNamespace(path=path, kwargs=kwargs)
+
+
+resources.register_type_handler("test", _load)
+
+
+def test_unserialisable_kwargs_are_not_recorded(tmp_path, caplog):
+    with resources.record() as recorded:
+        plain = resources.load("test", "plain", scale=2, tags=["a", "b"])
+        odd = resources.load("test", "odd", scale=SimpleNamespace())
+    resources.release(plain)
+    resources.release(odd)
+
+    assert [entry.path for entry in recorded] == ["plain"]
+    assert "odd" in caplog.text
+
+    manifest_path = str(tmp_path / "manifest.yaml")
+    resources.write_manifest(manifest_path, recorded)
+    assert resources.read_manifest(manifest_path) == recorded
@@ -0,0 +1,152 @@
+from types import SimpleNamespace
+
+import glm
+import numpy as np
+import pytest
+
+from rosmarus.graphics.color import Color
+from rosmarus.graphics.vertex import VERTEX_DTYPE
+from rosmarus.math.transform import Transform
+from rosmarus.render import static_batch
+from rosmarus.render.renderable import Renderable
+from rosmarus.render.static_batch import StaticBatch, _Member
+
+# batching only checks these are the same objects, so no GL objects are needed
+_SHADER = SimpleNamespace()
+_TEXTURE = SimpleNamespace()
+
+
+class _FakeMesh:
+    """Holds data like Mesh does, without uploading it anywhere."""
+    def __init__(self, vertices, indices) -> None:
+        self.vertices = vertices
+        self.indices = np.array(indices)
+
+    def get_data(self):
+        return self.vertices, self.indices
+
+    def reupload_data(self, vertex_count=None, index_count=None) -> None:
+        pass
+
+    def reupload_vertices(self, start: int, count: int) -> None:
+        pass
+
+    def cleanup(self) -> None:
+        pass
+
+
+@pytest.fixture(autouse=True)
+def _fake_mesh(monkeypatch):
+    monkeypatch.setattr(static_batch, "Mesh", _FakeMesh)
+
+
+def _triangle() -> np.ndarray:
+    vertices = np.zeros(3, dtype=VERTEX_DTYPE)
+    vertices["position"] = [(0, 0, 0, 1), (1, 0, 0, 1), (0, 1, 0, 1)]
+    vertices["normal"] = (0, 0, 1)
+    vertices["color"] = (1, 1, 1, 1)
+    return vertices
+
+
+def _renderable(transform: Transform = None) -> Renderable:
+    if transform is None:
+        transform = Transform()
+    return Renderable(_FakeMesh(_triangle(), [0, 1, 2]), _SHADER, _TEXTURE,
+                      transform)
+
+
+def test_empty_batch_updates_and_draws_nothing():
+    batch = StaticBatch(None, None)
+    assert batch.update() == 0
+    batch.draw(None)
+    assert batch.renderable is None
+
+
+def test_bake_transforms_and_tints_member():
+    transform = Transform()
+    transform.set_position(glm.vec3(10, 20, 30))
+    transform.set_scale(glm.vec3(2, 4, 1))
+    renderable = _renderable(transform)
+    renderable.set_tint(Color(0.5, 1, 0.25, 1))
+    source = _triangle()
+    source["normal"] = [(1, 1, 0), (1, 0, 0), (0, 0, 1)]
+    target = np.empty_like(source)
+
+    StaticBatch(_SHADER, _TEXTURE)._bake_member(_Member(renderable), target,
+                                                source)
+
+    np.testing.assert_allclose(
+        target["position"],
+        [(10, 20, 30, 1), (12, 20, 30, 1), (10, 24, 30, 1)])
+    # normals use the inverse transpose, so non-uniform scale keeps them
+    # perpendicular to the surface, and they're renormalised
+    np.testing.assert_allclose(target["normal"][0],
+                               np.array([2, 1, 0]) / np.sqrt(5), rtol=1e-6)
+    np.testing.assert_allclose(target["normal"][1:], [(1, 0, 0), (0, 0, 1)])
+    np.testing.assert_allclose(target["color"], [(0.5, 1, 0.25, 1)] * 3)
+
+
+def test_bake_zero_scale_member():
+    transform = Transform()
+    transform.set_scale(glm.vec3(1, 1, 0))
+    source = _triangle()
+    target = np.empty_like(source)
+
+    StaticBatch(_SHADER, _TEXTURE)._bake_member(
+        _Member(_renderable(transform)), target, source)
+
+    assert np.all(target["position"][:, 2] == 0)
+    assert np.all(np.isfinite(target["normal"]))
+
+
+def test_draw_ranges_and_compaction():
+    batch = StaticBatch(_SHADER, _TEXTURE)
+    members = [batch.add(_renderable()) for _ in range(3)]
+    batch.update()
+
+    assert [batch.get_draw_range(m) for m in members] == [(0, 3), (3, 3),
+                                                          (6, 3)]
+    assert batch.element_count == 9
+    assert list(batch.renderable.mesh.indices) == list(range(9))
+
+    batch.get_renderable(members[1]).set_active(False)
+    assert batch.update() == 0
+    assert batch.element_count == 6
+    assert list(batch.renderable.mesh.indices[:6]) == [0, 1, 2, 6, 7, 8]
+    # draw ranges are for the merged mesh, so hiding doesn't change them
+    assert batch.get_draw_range(members[2]) == (6, 3)
+
+    batch.get_renderable(members[1]).set_active(True)
+    batch.update()
+    assert batch.element_count == 9
+    assert list(batch.renderable.mesh.indices) == list(range(9))
+
+
+def test_added_member_is_merged_after_the_others():
+    batch = StaticBatch(_SHADER, _TEXTURE)
+    batch.add(_renderable())
+    batch.update()
+    batch.get_renderable(0).set_active(False)
+    moved = Transform()
+    moved.set_position(glm.vec3(5, 0, 0))
+    member = batch.add(_renderable(moved))
+
+    assert batch.update() == 2
+    assert batch.get_draw_range(member) == (3, 3)
+    assert batch.element_count == 3
+    assert list(batch.renderable.mesh.indices[:3]) == [3, 4, 5]
+    vertices, _ = batch.renderable.mesh.get_data()
+    np.testing.assert_allclose(vertices["position"][3], (5, 0, 0, 1))
+
+
+def test_moved_member_is_rebaked():
+    batch = StaticBatch(_SHADER, _TEXTURE)
+    batch.add(_renderable())
+    batch.add(_renderable(Transform()))
+    batch.update()
+
+    batch.get_renderable(1).transform.set_position(glm.vec3(0, 3, 0))
+    assert batch.update() == 1
+    vertices, _ = batch.renderable.mesh.get_data()
+    np.testing.assert_allclose(vertices["position"][3], (0, 3, 0, 1))
+    np.testing.assert_allclose(vertices["position"][0], (0, 0, 0, 1))
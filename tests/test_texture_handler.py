@@ -0,0 +1,43 @@
+import os
+
+from PIL import Image
+
+from rosmarus.io import texture_handler
+
+
+def _bake(tmp_path, mipmaps=True):
+    file_path = str(tmp_path / "image.png")
+    Image.new("RGBA", (8, 4), (255, 0, 0, 255)).save(file_path)
+    texture_handler._write_baked(
+        file_path, texture_handler._decode_image(file_path, mipmaps))
+    return file_path
+
+
+def test_touched_source_is_only_hashed_once(tmp_path, monkeypatch):
+    file_path = _bake(tmp_path)
+    stat = os.stat(file_path)
+    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    hashes = []
+    digest = texture_handler._source_digest
+    monkeypatch.setattr(texture_handler, "_source_digest",
+                        lambda path: hashes.append(path) or digest(path))
+    assert texture_handler._bake_is_valid(file_path)
+    assert texture_handler._bake_is_valid(file_path)
+    assert len(hashes) == 1
+
+
+def test_truncated_bake_is_a_miss(tmp_path):
+    file_path = _bake(tmp_path)
+    bake_path = texture_handler._bake_path(file_path)
+    with open(bake_path, "r+b") as baked_file:
+        baked_file.truncate(os.path.getsize(bake_path) - 4)
+    assert texture_handler._read_baked(file_path) is None
+
+
+def test_bake_round_trips(tmp_path):
+    file_path = _bake(tmp_path)
+    decoded = texture_handler._read_baked(file_path)
+    assert (decoded.width, decoded.height) == (8, 4)
+    assert len(decoded.mip_levels) == 3
+    assert bytes(decoded.data[:4]) == b"\xff\x00\x00\xff"
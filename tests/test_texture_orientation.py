@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+import glm
+from PIL import Image
+
+from rosmarus.graphics.camera import Camera
+from rosmarus.io import texture_handler
+from rosmarus.render.render_queue import RenderQueue
+from rosmarus.render.renderable import Renderable, FLIP_V_UNIFORM
+
+
+class _RecordingShader:
+    """Records uniforms instead of uploading them."""
+    def __init__(self) -> None:
+        self.uniforms = {}
+        self.variants = {}
+
+    def get_handle(self) -> int:
+        return 1
+
+    def bind(self) -> None:
+        pass
+
+    def has_uniform_block(self, name: str) -> bool:
+        return False
+
+    def __getattr__(self, name: str):
+        if not name.startswith("set_"):
+            raise AttributeError(name)
+        return lambda uniform, value: self.uniforms.__setitem__(
+            uniform, value)
+
+
+def _mesh(vao: int) -> SimpleNamespace:
+    return SimpleNamespace(vao=vao,
+                           bind=lambda: None,
+                           render=lambda elements=-1: None)
+
+
+def _texture(handle: int, top_down: bool) -> SimpleNamespace:
+    return SimpleNamespace(top_down=top_down,
+                           get_handle=lambda: handle,
+                           bind=lambda: None)
+
+
+def _camera() -> Camera:
+    return Camera(glm.ortho(0, 640, 0, 480, 0.01, 100))
+
+
+def test_decoded_rows_are_top_down(tmp_path):
+    file_path = str(tmp_path / "image.png")
+    image = Image.new("RGBA", (1, 2), (0, 0, 255, 255))
+    image.putpixel((0, 0), (255, 0, 0, 255))
+    image.save(file_path)
+
+    decoded = texture_handler.decode_texture(file_path)
+    # the top row comes first, which is why textures need FlipV
+    assert bytes(decoded.data[:4]) == b"\xff\x00\x00\xff"
+
+
+def test_renderable_flips_v_for_top_down_textures():
+    shader = _RecordingShader()
+    for top_down in (True, False):
+        renderable = Renderable(_mesh(1), shader, _texture(1, top_down))
+        renderable.draw(_camera())
+        assert shader.uniforms[FLIP_V_UNIFORM] is top_down
+
+
+def test_render_queue_flips_v_per_texture():
+    shader = _RecordingShader()
+    flips = []
+    set_bool = shader.__getattr__("set_bool")
+    shader.set_bool = lambda name, value: (flips.append(value),
+                                           set_bool(name, value))
+
+    queue = RenderQueue(_camera())
+    queue.submit(Renderable(_mesh(1), shader, _texture(1, True)))
+    queue.submit(Renderable(_mesh(2), shader, _texture(2, False)))
+    queue.execute()
+    assert sorted(flips) == [False, True]